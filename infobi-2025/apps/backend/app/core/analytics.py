@@ -0,0 +1,176 @@
+"""
+Ri-analisi dei risultati in cache con DuckDB (in-process, direttamente su Arrow)
+Filtri, raggruppamenti e ordinamenti successivi non toccano il server sorgente
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+import pyarrow as pa
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from app.core.config import settings
+from app.core.database import PUSHDOWN_OPERATORS
+
+# Nome con cui il risultato del report è visibile nelle query
+RESULT_TABLE = "result"
+
+# Aggregazioni ammesse nello spec strutturato
+SPEC_AGGREGATIONS = {
+    "sum": "SUM({})",
+    "count": "COUNT({})",
+    "count_distinct": "COUNT(DISTINCT {})",
+    "avg": "AVG({})",
+    "min": "MIN({})",
+    "max": "MAX({})",
+}
+
+# Nodi vietati: solo lettura
+_FORBIDDEN_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Create, exp.Drop, exp.Alter,
+    exp.Command, exp.Set, exp.Pragma, exp.Copy, exp.Merge,
+)
+
+
+def quote_identifier(name: str) -> str:
+    """Identificatore DuckDB quotato"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def validate_select(sql: str) -> str:
+    """
+    Verifica che l'SQL sia una singola SELECT sulla tabella 'result' (o su CTE)
+
+    Raises:
+        ValueError: SQL non valido o non ammesso
+    """
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="duckdb") if s is not None]
+    except SqlglotError as e:
+        raise ValueError(f"SQL non valido: {e}")
+
+    if len(statements) != 1:
+        raise ValueError("È ammessa una sola istruzione SELECT")
+
+    tree = statements[0]
+    if not isinstance(tree, exp.Query) or tree.find(*_FORBIDDEN_NODES):
+        raise ValueError("Sono ammesse solo query SELECT")
+
+    cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    for table in tree.find_all(exp.Table):
+        name = table.name.lower()
+        if not name or table.args.get("db") or (name != RESULT_TABLE and name not in cte_names):
+            raise ValueError(f"Tabella non ammessa: {table.sql()} (usare '{RESULT_TABLE}')")
+
+    return sql
+
+
+def build_spec_sql(spec: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """
+    Traduce uno spec strutturato in SQL parametrizzato
+
+    spec = {
+        "columns": [...],
+        "filters": [{"column", "op", "value"}],
+        "group_by": [...],
+        "aggregations": {"Venduto": "sum", ...},
+        "order_by": [{"column", "direction"}],
+        "limit": 100
+    }
+    """
+    params: List[Any] = []
+    group_by = spec.get("group_by") or []
+    aggregations = spec.get("aggregations") or {}
+
+    select_terms = []
+    if group_by or aggregations:
+        select_terms += [quote_identifier(c) for c in group_by]
+        for field, func in aggregations.items():
+            func = str(func).lower()
+            if func not in SPEC_AGGREGATIONS:
+                raise ValueError(f"Aggregazione non supportata: {func}")
+            select_terms.append(
+                f"{SPEC_AGGREGATIONS[func].format(quote_identifier(field))} AS {quote_identifier(field)}"
+            )
+    elif spec.get("columns"):
+        select_terms = [quote_identifier(c) for c in spec["columns"]]
+    else:
+        select_terms = ["*"]
+
+    conditions = []
+    for f in spec.get("filters") or []:
+        column = f.get("column")
+        op = str(f.get("op", "=")).lower().strip()
+        value = f.get("value")
+
+        if not column:
+            raise ValueError("Filtro senza colonna")
+        if op not in PUSHDOWN_OPERATORS:
+            raise ValueError(f"Operatore non supportato: {op}")
+
+        sql_op = PUSHDOWN_OPERATORS[op]
+        if op in ("is null", "is not null"):
+            conditions.append(f"{quote_identifier(column)} {sql_op}")
+        elif op in ("in", "not in"):
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"L'operatore '{op}' richiede una lista di valori")
+            conditions.append(f"{quote_identifier(column)} {sql_op} ({', '.join('?' for _ in value)})")
+            params.extend(value)
+        elif op == "between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise ValueError("L'operatore 'between' richiede due valori")
+            conditions.append(f"{quote_identifier(column)} BETWEEN ? AND ?")
+            params.extend(value)
+        else:
+            conditions.append(f"{quote_identifier(column)} {sql_op} ?")
+            params.append(value)
+
+    sql = f"SELECT {', '.join(select_terms)} FROM {RESULT_TABLE}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if group_by:
+        sql += " GROUP BY " + ", ".join(quote_identifier(c) for c in group_by)
+
+    order_terms = []
+    for o in spec.get("order_by") or []:
+        direction = str(o.get("direction", "asc")).lower()
+        if direction not in ("asc", "desc"):
+            raise ValueError(f"Direzione non valida: {direction}")
+        order_terms.append(f"{quote_identifier(o['column'])} {direction.upper()}")
+    if order_terms:
+        sql += " ORDER BY " + ", ".join(order_terms)
+
+    limit = spec.get("limit")
+    if limit is not None:
+        if not isinstance(limit, int) or limit < 0:
+            raise ValueError("Il limite deve essere un intero positivo")
+        sql += f" LIMIT {limit}"
+
+    return sql, params
+
+
+def run_analysis(table: pa.Table, sql: str, params: Optional[List[Any]] = None) -> pa.Table:
+    """
+    Esegue l'SQL su una connessione DuckDB isolata (sincrono: usare in un thread)
+    - Nessun accesso a file o rete (enable_external_access=false, configurazione bloccata)
+    - Decimal convertiti in float64 come nel resto della piattaforma
+    """
+    con = duckdb.connect(config={
+        "enable_external_access": False,
+        "threads": settings.ANALYTICS_THREADS,
+        "memory_limit": settings.ANALYTICS_MEMORY_LIMIT,
+    })
+    try:
+        con.execute("SET lock_configuration = true")
+        con.register(RESULT_TABLE, table)
+        cursor = con.execute(sql, params or [])
+        result = cursor.to_arrow_table() if hasattr(cursor, "to_arrow_table") else cursor.fetch_arrow_table()
+    finally:
+        con.close()
+
+    columns = [
+        column.cast(pa.float64()) if pa.types.is_decimal(column.type) else column
+        for column in result.columns
+    ]
+    return pa.Table.from_arrays(columns, names=result.column_names)
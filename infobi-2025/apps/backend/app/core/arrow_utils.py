@@ -2,14 +2,19 @@
 Modulo Apache Arrow per data transmission
 Conversione dati -> Arrow Table -> Bytes
 """
+import hashlib
+import io
 import pyarrow as pa
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Sequence
 from decimal import Decimal
 from datetime import datetime, date
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Compressioni ammesse per i buffer IPC (None = non compresso)
+IPC_COMPRESSIONS = (None, "lz4", "zstd")
+
 
 class ArrowConverter:
     """Conversione dati Python -> Apache Arrow"""
@@ -69,6 +74,142 @@ class ArrowConverter:
             logger.error(f"Errore conversione Arrow: {e}")
             raise
     
+    @staticmethod
+    def rows_to_record_batch(columns: List[str], rows: Sequence[Sequence[Any]]) -> pa.RecordBatch:
+        """
+        Converte un blocco di righe (tuple dal cursore) in un RecordBatch Arrow
+        Conversione per colonna invece che per cella:
+        - Decimal -> float64 con cast vettoriale
+        - DateTime -> stringa ISO (come sanitize_for_arrow)
+        - Colonne tutte NULL nel blocco -> null (unificabile con il tipo degli altri blocchi)
+        """
+        arrays = [
+            ArrowConverter._column_to_array([row[idx] for row in rows])
+            for idx in range(len(columns))
+        ]
+        return pa.RecordBatch.from_arrays(arrays, names=list(columns))
+
+    @staticmethod
+    def _column_to_array(values: List[Any]) -> pa.Array:
+        """Costruisce un array Arrow da una colonna di valori Python"""
+        sample = next((v for v in values if v is not None), None)
+
+        if sample is None:
+            return pa.nulls(len(values))
+
+        if isinstance(sample, (datetime, date)):
+            return pa.array([ArrowConverter._sanitize_value(v) for v in values], type=pa.string())
+
+        try:
+            array = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Tipi misti nella colonna: fallback a stringa valore per valore
+            array = pa.array(
+                [None if v is None else str(ArrowConverter._sanitize_value(v)) for v in values],
+                type=pa.string()
+            )
+
+        if pa.types.is_decimal(array.type):
+            array = array.cast(pa.float64())
+
+        return array
+
+    @staticmethod
+    def batches_to_table(batches: Iterable[pa.RecordBatch]) -> pa.Table:
+        """
+        Concatena i RecordBatch di uno stream in una Table
+        Se i tipi divergono tra blocchi (es. int/float) vengono unificati,
+        in ultima istanza a stringa
+        """
+        batches = list(batches)
+        if not batches:
+            return pa.table({})
+
+        schema = ArrowConverter.unify_batch_schemas(batches)
+
+        return pa.Table.from_batches(
+            [ArrowConverter.conform_batch(batch, schema) for batch in batches],
+            schema=schema
+        )
+
+    @staticmethod
+    def unify_batch_schemas(batches: Sequence[pa.RecordBatch], resolve_nulls: bool = True) -> pa.Schema:
+        """
+        Schema comune a più blocchi (unificazione per posizione)
+        resolve_nulls: colonne NULL in tutti i blocchi -> string (tipo stabile per i client)
+        """
+        fields = []
+        for idx, field in enumerate(batches[0].schema):
+            types = {batch.schema.field(idx).type for batch in batches}
+            unified = ArrowConverter._unify_types(field.type, types)
+            if resolve_nulls and pa.types.is_null(unified):
+                unified = pa.string()
+            fields.append(field.with_type(unified))
+        return pa.schema(fields)
+
+    @staticmethod
+    def concat_tables(tables: Sequence[pa.Table]) -> pa.Table:
+        """Unisce più Table con le stesse colonne (tipi unificati come in batches_to_table)"""
+        # Le tabelle vuote non partecipano all'unificazione dei tipi
+        batches = [batch for table in tables if table.num_rows for batch in table.to_batches()]
+        if not batches:
+            # Tutte vuote: conserva almeno lo schema
+            return tables[0] if tables else pa.table({})
+        if len(batches) > 1:
+            # Nemmeno le colonne tutte NULL di una Table (già risolte a string, es. partizione "is null")
+            batches = [ArrowConverter._nulls_untyped(batch) for batch in batches]
+        return ArrowConverter.batches_to_table(batches)
+
+    @staticmethod
+    def _nulls_untyped(batch: pa.RecordBatch) -> pa.RecordBatch:
+        """Colonne senza valori come tipo null"""
+        if not any(column.null_count == len(column) for column in batch.columns):
+            return batch
+        arrays = [
+            pa.nulls(len(column)) if column.null_count == len(column) else column
+            for column in batch.columns
+        ]
+        return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+    @staticmethod
+    def _unify_types(first_type: pa.DataType, types: set) -> pa.DataType:
+        """Tipo comune a più blocchi della stessa colonna"""
+        if len(types) == 1:
+            return first_type
+
+        try:
+            unified = pa.unify_schemas(
+                [pa.schema([("c", t)]) for t in types],
+                promote_options="permissive"
+            )
+            return unified.field("c").type
+        except (pa.ArrowInvalid, pa.ArrowTypeError, NotImplementedError):
+            return pa.string()
+
+    @staticmethod
+    def conform_batch(batch: pa.RecordBatch, schema: pa.Schema) -> pa.RecordBatch:
+        """Adegua un RecordBatch allo schema indicato (cast per posizione)"""
+        if batch.schema.equals(schema):
+            return batch
+
+        arrays = [
+            column if column.type == field.type else column.cast(field.type)
+            for column, field in zip(batch.columns, schema)
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    @staticmethod
+    def fingerprint(table: pa.Table) -> str:
+        """
+        Impronta (sha256) del contenuto di una Table
+        Calcolata sulla serializzazione IPC: stessi dati -> stessa impronta
+        """
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        return hashlib.sha256(memoryview(sink.getvalue())).hexdigest()
+
     @staticmethod
     def to_arrow_bytes(data: List[Dict[str, Any]]) -> bytes:
         """
@@ -76,10 +217,21 @@ class ArrowConverter:
         Formato ottimale per trasmissione network
         """
         table = ArrowConverter.to_arrow_table(data)
+        return ArrowConverter.table_to_arrow_bytes(table)
+
+    @staticmethod
+    def table_to_arrow_bytes(table: pa.Table, compression: Optional[str] = None) -> bytes:
+        """
+        Serializza una Table Arrow in formato IPC (bytes)
+        compression: None, "lz4" o "zstd" (buffer compressi, il client deve supportarli)
+        """
+        if compression not in IPC_COMPRESSIONS:
+            raise ValueError(f"Compressione IPC non supportata: {compression}")
+        options = pa.ipc.IpcWriteOptions(compression=compression)
         
         # Serializza in IPC Stream format
         sink = pa.BufferOutputStream()
-        with pa.ipc.new_stream(sink, table.schema) as writer:
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
             writer.write_table(table)
         
         buf = sink.getvalue()
@@ -107,6 +259,82 @@ class ArrowConverter:
         return table.schema
 
 
+class StreamSchema:
+    """
+    Schema unico per uno stream di blocchi inviati man mano (IPC, WebSocket)
+    Lo schema viene fissato una sola volta: i blocchi iniziali con colonne tutte NULL
+    (tipo null) vengono trattenuti finché ogni colonna ha un tipo, al massimo
+    max_pending blocchi; le colonne ancora senza tipo diventano string.
+    I blocchi successivi vengono adeguati allo schema fissato.
+    """
+
+    def __init__(self, max_pending: int = 16):
+        self.schema: Optional[pa.Schema] = None
+        self.max_pending = max_pending
+        self._pending: List[pa.RecordBatch] = []
+
+    def push(self, batch: pa.RecordBatch) -> List[pa.RecordBatch]:
+        """Blocchi pronti per l'invio (vuoto se lo schema non è ancora deciso)"""
+        if self.schema is not None:
+            return [ArrowConverter.conform_batch(batch, self.schema)]
+
+        self._pending.append(batch)
+        unified = ArrowConverter.unify_batch_schemas(self._pending, resolve_nulls=False)
+        if len(self._pending) < self.max_pending and any(pa.types.is_null(f.type) for f in unified):
+            return []
+        return self.flush()
+
+    def flush(self) -> List[pa.RecordBatch]:
+        """Fissa lo schema con i blocchi trattenuti (fine stream) e li restituisce"""
+        if self.schema is None and self._pending:
+            self.schema = ArrowConverter.unify_batch_schemas(self._pending)
+        pending, self._pending = self._pending, []
+        return [ArrowConverter.conform_batch(batch, self.schema) for batch in pending]
+
+
+class IpcStreamEncoder:
+    """
+    Serializzazione incrementale Arrow IPC (stream format)
+    Ogni RecordBatch diventa un chunk di bytes inviabile subito al client;
+    il primo chunk contiene anche lo schema (deciso da StreamSchema:
+    encode può restituire b"" finché lo schema non è fissato)
+    """
+
+    def __init__(self):
+        self._resolver = StreamSchema()
+        self._sink = io.BytesIO()
+        self._writer: Optional[pa.ipc.RecordBatchStreamWriter] = None
+
+    @property
+    def schema(self) -> Optional[pa.Schema]:
+        return self._resolver.schema
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def _write(self, batches: List[pa.RecordBatch]) -> bytes:
+        for batch in batches:
+            if self._writer is None:
+                self._writer = pa.ipc.new_stream(self._sink, self.schema)
+            self._writer.write_batch(batch)
+        return self._drain()
+
+    def encode(self, batch: pa.RecordBatch) -> bytes:
+        """Bytes IPC del blocco (adeguato allo schema dello stream)"""
+        return self._write(self._resolver.push(batch))
+
+    def finish(self) -> bytes:
+        """Blocchi trattenuti e marcatore di fine stream"""
+        data = self._write(self._resolver.flush())
+        if self._writer is None:
+            self._writer = pa.ipc.new_stream(self._sink, self.schema or pa.schema([]))
+        self._writer.close()
+        return data + self._drain()
+
+
 # --- Helper per FastAPI Response ---
 def create_arrow_response_headers() -> Dict[str, str]:
     """
@@ -0,0 +1,255 @@
+"""
+Rilevamento modifiche dei dati sorgente per la cache risultati
+Un "segnale" leggero (version_query del report o statistiche delle change_tables)
+viene letto prima di ogni esecuzione e confrontato in seguito:
+- segnale invariato: il risultato in cache scaduto viene rinnovato senza rieseguire
+- segnale cambiato: il risultato viene segnato come scaduto (o rieseguito)
+- segnale non leggibile: nessuna validazione, il risultato scaduto viene rieseguito
+  come senza rilevamento (non conta come modifica)
+
+Permessi SQL Server per le change_tables: VIEW DATABASE STATE (numero di righe) e
+VIEW SERVER STATE (ultimo aggiornamento). Senza VIEW SERVER STATE il server passa
+al solo numero di righe, che non vede gli UPDATE: per quei report usare una
+version_query (es. MAX(rowversion) o CHANGE_TRACKING_CURRENT_VERSION()).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.database import db_engine
+from app.core.file_lock import named_lock
+from app.core.models import SessionLocal, DBServer, Report
+from app.core.result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _is_permission_error(error: Exception) -> bool:
+    """Errore di permessi del server sorgente (es. VIEW SERVER STATE negato)"""
+    message = str(error).lower()
+    return "permission" in message or "permesso" in message
+
+
+class ChangeDetector:
+    """
+    Segnali di modifica per report
+    - Segnale di riferimento salvato con il risultato in cache (letto PRIMA della query
+      dati: una modifica concorrente viene comunque vista al controllo successivo)
+    - Polling periodico dei soli report con risultato in cache; report con la stessa
+      query segnale sullo stesso server condividono una sola lettura
+    - Con più worker il polling gira solo nel worker leader (lock su file)
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._leader = named_lock("change-detection-leader")
+        self._tracked = 0
+        # Server MSSQL senza VIEW SERVER STATE: segnale sul solo numero di righe
+        self._row_count_only: Set[int] = set()
+
+        # Statistiche
+        self._checks = 0
+        self._changes = 0
+        self._errors = 0
+        self._last_poll: Optional[datetime] = None
+
+    @staticmethod
+    def tracks(report: Report) -> bool:
+        """True se il report ha una sorgente di segnale configurata"""
+        return settings.CHANGE_DETECTION_ENABLED and bool(report.version_query or report.change_tables)
+
+    def signal_query(self, report: Report, server: DBServer) -> Tuple[str, Dict[str, Any]]:
+        """Query segnale del report: version_query o statistiche delle tabelle"""
+        if report.version_query:
+            return report.version_query, {}
+        return db_engine.build_change_signal_query(
+            server.db_type,
+            report.change_tables.split(","),
+            usage_stats=server.id not in self._row_count_only
+        )
+
+    def _downgrade(self, report: Report, server: DBServer, error: Exception) -> bool:
+        """
+        Permessi insufficienti per le statistiche di utilizzo MSSQL: il server passa
+        al segnale sul solo numero di righe (True se la query va riprovata)
+        """
+        if (report.version_query or server.db_type != "mssql"
+                or server.id in self._row_count_only or not _is_permission_error(error)):
+            return False
+        self._row_count_only.add(server.id)
+        logger.warning(
+            f"Server {server.id}: statistiche di utilizzo non accessibili (VIEW SERVER STATE), "
+            f"rilevamento modifiche sul solo numero di righe: {error}"
+        )
+        return True
+
+    async def read_signal(self, report: Report, server: DBServer, config: Dict[str, Any]) -> str:
+        """Impronta del risultato della query segnale"""
+        query, params = self.signal_query(report, server)
+        try:
+            return await self._read(server, config, query, params)
+        except Exception as e:
+            if not self._downgrade(report, server, e):
+                raise
+        query, params = self.signal_query(report, server)
+        return await self._read(server, config, query, params)
+
+    async def _read(self, server: DBServer, config: Dict[str, Any], query: str, params: Dict[str, Any]) -> str:
+        self._checks += 1
+        table = await db_engine.execute_arrow(
+            server_id=str(server.id),
+            db_type=server.db_type,
+            config=config,
+            query=query,
+            params=params,
+            timeout_seconds=settings.CHANGE_DETECTION_TIMEOUT_SECONDS
+        )
+        payload = json.dumps(table.to_pylist(), sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def is_unchanged(
+        self,
+        report: Report,
+        server: DBServer,
+        config: Dict[str, Any],
+        baseline: Optional[str]
+    ) -> bool:
+        """True solo se il segnale attuale coincide con quello del risultato in cache"""
+        if baseline is None:
+            return False
+
+        try:
+            current = await self.read_signal(report, server, config)
+        except Exception as e:
+            # Non validabile: riesecuzione come senza rilevamento, non è una modifica
+            self._errors += 1
+            logger.warning(f"Report {report.id}: lettura segnale fallita ({e}), riesecuzione")
+            return False
+
+        if current != baseline:
+            self._changes += 1
+            return False
+        return True
+
+    async def start(self):
+        """Avvia il polling (chiamato allo startup)"""
+        if self._task is None and settings.CHANGE_DETECTION_ENABLED:
+            self._task = asyncio.create_task(self._loop())
+            logger.info("Rilevamento modifiche avviato")
+
+    async def close(self):
+        """Ferma il polling (chiamato allo shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._leader.release()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.CHANGE_DETECTION_INTERVAL_SECONDS)
+            # Leader non acquisito: un altro worker fa già il polling (ritenta al giro successivo)
+            if not self._leader.try_acquire():
+                continue
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Errore rilevamento modifiche: {e}")
+
+    async def poll(self) -> List[int]:
+        """
+        Controlla i report in cache con un segnale di riferimento
+        Restituisce gli id dei report risultati modificati
+        """
+        # Import locale: report_runner usa il change detector
+        from app.core.report_runner import build_server_config, run_report
+
+        self._last_poll = datetime.now()
+        changed: List[int] = []
+
+        db = SessionLocal()
+        try:
+            reports = db.query(Report).filter(
+                Report.is_active == True,  # noqa: E712
+                (Report.version_query != None) | (Report.change_tables != None)  # noqa: E711
+            ).all()
+
+            # Stessa query segnale sullo stesso server = una sola lettura
+            groups: Dict[Tuple[int, str, str], List[Report]] = defaultdict(list)
+            servers: Dict[int, DBServer] = {}
+            baselines: Dict[int, str] = {}
+            for report in reports:
+                entry = result_cache.peek(result_cache.report_key(report.id))
+                # I risultati già scaduti vengono riverificati alla prossima richiesta
+                if not self.tracks(report) or entry is None or entry.signal is None or entry.expired:
+                    continue
+                baselines[report.id] = entry.signal
+                server = servers.get(report.server_id) or db.query(DBServer).filter(DBServer.id == report.server_id).first()
+                if not server or not server.is_active:
+                    continue
+                servers[server.id] = server
+                try:
+                    query, params = self.signal_query(report, server)
+                except ValueError as e:
+                    logger.warning(f"Report {report.id}: {e}")
+                    continue
+                groups[(server.id, query, json.dumps(params, sort_keys=True))].append(report)
+
+            self._tracked = len(baselines)
+
+            for (server_id, query, params_json), group in groups.items():
+                server = servers[server_id]
+                config = build_server_config(server)
+                try:
+                    current = await self._read(server, config, query, json.loads(params_json))
+                except Exception as e:
+                    # Risultati lasciati come sono: rivalidati alla scadenza
+                    self._errors += 1
+                    logger.warning(f"Server {server_id}: lettura segnale fallita: {e}")
+                    self._downgrade(group[0], server, e)
+                    continue
+
+                for report in group:
+                    if baselines[report.id] == current:
+                        continue
+
+                    self._changes += 1
+                    changed.append(report.id)
+                    logger.info(f"Report {report.id}: dati sorgente modificati")
+
+                    if settings.CHANGE_DETECTION_REFRESH:
+                        try:
+                            await run_report(report, server, refresh=True)
+                        except Exception as e:
+                            logger.error(f"Report {report.id}: refresh dopo modifica fallito: {e}")
+                            result_cache.expire(result_cache.report_key(report.id))
+                    else:
+                        result_cache.expire(result_cache.report_key(report.id))
+        finally:
+            db.close()
+
+        return changed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.CHANGE_DETECTION_ENABLED,
+            "leader": self._leader.locked,
+            "tracked_reports": self._tracked,
+            "row_count_only_servers": sorted(self._row_count_only),
+            "checks": self._checks,
+            "changes": self._changes,
+            "errors": self._errors,
+            "last_poll": self._last_poll.isoformat() if self._last_poll else None,
+        }
+
+
+# Istanza globale
+change_detector = ChangeDetector()
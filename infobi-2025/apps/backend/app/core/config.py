@@ -16,6 +16,91 @@ class Settings(BaseSettings):
     # Database interno (SQLite) - ora in apps/backend/data/
     DATABASE_PATH: Path = APP_DIR / "data" / "infobi.db"
 
+    # --- STREAMING RISULTATI ---
+    # Righe lette dal cursore per ogni blocco (fetchmany) durante gli export in streaming
+    STREAM_BATCH_SIZE: int = 10000
+
+    # --- CACHE FILE DI EXPORT ---
+    # File .xlsx generati, riusati finché report, pivot e dati non cambiano
+    EXPORT_CACHE_ENABLED: bool = True
+    EXPORT_CACHE_PATH: Path = APP_DIR / "data" / "export_cache"
+    EXPORT_CACHE_TTL_SECONDS: int = 3600
+    EXPORT_CACHE_MAX_MB: int = 512
+
+    # --- CACHE RISULTATI REPORT ---
+    # Table Arrow in memoria, base per le ri-analisi DuckDB
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_TTL_SECONDS: int = 600
+    RESULT_CACHE_MAX_MB: int = 1024
+    # Livello su disco (Arrow IPC memory-mapped): sopravvive ai riavvii, condiviso tra i worker
+    RESULT_CACHE_DISK_ENABLED: bool = True
+    RESULT_CACHE_PATH: Path = APP_DIR / "data" / "result_cache"
+    RESULT_CACHE_DISK_MAX_MB: int = 4096
+    # Ogni quanto un risultato in memoria viene riconfrontato con la versione su disco
+    # (scritture/invalidazioni di altri worker visibili con questo ritardo)
+    RESULT_CACHE_DISK_CHECK_SECONDS: float = 1.0
+    # Versioni precedenti per le risposte delta (su disco, condivise tra i worker)
+    RESULT_VERSIONS_PATH: Path = APP_DIR / "data" / "result_cache" / "versions"
+    RESULT_VERSIONS_PER_REPORT: int = 3
+    RESULT_VERSIONS_MAX_MB: int = 512
+
+    # --- ANTEPRIMA QUERY ---
+    PREVIEW_DEFAULT_ROWS: int = 100
+    PREVIEW_MAX_ROWS: int = 1000
+    PREVIEW_TIMEOUT_SECONDS: int = 10
+    # La stima delle righe (piano dell'ottimizzatore) non deve rallentare l'anteprima
+    PREVIEW_ESTIMATE_TIMEOUT_SECONDS: float = 2.0
+
+    # --- DASHBOARD BATCH ---
+    # Report massimi per singola richiesta /reports/batch
+    BATCH_MAX_REPORTS: int = 20
+
+    # --- POLICY REPORT ---
+    # Esecuzioni contemporanee sul server sorgente per classe di priorità del report
+    REPORT_CONCURRENCY_HIGH: int = 8
+    REPORT_CONCURRENCY_NORMAL: int = 4
+    REPORT_CONCURRENCY_LOW: int = 1
+
+    # --- RILEVAMENTO MODIFICHE ---
+    # Report con version_query o change_tables: la cache resta valida finché i dati
+    # sorgente non cambiano; il polling segna come scaduti i risultati modificati
+    CHANGE_DETECTION_ENABLED: bool = True
+    CHANGE_DETECTION_INTERVAL_SECONDS: int = 60
+    CHANGE_DETECTION_TIMEOUT_SECONDS: int = 10
+    # True = riesegue subito i report modificati invece di segnarli come scaduti
+    CHANGE_DETECTION_REFRESH: bool = False
+
+    # --- MULTI-WORKER ---
+    # Processi uvicorn (>1 = modalità produzione, reload disattivato)
+    WORKERS: int = 1
+    RELOAD: bool = True
+    # Lock su file per coordinare i worker dello stesso host
+    COORDINATION_PATH: Path = APP_DIR / "data" / "locks"
+    # Attesa massima del calcolo di un report da parte di un altro worker
+    HOST_LOCK_WAIT_SECONDS: int = 600
+
+    # --- SCHEDULER REFRESH ---
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_TICK_SECONDS: int = 30
+    # Refresh contemporanei massimi per singolo server sorgente
+    SCHEDULER_SERVER_CONCURRENCY: int = 1
+
+    # --- ESECUZIONE PARTIZIONATA ---
+    # Sotto-query contemporanee per report partizionato (una connessione ciascuna)
+    PARTITION_CONCURRENCY: int = 4
+    PARTITION_MAX_COUNT: int = 32
+    # Valori distinti massimi per il partizionamento automatico su colonne testo
+    PARTITION_MAX_DISTINCT: int = 1000
+    # Pool connessioni per server sorgente, almeno PARTITION_CONCURRENCY
+    # (0 = nessun pool, una connessione nuova per query)
+    DB_POOL_SIZE: int = 5
+    DB_POOL_MAX_OVERFLOW: int = 4
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+
+    # DuckDB per le ri-analisi (risorse per singola query)
+    ANALYTICS_THREADS: int = 2
+    ANALYTICS_MEMORY_LIMIT: str = "1GB"
+
     # --- CONFIGURAZIONE SQL SERVER ---
     # Inserisci qui i dati del tuo SQL Server Express
     DB_SERVER: str = "server2023"  # Es: 192.168.1.10 o PC-UFFICIO\SQLEXPRESS
@@ -26,6 +111,26 @@ class Settings(BaseSettings):
     # Driver ODBC: Solitamente è "ODBC Driver 17 for SQL Server" o "SQL Server"
     DB_DRIVER: str = "ODBC Driver 17 for SQL Server" 
 
+    # Pool aioodbc condiviso del Legacy Engine
+    LEGACY_POOL_MIN_SIZE: int = 1
+    LEGACY_POOL_MAX_SIZE: int = 10
+    LEGACY_POOL_RECYCLE_SECONDS: int = 1800  # -1 = mai
+    LEGACY_POOL_HEALTHCHECK_SECONDS: int = 60  # 0 = disabilitato
+
+    # Cache template .qry: intervallo minimo tra due controlli mtime (0 = ad ogni query)
+    LEGACY_TEMPLATE_CHECK_SECONDS: float = 2.0
+    # Catalogo .qry/.rep in memoria: intervallo scansione mtime (0 = solo allo startup)
+    CATALOG_SCAN_SECONDS: float = 5.0
+    # Query multi-azienda: esecuzioni contemporanee sul pool
+    LEGACY_FANOUT_CONCURRENCY: int = 4
+    # Snapshot Parquet degli esercizi chiusi (confronto anni)
+    LEGACY_SNAPSHOT_ENABLED: bool = True
+    LEGACY_SNAPSHOT_PATH: Path = APP_DIR / "data" / "snapshots"
+    # Esercizi ancora aperti (sempre live): 1 = solo l'anno corrente
+    LEGACY_SNAPSHOT_OPEN_YEARS: int = 1
+    # Chirurgia SQL delle .qry: "ast" (sqlglot, fallback automatico) o "string"
+    LEGACY_SQL_REWRITER: str = "ast"
+
     # Costruzione Connection String
     @property
     def SQL_CONNECTION_STRING(self) -> str:
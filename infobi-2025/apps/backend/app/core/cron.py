@@ -0,0 +1,119 @@
+"""
+Parser cron minimale (5 campi: minuto ora giorno mese giorno-settimana)
+Sintassi: *, n, a-b, */n, a-b/n, liste separate da virgola.
+Giorno settimana 0-7 (0 e 7 = domenica). Come in cron, se giorno del mese
+e giorno della settimana sono entrambi vincolati basta che uno dei due corrisponda.
+"""
+from datetime import datetime, timedelta
+from typing import Set
+
+# (minimo, massimo) per campo
+_FIELD_RANGES = [
+    (0, 59),   # minuto
+    (0, 23),   # ora
+    (1, 31),   # giorno del mese
+    (1, 12),   # mese
+    (0, 7),    # giorno della settimana
+]
+
+# Limite di ricerca della prossima esecuzione (espressioni impossibili, es. 31 febbraio)
+_MAX_SEARCH_DAYS = 366 * 5
+
+
+class CronError(ValueError):
+    """Espressione cron non valida"""
+    pass
+
+
+def _parse_field(field: str, minimum: int, maximum: int) -> Set[int]:
+    values: Set[int] = set()
+
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            if not step_str.isdigit() or int(step_str) == 0:
+                raise CronError(f"Passo non valido: '{step_str}'")
+            step = int(step_str)
+
+        if part == "*":
+            start, end = minimum, maximum
+        elif "-" in part:
+            start_str, end_str = part.split("-", 1)
+            if not (start_str.isdigit() and end_str.isdigit()):
+                raise CronError(f"Intervallo non valido: '{part}'")
+            start, end = int(start_str), int(end_str)
+        elif part.isdigit():
+            start = end = int(part)
+            if step > 1:
+                # "5/15" = da 5 in poi ogni 15
+                end = maximum
+        else:
+            raise CronError(f"Valore non valido: '{part}'")
+
+        if start < minimum or end > maximum or start > end:
+            raise CronError(f"Valore fuori intervallo ({minimum}-{maximum}): '{part}'")
+
+        values.update(range(start, end + 1, step))
+
+    return values
+
+
+class CronExpression:
+    """Espressione cron a 5 campi con calcolo della prossima esecuzione"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise CronError("L'espressione cron deve avere 5 campi (minuto ora giorno mese giorno-settimana)")
+
+        self.expression = expression
+        parsed = [_parse_field(f, lo, hi) for f, (lo, hi) in zip(fields, _FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+
+        # 7 = domenica come 0
+        if 7 in weekdays:
+            weekdays = (weekdays - {7}) | {0}
+        self.weekdays = weekdays
+
+        self._days_restricted = fields[2] != "*"
+        self._weekdays_restricted = fields[4] != "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        # isoweekday: lunedì=1 ... domenica=7 -> cron: domenica=0
+        weekday_ok = (dt.isoweekday() % 7) in self.weekdays
+
+        if self._days_restricted and self._weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """Prima esecuzione strettamente successiva a 'after' (precisione al minuto)"""
+        current = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=_MAX_SEARCH_DAYS)
+
+        while current <= limit:
+            if current.month not in self.months:
+                # Primo giorno del mese successivo
+                current = (current.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+
+            if not self._day_matches(current):
+                current = current.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+
+            if current.hour not in self.hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+                continue
+
+            if current.minute not in self.minutes:
+                current += timedelta(minutes=1)
+                continue
+
+            return current
+
+        raise CronError(f"Nessuna esecuzione possibile per '{self.expression}'")
+
+    def __repr__(self) -> str:
+        return f"CronExpression('{self.expression}')"
@@ -1,18 +1,79 @@
 """
 Multi-DB Engine con SQLAlchemy
-Supporta: MSSQL, PostgreSQL, MySQL
+Supporta: MSSQL, PostgreSQL, MySQL, SQLite (file locale, sviluppo e test)
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Iterator, Tuple
+import asyncio
+import concurrent.futures
+import json
+import re
+import threading
+import time
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import mssql, mysql, postgresql, sqlite
+from sqlalchemy.engine import Engine, Dialect
 from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
 import pyodbc
+import pyarrow as pa
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
 from decimal import Decimal
 from datetime import datetime, date
 import logging
 
+from app.core.config import settings
+from app.core.arrow_utils import ArrowConverter
+from app.core.single_flight import SingleFlight, query_coalescer
+
 logger = logging.getLogger(__name__)
 
+# Dialetti SQLAlchemy (quoting identificatori) e sqlglot (parsing) per tipo DB
+SQLALCHEMY_DIALECTS = {
+    "mssql": mssql.dialect,
+    "postgresql": postgresql.dialect,
+    "mysql": mysql.dialect,
+    "sqlite": sqlite.dialect,
+}
+SQLGLOT_DIALECTS = {
+    "mssql": "tsql",
+    "postgresql": "postgres",
+    "mysql": "mysql",
+    "sqlite": "sqlite",
+}
+
+# Operatori ammessi nei filtri pushdown
+PUSHDOWN_OPERATORS = {
+    "=": "=",
+    "!=": "<>",
+    "<>": "<>",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "like": "LIKE",
+    "not like": "NOT LIKE",
+    "in": "IN",
+    "not in": "NOT IN",
+    "between": "BETWEEN",
+    "is null": "IS NULL",
+    "is not null": "IS NOT NULL",
+}
+
+def _keep_named_placeholders(tree: exp.Expression) -> exp.Expression:
+    """
+    Mantiene i parametri ":nome" di SQLAlchemy nella rigenerazione sqlglot
+    (altrimenti resi nello stile del dialetto, es. %(nome)s per PostgreSQL)
+    """
+    def _transform(node: exp.Expression) -> exp.Expression:
+        if isinstance(node, exp.Placeholder) and node.this:
+            return exp.var(f":{node.this}")
+        return node
+
+    return tree.transform(_transform)
+
+
 class MultiDBEngine:
     """Gestione dinamica connessioni multi-database"""
     
@@ -66,6 +127,10 @@ class MultiDBEngine:
             
             return f"mysql+pymysql://{username}:{password}@{server}:{port}/{database}"
             
+        elif db_type == "sqlite":
+            # SQLite: "database" è il percorso del file
+            return f"sqlite:///{config['database']}"
+            
         else:
             raise ValueError(f"Database type non supportato: {db_type}")
     
@@ -77,12 +142,23 @@ class MultiDBEngine:
         if cache_key not in self._engines:
             conn_str = self.get_connection_string(db_type, config)
             
-            # Crea engine con pooling disabilitato per sicurezza
+            # Connessioni riusate (esecuzioni partizionate, dashboard), verificate prima
+            # dell'uso e rinnovate periodicamente; DB_POOL_SIZE = 0 disabilita il pool
+            if settings.DB_POOL_SIZE > 0:
+                pool_options = {
+                    "pool_size": settings.DB_POOL_SIZE,
+                    "max_overflow": settings.DB_POOL_MAX_OVERFLOW,
+                    "pool_pre_ping": True,
+                    "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+                }
+            else:
+                pool_options = {"poolclass": NullPool}
+
             engine = create_engine(
                 conn_str,
-                poolclass=NullPool,
                 echo=False,
-                future=True
+                future=True,
+                **pool_options
             )
             
             self._engines[cache_key] = engine
@@ -107,6 +183,375 @@ class MultiDBEngine:
         
         self._engines.clear()
     
+    def build_pushdown_query(
+        self,
+        db_type: str,
+        query: str,
+        columns: Optional[List[str]] = None,
+        filters: Optional[List[Dict[str, Any]]] = None,
+        order_by: Optional[List[Dict[str, Any]]] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Avvolge la query salvata come tabella derivata applicando
+        proiezione, filtri, ordinamento e limite sul database sorgente
+
+        - Identificatori quotati con l'identifier_preparer del dialetto
+        - Valori sempre come parametri con nome (:_pd0, :_pd1, ...)
+        - MSSQL: SELECT TOP (n); PostgreSQL/MySQL: LIMIT n
+
+        Args:
+            filters: [{"column": "Agente", "op": "=", "value": "ROSSI"}, ...]
+            order_by: [{"column": "Venduto", "direction": "desc"}, ...]
+
+        Returns:
+            (SQL, parametri)
+
+        Raises:
+            ValueError: tipo DB, operatore, valore o limite non validi
+        """
+        if not (columns or filters or order_by or limit is not None):
+            return query, {}
+
+        if db_type not in SQLALCHEMY_DIALECTS:
+            raise ValueError(f"Database type non supportato: {db_type}")
+
+        dialect: Dialect = SQLALCHEMY_DIALECTS[db_type]()
+        quote = dialect.identifier_preparer.quote_identifier
+        params: Dict[str, Any] = {}
+
+        def _bind(value: Any) -> str:
+            name = f"_pd{len(params)}"
+            params[name] = value
+            return f":{name}"
+
+        select_list = ", ".join(quote(c) for c in columns) if columns else "*"
+
+        conditions = []
+        for f in filters or []:
+            column = f.get("column")
+            op = str(f.get("op", "=")).lower().strip()
+            value = f.get("value")
+
+            if not column:
+                raise ValueError("Filtro senza colonna")
+            if op not in PUSHDOWN_OPERATORS:
+                raise ValueError(f"Operatore non supportato: {op}")
+
+            sql_op = PUSHDOWN_OPERATORS[op]
+            if op in ("is null", "is not null"):
+                conditions.append(f"{quote(column)} {sql_op}")
+            elif op in ("in", "not in"):
+                if not isinstance(value, list) or not value:
+                    raise ValueError(f"L'operatore '{op}' richiede una lista di valori")
+                placeholders = ", ".join(_bind(v) for v in value)
+                conditions.append(f"{quote(column)} {sql_op} ({placeholders})")
+            elif op == "between":
+                if not isinstance(value, list) or len(value) != 2:
+                    raise ValueError("L'operatore 'between' richiede due valori")
+                conditions.append(f"{quote(column)} BETWEEN {_bind(value[0])} AND {_bind(value[1])}")
+            else:
+                conditions.append(f"{quote(column)} {sql_op} {_bind(value)}")
+
+        with_clause, inner, saved_order = self._derived_source(db_type, query)
+        # Senza ordinamento richiesto vale quello della query salvata (TOP/LIMIT deterministici)
+        if not order_by:
+            order_by = saved_order
+
+        order_terms = []
+        for o in order_by or []:
+            column = o.get("column")
+            direction = str(o.get("direction", "asc")).lower()
+            if not column:
+                raise ValueError("Ordinamento senza colonna")
+            if direction not in ("asc", "desc"):
+                raise ValueError(f"Direzione non valida: {direction}")
+            order_terms.append(f"{quote(column)} {direction.upper()}")
+
+        if limit is not None and (not isinstance(limit, int) or limit < 0):
+            raise ValueError("Il limite deve essere un intero positivo")
+
+        top = f"TOP ({limit}) " if limit is not None and db_type == "mssql" else ""
+
+        sql = f"{with_clause}SELECT {top}{select_list} FROM ({inner}) AS {quote('_src')}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if order_terms:
+            sql += " ORDER BY " + ", ".join(order_terms)
+        if limit is not None and db_type != "mssql":
+            sql += f" LIMIT {limit}"
+
+        return sql, params
+
+    def build_partition_bounds_query(self, db_type: str, query: str, column: str) -> str:
+        """MIN/MAX della colonna di partizionamento sulla query salvata"""
+        if db_type not in SQLALCHEMY_DIALECTS:
+            raise ValueError(f"Database type non supportato: {db_type}")
+
+        quote = SQLALCHEMY_DIALECTS[db_type]().identifier_preparer.quote_identifier
+        with_clause, inner, _ = self._derived_source(db_type, query)
+        return (
+            f"{with_clause}SELECT MIN({quote(column)}) AS {quote('_low')}, MAX({quote(column)}) AS {quote('_high')} "
+            f"FROM ({inner}) AS {quote('_src')}"
+        )
+
+    def build_partition_values_query(self, db_type: str, query: str, column: str, limit: int) -> str:
+        """Valori distinti (al massimo limit) della colonna di partizionamento"""
+        if db_type not in SQLALCHEMY_DIALECTS:
+            raise ValueError(f"Database type non supportato: {db_type}")
+
+        quote = SQLALCHEMY_DIALECTS[db_type]().identifier_preparer.quote_identifier
+        with_clause, inner, _ = self._derived_source(db_type, query)
+        top = f"TOP ({int(limit)}) " if db_type == "mssql" else ""
+        sql = (
+            f"{with_clause}SELECT DISTINCT {top}{quote(column)} FROM ({inner}) AS {quote('_src')} "
+            f"WHERE {quote(column)} IS NOT NULL ORDER BY {quote(column)}"
+        )
+        if db_type != "mssql":
+            sql += f" LIMIT {int(limit)}"
+        return sql
+
+    @staticmethod
+    def _derived_source(db_type: str, query: str) -> Tuple[str, str, List[Dict[str, Any]]]:
+        """
+        Query salvata pronta per essere usata come tabella derivata
+
+        - WITH spostato sulla query esterna ("FROM (WITH ...)" non è valido in T-SQL)
+        - ORDER BY esterno rimosso (vietato da SQL Server in una tabella derivata senza
+          TOP/OFFSET) e restituito come ordinamento sulle colonne del risultato,
+          da riapplicare sulla query esterna; se un termine non corrisponde a una colonna
+          del risultato l'ORDER BY resta nella query interna (MSSQL: con OFFSET 0 ROWS)
+
+        Returns:
+            (clausola WITH con spazio finale o "", query interna, ordinamento salvato)
+        """
+        query = query.strip().rstrip(";")
+        dialect = SQLGLOT_DIALECTS[db_type]
+        try:
+            tree = sqlglot.parse_one(query, read=dialect)
+        except SqlglotError:
+            return "", query, []
+
+        if not isinstance(tree, exp.Query):
+            return "", query, []
+
+        # sqlglot >= 30 usa la chiave "with_"
+        with_key = "with_" if "with_" in tree.arg_types else "with"
+        with_node = tree.args.get(with_key)
+        order = tree.args.get("order")
+        has_limit = tree.args.get("limit") or tree.args.get("offset") or tree.args.get("fetch")
+        strip_order = order is not None and not has_limit
+
+        if with_node is None and not strip_order:
+            return "", query, []
+
+        with_clause = ""
+        if with_node is not None:
+            tree.set(with_key, None)
+            with_clause = _keep_named_placeholders(with_node).sql(dialect=dialect) + " "
+
+        saved_order: List[Dict[str, Any]] = []
+        if strip_order:
+            columns = [MultiDBEngine._output_column(o.this, tree.selects) for o in order.expressions]
+            if all(columns):
+                saved_order = [
+                    {"column": column, "direction": "desc" if o.args.get("desc") else "asc"}
+                    for column, o in zip(columns, order.expressions)
+                ]
+                tree.set("order", None)
+            elif db_type == "mssql":
+                # Ordinamento su colonne non selezionate: resta interno (OFFSET lo rende valido in T-SQL)
+                tree = tree.offset(0)
+
+        return with_clause, _keep_named_placeholders(tree).sql(dialect=dialect), saved_order
+
+    @staticmethod
+    def _output_column(target: exp.Expression, projections: List[exp.Expression]) -> Optional[str]:
+        """Colonna del risultato corrispondente a un termine di ORDER BY (None se non determinabile)"""
+        # ORDER BY 2: posizione nella SELECT
+        if isinstance(target, exp.Literal) and not target.is_string:
+            idx = int(target.this) - 1
+            if 0 <= idx < len(projections) and projections[idx].alias_or_name != "*":
+                return projections[idx].alias_or_name
+            return None
+
+        for projection in projections:
+            source = projection.this if isinstance(projection, exp.Alias) else projection
+            if source == target:
+                return projection.alias_or_name
+
+        if isinstance(target, exp.Column):
+            for projection in projections:
+                if projection.alias_or_name == target.name:
+                    return target.name
+            # SELECT *: la colonna esiste nel risultato con lo stesso nome
+            if any(isinstance(p, exp.Star) or (isinstance(p, exp.Column) and isinstance(p.this, exp.Star)) for p in projections):
+                return target.name
+        return None
+
+    def build_preview_query(
+        self,
+        db_type: str,
+        query: str,
+        rows: int,
+        sample_percent: Optional[float] = None
+    ) -> Tuple[str, bool]:
+        """
+        Query di anteprima: limite di righe con la sintassi del dialetto
+        (TOP per MSSQL, LIMIT per gli altri) mantenendo l'ORDER BY originale;
+        con sample_percent TABLESAMPLE sulle tabelle di base (MSSQL, PostgreSQL)
+
+        Returns:
+            (SQL, campionata)
+
+        Raises:
+            ValueError: tipo DB non supportato o query non analizzabile
+        """
+        if db_type not in SQLGLOT_DIALECTS:
+            raise ValueError(f"Database type non supportato: {db_type}")
+
+        dialect = SQLGLOT_DIALECTS[db_type]
+        try:
+            tree = sqlglot.parse_one(query.strip().rstrip(";"), read=dialect)
+        except SqlglotError as e:
+            raise ValueError(f"Query non analizzabile: {e}")
+        if not isinstance(tree, exp.Query):
+            raise ValueError("L'anteprima è disponibile solo per query SELECT")
+
+        tree = _keep_named_placeholders(tree)
+
+        sampled = False
+        if sample_percent and db_type in ("mssql", "postgresql"):
+            cte_names = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+            for table in tree.find_all(exp.Table):
+                if table.name in cte_names or not isinstance(table.parent, (exp.From, exp.Join)):
+                    continue
+                table.set("sample", exp.TableSample(
+                    method=exp.var("SYSTEM"),
+                    percent=exp.Literal.number(sample_percent)
+                ))
+                sampled = True
+
+        # Limite già presente e più stretto: resta quello della query
+        existing = tree.args.get("limit")
+        count = existing.args.get("expression") or existing.args.get("count") if existing else None
+        if not (count is not None and count.is_int and int(count.name) <= rows):
+            tree = tree.limit(rows)
+
+        return tree.sql(dialect=dialect), sampled
+
+    def estimate_row_count(
+        self,
+        server_id: str,
+        db_type: str,
+        config: Dict[str, Any],
+        query: str,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Optional[int]:
+        """
+        Righe stimate dall'ottimizzatore, senza eseguire la query
+        - PostgreSQL: EXPLAIN (FORMAT JSON), "Plan Rows"
+        - MSSQL: SHOWPLAN_XML, StatementEstRows
+        - MySQL: EXPLAIN, rows * filtered della prima tabella (indicativo)
+        - SQLite: non disponibile (None)
+        """
+        if db_type not in ("postgresql", "mssql", "mysql"):
+            return None
+
+        engine = self.get_engine(server_id, db_type, config)
+        query = query.strip().rstrip(";")
+
+        with engine.connect() as connection:
+            if db_type == "postgresql":
+                plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), params or {}).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]["Plan"]["Plan Rows"])
+
+            if db_type == "mssql":
+                # SET SHOWPLAN deve essere l'unica istruzione del batch
+                connection.exec_driver_sql("SET SHOWPLAN_XML ON")
+                try:
+                    plan_xml = connection.execute(text(query), params or {}).scalar()
+                finally:
+                    connection.exec_driver_sql("SET SHOWPLAN_XML OFF")
+                match = re.search(r'StatementEstRows="([0-9.eE+-]+)"', plan_xml or "")
+                return int(float(match.group(1))) if match else None
+
+            first = connection.execute(text(f"EXPLAIN {query}"), params or {}).mappings().first()
+            if not first or first.get("rows") is None:
+                return None
+            return int(first["rows"] * float(first.get("filtered") or 100) / 100)
+
+    def build_change_signal_query(
+        self,
+        db_type: str,
+        tables: List[str],
+        usage_stats: bool = True
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Query leggera che restituisce un "segnale di modifica" per le tabelle indicate:
+        se il risultato cambia, i dati delle tabelle sono cambiati
+
+        - MSSQL: righe (sys.dm_db_partition_stats, richiede VIEW DATABASE STATE)
+          + ultimo aggiornamento (sys.dm_db_index_usage_stats, richiede VIEW SERVER STATE
+          e viene azzerata al riavvio dell'istanza: un riavvio conta come una modifica).
+          usage_stats=False: solo il numero di righe (non vede gli UPDATE), per gli
+          utenti senza VIEW SERVER STATE
+        - PostgreSQL: contatori insert/update/delete di pg_stat_user_tables
+        - MySQL: UPDATE_TIME di information_schema.tables
+        - SQLite: COUNT(*) e MAX(rowid) (approssimato: non vede gli UPDATE)
+
+        Per change tracking o colonne rowversion usare la version_query del report
+
+        Raises:
+            ValueError: tipo DB non supportato o nessuna tabella
+        """
+        tables = [t.strip() for t in tables if t and t.strip()]
+        if not tables:
+            raise ValueError("Nessuna tabella per il controllo modifiche")
+        if db_type not in SQLALCHEMY_DIALECTS:
+            raise ValueError(f"Database type non supportato: {db_type}")
+
+        params = {f"_cs{idx}": table for idx, table in enumerate(tables)}
+        placeholders = [f":{name}" for name in params]
+
+        if db_type == "mssql":
+            values = ", ".join(f"(OBJECT_ID({p}))" for p in placeholders)
+            last_update = (
+                ", (SELECT MAX(u.last_user_update) FROM sys.dm_db_index_usage_stats u "
+                "WHERE u.database_id = DB_ID() AND u.object_id = o.object_id) AS last_update"
+            ) if usage_stats else ""
+            sql = (
+                "SELECT o.object_id, "
+                "(SELECT SUM(p.row_count) FROM sys.dm_db_partition_stats p "
+                "WHERE p.object_id = o.object_id AND p.index_id IN (0, 1)) AS row_count"
+                f"{last_update} "
+                f"FROM (VALUES {values}) AS o(object_id) ORDER BY o.object_id"
+            )
+        elif db_type == "postgresql":
+            regclasses = ", ".join(f"to_regclass({p})" for p in placeholders)
+            sql = (
+                "SELECT relid::regclass::text AS table_name, n_tup_ins, n_tup_upd, n_tup_del "
+                f"FROM pg_stat_user_tables WHERE relid IN ({regclasses}) ORDER BY 1"
+            )
+        elif db_type == "mysql":
+            sql = (
+                "SELECT TABLE_NAME, UPDATE_TIME FROM information_schema.tables "
+                f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({', '.join(placeholders)}) "
+                "ORDER BY TABLE_NAME"
+            )
+        else:
+            # SQLite: nessuna statistica di sistema, conteggio diretto (tabelle piccole/di test)
+            quote = SQLALCHEMY_DIALECTS[db_type]().identifier_preparer.quote_identifier
+            sql = " UNION ALL ".join(
+                f"SELECT {p} AS table_name, COUNT(*) AS row_count, MAX(rowid) AS max_rowid "
+                f"FROM {'.'.join(quote(part) for part in table.split('.'))}"
+                for p, table in zip(placeholders, tables)
+            )
+
+        return sql, params
+
     async def execute_query(
         self, 
         server_id: str,
@@ -148,6 +593,160 @@ class MultiDBEngine:
             logger.error(f"Errore esecuzione query su {server_id}: {str(e)}")
             raise
     
+    def iter_arrow_batches(
+        self,
+        server_id: str,
+        db_type: str,
+        config: Dict[str, Any],
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        batch_size: Optional[int] = None,
+        max_rows: Optional[int] = None,
+        timeout_seconds: Optional[float] = None
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Esegue una query e restituisce i risultati a blocchi (RecordBatch Arrow)
+        Il cursore viene letto con fetchmany: la memoria resta costante
+        indipendentemente dal numero di righe.
+        Generatore sincrono: va consumato in un thread (es. StreamingResponse)
+        
+        Args:
+            max_rows: smette di leggere il cursore dopo n righe
+            timeout_seconds: tempo massimo di lettura (TimeoutError tra un blocco e l'altro)
+        """
+        
+        engine = self.get_engine(server_id, db_type, config)
+        batch_size = batch_size or settings.STREAM_BATCH_SIZE
+        deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+        
+        try:
+            with engine.connect() as connection:
+                # stream_results: cursore server-side dove supportato (psycopg2, pymysql)
+                connection = connection.execution_options(stream_results=True)
+                result = connection.execute(text(query), params or {})
+                columns = list(result.keys())
+                
+                emitted = False
+                remaining = max_rows
+                while remaining is None or remaining > 0:
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise TimeoutError(f"Tempo massimo di esecuzione superato ({timeout_seconds}s)")
+                    
+                    rows = result.fetchmany(batch_size if remaining is None else min(batch_size, remaining))
+                    if not rows:
+                        break
+                    emitted = True
+                    if remaining is not None:
+                        remaining -= len(rows)
+                    yield ArrowConverter.rows_to_record_batch(columns, rows)
+                
+                # Nessuna riga: blocco vuoto per trasmettere comunque lo schema
+                if not emitted:
+                    yield ArrowConverter.rows_to_record_batch(columns, [])
+                    
+        except Exception as e:
+            logger.error(f"Errore streaming query su {server_id}: {str(e)}")
+            raise
+    
+    async def execute_arrow(
+        self,
+        server_id: str,
+        db_type: str,
+        config: Dict[str, Any],
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        max_rows: Optional[int] = None,
+        timeout_seconds: Optional[float] = None
+    ) -> pa.Table:
+        """
+        Esegue una query e restituisce direttamente una Table Arrow
+        Lettura a blocchi in un thread separato (non blocca l'event loop).
+        Esecuzioni identiche contemporanee condividono un solo round-trip (single-flight)
+        
+        Con timeout_seconds la richiesta termina con TimeoutError allo scadere;
+        la lettura nel thread si ferma al blocco successivo
+        """
+        
+        def _collect() -> pa.Table:
+            batches = self.iter_arrow_batches(
+                server_id, db_type, config, query, params,
+                max_rows=max_rows, timeout_seconds=timeout_seconds
+            )
+            return ArrowConverter.batches_to_table(batches)
+        
+        # Lo stesso SQL con limiti di righe diversi non condivide il risultato
+        key_query = query if max_rows is None else f"{query}|max_rows={max_rows}"
+        key = SingleFlight.make_key(server_id, key_query, params)
+        
+        execution = query_coalescer.do(key, lambda: run_in_threadpool(_collect))
+        if timeout_seconds:
+            try:
+                return await asyncio.wait_for(execution, timeout_seconds)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Tempo massimo di esecuzione superato ({timeout_seconds}s)")
+        return await execution
+
+    async def stream_arrow(
+        self,
+        server_id: str,
+        db_type: str,
+        config: Dict[str, Any],
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        max_rows: Optional[int] = None,
+        timeout_seconds: Optional[float] = None
+    ) -> AsyncIterator[pa.RecordBatch]:
+        """
+        Blocchi Arrow consegnati appena letti dal cursore (lettura in un thread)
+        Coda limitata: il cursore avanza solo quando il consumatore ha ritirato i blocchi.
+        Chiudendo il generatore (annullamento, disconnessione) la lettura si ferma
+        al blocco successivo e la connessione viene chiusa; la query già in corso
+        sul server non viene interrotta prima del primo blocco.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+        stop = threading.Event()
+        done = object()
+
+        def _offer(item: Any) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return False
+
+        def _produce():
+            batches = self.iter_arrow_batches(
+                server_id, db_type, config, query, params,
+                max_rows=max_rows, timeout_seconds=timeout_seconds
+            )
+            try:
+                for batch in batches:
+                    if stop.is_set() or not _offer(batch):
+                        return
+                _offer(done)
+            except Exception as e:
+                _offer(e)
+            finally:
+                batches.close()
+
+        producer = loop.run_in_executor(None, _produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            await asyncio.shield(producer)
+
     def _sanitize_value(self, value: Any) -> Any:
         """
         Sanifica valori per serializzazione JSON/Arrow
@@ -0,0 +1,100 @@
+"""
+Lock su file tra processi dello stesso host (worker uvicorn)
+fcntl.flock su Linux/macOS, msvcrt.locking su Windows.
+Il lock è legato al file aperto: viene rilasciato dal sistema operativo
+anche se il processo termina senza rilasciarlo.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """
+    Lock esclusivo non rientrante su un file
+    - try_acquire: non bloccante
+    - acquire: attesa asincrona (polling) senza bloccare l'event loop
+    I file di lock non vengono mai cancellati (eviterebbe lock su file diversi)
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+
+        self._fd = fd
+        return True
+
+    async def acquire(self, timeout: Optional[float] = None, poll_interval: float = 0.05) -> bool:
+        """Attende il lock (False allo scadere del timeout)"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(poll_interval)
+        return True
+
+    def acquire_blocking(self, poll_interval: float = 0.05):
+        """Attesa sincrona (solo fuori dall'event loop, es. inizializzazione)"""
+        while not self.try_acquire():
+            time.sleep(poll_interval)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        except OSError as e:
+            logger.warning(f"Rilascio lock {self.path.name} fallito: {e}")
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire_blocking()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def named_lock(name: str) -> FileLock:
+    """Lock di coordinamento tra worker, identificato da un nome libero"""
+    digest = hashlib.sha256(name.encode("utf-8")).hexdigest()[:40]
+    return FileLock(settings.COORDINATION_PATH / f"{digest}.lock")
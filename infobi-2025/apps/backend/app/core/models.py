@@ -11,9 +11,9 @@ import os
 
 """
 Database interno SQLite per persistenza
-Modelli: Server, Report, User
+Modelli: Server, Report, User, ReportSchedule
 """
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -109,6 +109,34 @@ class Report(Base):
     # Configurazione aggiuntiva (filtri, parametri, ecc.)
     config_json = Column(Text, nullable=True)
     
+    # Refresh incrementale: colonna watermark (data o id crescente) e finestra di ricalcolo
+    # (giorni per le date, unità per i numeri)
+    watermark_column = Column(String(100), nullable=True)
+    watermark_lookback = Column(Integer, nullable=True)
+    
+    # Policy di esecuzione (NULL = default globali)
+    cache_ttl_seconds = Column(Integer, nullable=True)   # 0 = sempre rieseguito
+    max_rows = Column(Integer, nullable=True)
+    timeout_seconds = Column(Integer, nullable=True)
+    priority = Column(String(10), default="normal")     # low / normal / high
+    output_format = Column(String(10), nullable=True)    # arrow / json
+    output_compression = Column(String(10), nullable=True)  # lz4 / zstd (solo Arrow)
+    refresh_schedule = Column(String(100), nullable=True)  # cron del pre-warming
+    
+    # Rilevamento modifiche: query che restituisce una versione dei dati (es. MAX(rowversion),
+    # CHANGE_TRACKING_CURRENT_VERSION()) oppure tabelle sorgente separate da virgola
+    version_query = Column(Text, nullable=True)
+    change_tables = Column(String(500), nullable=True)
+
+    # Esecuzione partizionata: colonna (data, id, codazi) e numero di partizioni automatiche
+    # oppure partizioni esplicite JSON ([{"from": .., "to": ..}, {"values": [..]}])
+    partition_column = Column(String(100), nullable=True)
+    partition_count = Column(Integer, nullable=True)
+    partition_ranges = Column(Text, nullable=True)
+
+    # Chiave primaria del risultato (colonne separate da virgola) per le risposte delta
+    primary_key = Column(String(200), nullable=True)
+
     # Owner
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     
@@ -123,14 +151,64 @@ class Report(Base):
     owner = relationship("User", back_populates="reports")
 
 
+class ReportSchedule(Base):
+    """Pianificazioni di refresh della cache risultati (pre-warming)"""
+    __tablename__ = "report_schedules"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    report_id = Column(Integer, ForeignKey("reports.id"), nullable=False, index=True)
+    
+    # Espressione cron a 5 campi (ora locale del server), es. "30 6 * * 1-5"
+    cron = Column(String(100), nullable=False)
+    # Ritardo casuale massimo per non far partire insieme i refresh
+    jitter_seconds = Column(Integer, default=0)
+    is_active = Column(Boolean, default=True)
+    
+    # Stato ultimo refresh
+    next_run_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    last_duration_ms = Column(Integer, nullable=True)
+    last_status = Column(String(20), nullable=True)  # running / ok / error
+    last_rows = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relazioni
+    report = relationship("Report")
+
+
 # --- Funzioni Helper ---
 
 def init_db():
     """Inizializza il database creando tutte le tabelle"""
     Base.metadata.create_all(bind=engine)
+    migrate_schema()
     print(f"✅ Database inizializzato: {DB_PATH}")
 
 
+def migrate_schema():
+    """
+    Aggiunge alle tabelle esistenti le colonne nuove dei modelli
+    (create_all crea solo le tabelle mancanti). Solo ADD COLUMN, mai modifiche distruttive.
+    """
+    inspector = inspect(engine)
+    
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                print(f"✅ Migrazione: aggiunta colonna {table.name}.{column.name}")
+
+
 def get_db():
     """Dependency per ottenere una sessione DB"""
     db = SessionLocal()
@@ -0,0 +1,199 @@
+"""
+Esecuzione partizionata dei report salvati
+La query del report viene divisa in N sotto-query su una colonna (date, id, codazi)
+eseguite in parallelo su connessioni diverse; i risultati Arrow vengono concatenati.
+
+Partizioni esplicite (partition_ranges del report, JSON):
+    [{"from": "2024-01-01", "to": "2024-07-01"}, {"from": "2024-07-01"}, {"values": ["01", "02"]}]
+    - from/to: intervallo [from, to), estremi opzionali
+    - values: elenco di valori (es. aziende)
+Partizioni automatiche (solo partition_count):
+    - numeri e date: MIN/MAX della colonna divisi in intervalli uguali
+    - testo: valori distinti distribuiti sulle partizioni
+    - più una partizione per i NULL
+"""
+import asyncio
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+
+from app.core.arrow_utils import ArrowConverter
+from app.core.config import settings
+from app.core.database import db_engine
+
+logger = logging.getLogger(__name__)
+
+Filters = List[Dict[str, Any]]
+
+
+def parse_partition_ranges(raw: Optional[str]) -> Optional[List[Filters]]:
+    """
+    Filtri pushdown delle partizioni esplicite (None se non definite)
+
+    Raises:
+        ValueError: JSON o formato non validi
+    """
+    if not raw:
+        return None
+
+    try:
+        ranges = json.loads(raw)
+    except ValueError as e:
+        raise ValueError(f"partition_ranges non è JSON valido: {e}")
+
+    if not isinstance(ranges, list) or not ranges:
+        raise ValueError("partition_ranges deve essere una lista non vuota")
+
+    partitions: List[Filters] = []
+    for item in ranges:
+        if not isinstance(item, dict):
+            raise ValueError("Ogni partizione deve essere un oggetto con 'from'/'to' o 'values'")
+
+        if "values" in item:
+            values = item["values"]
+            if not isinstance(values, list) or not values:
+                raise ValueError("'values' deve essere una lista non vuota")
+            partitions.append([{"op": "in", "value": values}])
+            continue
+
+        filters: Filters = []
+        if item.get("from") is not None:
+            filters.append({"op": ">=", "value": bind_value(item["from"])})
+        if item.get("to") is not None:
+            filters.append({"op": "<", "value": bind_value(item["to"])})
+        if not filters:
+            raise ValueError("Partizione senza 'from', 'to' o 'values'")
+        partitions.append(filters)
+
+    return partitions
+
+
+def bind_value(value: Any) -> Any:
+    """Stringhe ISO come date/datetime (tipo corretto verso il driver)"""
+    if isinstance(value, str) and len(value) >= 10 and value[4] == "-" and value[7] == "-":
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+        return parsed.date() if len(value) == 10 else parsed
+    return value
+
+
+def split_range(low: Any, high: Any, count: int) -> List[Filters]:
+    """Intervalli [a, b) uguali tra low e high (ultimo chiuso) per numeri e date"""
+    low, high = bind_value(low), bind_value(high)
+    if low == high:
+        return [[{"op": "=", "value": low}]]
+
+    if isinstance(low, date):
+        # Date: divisione sui secondi dall'inizio (date pure restano date)
+        is_date = not isinstance(low, datetime)
+        start = datetime.combine(low, datetime.min.time()) if is_date else low
+        end = datetime.combine(high, datetime.min.time()) if is_date else high
+        step = (end - start) / count
+        bounds = [start + step * i for i in range(count)] + [end]
+        if is_date:
+            bounds = sorted({b.date() for b in bounds[:-1]} | {high})
+    elif isinstance(low, int) and isinstance(high, int):
+        step = max(1, (high - low) // count)
+        bounds = sorted({min(low + step * i, high) for i in range(count)} | {high})
+    else:
+        step = (high - low) / count
+        bounds = [low + step * i for i in range(count)] + [high]
+
+    partitions: List[Filters] = []
+    for idx in range(len(bounds) - 1):
+        last = idx == len(bounds) - 2
+        partitions.append([
+            {"op": ">=", "value": bounds[idx]},
+            {"op": "<=" if last else "<", "value": bounds[idx + 1]},
+        ])
+    return partitions
+
+
+def split_values(values: List[Any], count: int) -> List[Filters]:
+    """Valori distinti distribuiti a rotazione su count partizioni"""
+    buckets = [values[i::count] for i in range(min(count, len(values)))]
+    return [[{"op": "in", "value": bucket}] for bucket in buckets if bucket]
+
+
+async def plan_partitions(
+    server_id: str,
+    db_type: str,
+    config: Dict[str, Any],
+    query: str,
+    column: str,
+    count: int,
+    timeout_seconds: Optional[float] = None
+) -> List[Filters]:
+    """Partizioni automatiche calcolate sul server sorgente (MIN/MAX o valori distinti)"""
+    bounds_sql = db_engine.build_partition_bounds_query(db_type, query, column)
+    bounds = await db_engine.execute_arrow(server_id, db_type, config, bounds_sql, timeout_seconds=timeout_seconds)
+    low, high = bounds.column(0)[0].as_py(), bounds.column(1)[0].as_py()
+
+    partitions: List[Filters]
+    if low is None:
+        partitions = []
+    elif isinstance(low, (int, float)) or isinstance(bind_value(low), (date, datetime)):
+        partitions = split_range(low, high, count)
+    else:
+        values_sql = db_engine.build_partition_values_query(db_type, query, column, settings.PARTITION_MAX_DISTINCT)
+        distinct = await db_engine.execute_arrow(server_id, db_type, config, values_sql, timeout_seconds=timeout_seconds)
+        values = [v for v in distinct.column(0).to_pylist() if v is not None]
+        if len(values) >= settings.PARTITION_MAX_DISTINCT:
+            raise ValueError(f"Troppi valori distinti in {column} per il partizionamento automatico")
+        partitions = split_values(values, count)
+
+    # Righe con colonna NULL: non coperte dagli intervalli
+    partitions.append([{"op": "is null"}])
+    return partitions
+
+
+async def execute_partitioned(
+    server_id: str,
+    db_type: str,
+    config: Dict[str, Any],
+    query: str,
+    column: str,
+    count: Optional[int] = None,
+    ranges: Optional[str] = None,
+    max_rows: Optional[int] = None,
+    timeout_seconds: Optional[float] = None
+) -> pa.Table:
+    """
+    Esegue la query per partizioni in parallelo (al massimo PARTITION_CONCURRENCY
+    sotto-query contemporanee) e concatena i risultati nell'ordine delle partizioni.
+    L'ORDER BY della query salvata non viene mantenuto.
+    """
+    partitions = parse_partition_ranges(ranges)
+    if partitions is None:
+        partitions = await plan_partitions(server_id, db_type, config, query, column, count or 1, timeout_seconds)
+
+    semaphore = asyncio.Semaphore(max(1, settings.PARTITION_CONCURRENCY))
+
+    async def _run(filters: Filters) -> pa.Table:
+        sql, params = db_engine.build_pushdown_query(
+            db_type=db_type,
+            query=query,
+            filters=[{"column": column, **f} for f in filters]
+        )
+        async with semaphore:
+            return await db_engine.execute_arrow(
+                server_id=server_id,
+                db_type=db_type,
+                config=config,
+                query=sql,
+                params=params,
+                max_rows=max_rows,
+                timeout_seconds=timeout_seconds
+            )
+
+    tables = await asyncio.gather(*(_run(filters) for filters in partitions))
+    logger.info(
+        f"Esecuzione partizionata su {column}: {len(partitions)} partizioni, "
+        f"{sum(t.num_rows for t in tables)} righe"
+    )
+    return ArrowConverter.concat_tables(tables)
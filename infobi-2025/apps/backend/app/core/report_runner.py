@@ -0,0 +1,409 @@
+"""
+Esecuzione dei report salvati con cache dei risultati
+Punto unico usato da execute e dalle ri-analisi
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from starlette.concurrency import run_in_threadpool
+
+from app.core.arrow_utils import ArrowConverter
+from app.core.change_detection import change_detector
+from app.core.config import settings
+from app.core.database import db_engine
+from app.core.file_lock import FileLock, named_lock
+from app.core.models import DBServer, Report
+from app.core.partitioning import bind_value, execute_partitioned
+from app.core.result_cache import result_cache
+from app.core.security import CredentialEncryption
+
+logger = logging.getLogger(__name__)
+
+# Classi di priorità dei report
+REPORT_PRIORITIES = ("low", "normal", "high")
+
+# Marcatore nei metadati dello schema: risultato troncato a max_rows
+TRUNCATED_METADATA_KEY = b"infobi_truncated"
+
+# Intervallo di controllo del risultato calcolato da un altro worker
+_PUBLISH_POLL_SECONDS = 0.2
+
+_priority_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+# Notifiche di avanzamento dell'esecuzione (canale WebSocket)
+PhaseCallback = Callable[[str], Awaitable[None]]
+BatchCallback = Callable[[pa.RecordBatch], Awaitable[None]]
+
+
+def priority_slot(priority: Optional[str]) -> asyncio.Semaphore:
+    """Semaforo della classe di priorità (esecuzioni contemporanee sul server sorgente)"""
+    priority = priority if priority in REPORT_PRIORITIES else "normal"
+    if priority not in _priority_semaphores:
+        limit = {
+            "high": settings.REPORT_CONCURRENCY_HIGH,
+            "normal": settings.REPORT_CONCURRENCY_NORMAL,
+            "low": settings.REPORT_CONCURRENCY_LOW,
+        }[priority]
+        _priority_semaphores[priority] = asyncio.Semaphore(max(1, limit))
+    return _priority_semaphores[priority]
+
+
+def apply_row_limit(table: pa.Table, max_rows: Optional[int]) -> pa.Table:
+    """Tronca a max_rows righe, segnando il troncamento nei metadati dello schema"""
+    if not max_rows or table.num_rows <= max_rows:
+        return table
+    metadata = dict(table.schema.metadata or {})
+    metadata[TRUNCATED_METADATA_KEY] = b"1"
+    return table.slice(0, max_rows).replace_schema_metadata(metadata)
+
+
+def is_truncated(table: pa.Table) -> bool:
+    """True se il risultato è stato tagliato a max_rows (vedi apply_row_limit)"""
+    return bool(table.schema.metadata and TRUNCATED_METADATA_KEY in table.schema.metadata)
+
+
+def report_primary_key(report: Report) -> List[str]:
+    """Colonne della chiave primaria del risultato (primary_key separata da virgola)"""
+    return [k.strip() for k in (report.primary_key or "").split(",") if k.strip()]
+
+
+def build_server_config(server: DBServer) -> dict:
+    """Configurazione connessione con credenziali decifrate"""
+    config = {
+        "server": server.server,
+        "database": server.database,
+        "port": server.port,
+        "driver": server.driver
+    }
+
+    if server.username_encrypted:
+        config["username"] = CredentialEncryption.decrypt(server.username_encrypted)
+
+    if server.password_encrypted:
+        config["password"] = CredentialEncryption.decrypt(server.password_encrypted)
+
+    return config
+
+
+class ReportResult(NamedTuple):
+    table: pa.Table
+    source: str  # cache, validated (cache confermata dal segnale di modifica), full, partitioned, incremental
+
+    @property
+    def cached(self) -> bool:
+        return self.source in ("cache", "validated")
+
+    @property
+    def truncated(self) -> bool:
+        return is_truncated(self.table)
+
+    def headers(self) -> Dict[str, str]:
+        """Header HTTP che descrivono la provenienza del risultato"""
+        headers = {
+            "X-Result-Cache": "HIT" if self.cached else "MISS",
+            "X-Result-Source": self.source,
+        }
+        if self.truncated:
+            headers["X-Result-Truncated"] = "true"
+        return headers
+
+
+async def run_report(
+    report: Report,
+    server: DBServer,
+    refresh: bool = False,
+    full_refresh: bool = False,
+    on_phase: Optional[PhaseCallback] = None,
+    on_batch: Optional[BatchCallback] = None,
+    config: Optional[Dict[str, Any]] = None
+) -> ReportResult:
+    """
+    Risultato del report: dalla cache se disponibile, altrimenti dal server sorgente
+
+    Con una colonna watermark configurata e un risultato precedente (anche scaduto)
+    viene eseguito un refresh incrementale: solo le righe con watermark >= ultimo valore
+    meno la finestra di ricalcolo, unite alle righe precedenti in Arrow.
+
+    Policy del report applicate:
+    - cache_ttl_seconds: durata in cache (default RESULT_CACHE_TTL_SECONDS)
+    - max_rows: righe massime lette dal cursore (risultato marcato come troncato)
+    - timeout_seconds: TimeoutError se il server sorgente non risponde in tempo
+    - priority: classe di concorrenza verso il server sorgente
+    - partition_column: query divisa in sotto-query parallele (vedi partitioning)
+    - version_query / change_tables: un risultato scaduto con dati sorgente invariati
+      viene rinnovato senza rieseguire la query
+
+    Con la cache su disco (condivisa tra i worker) il lock su file per report segnala
+    il calcolo in corso: lo stesso report viene calcolato una volta per host; chi trova
+    il lock occupato non lo attende ma controlla il livello disco finché il risultato
+    non viene pubblicato (o il lock si libera senza risultato: calcola lui).
+
+    Args:
+        refresh: ignora la cache valida e riesegue (incrementale se possibile)
+        full_refresh: riesegue sempre la query completa
+        on_phase: chiamata alle fasi "queued" (attesa lock/slot), "executing" e "converting"
+        on_batch: riceve i blocchi appena letti dal cursore (solo esecuzione completa
+            non partizionata, source "full"); negli altri casi il risultato è solo nel return
+        config: configurazione già decifrata del server (batch di più report sullo stesso server)
+    """
+    key = result_cache.report_key(report.id)
+    forced = refresh or full_refresh
+
+    if settings.RESULT_CACHE_ENABLED and not forced:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return ReportResult(cached.table, "cache")
+
+    if on_phase is not None:
+        await on_phase("queued")
+
+    if not settings.RESULT_CACHE_ENABLED or result_cache.disk is None:
+        return await _execute_report(report, server, key, refresh, full_refresh, on_phase, on_batch, config)
+
+    lock = named_lock(key)
+    if not lock.try_acquire():
+        published = await _wait_for_published(key, lock, forced)
+        if published is not None:
+            return published
+        if not lock.locked:
+            logger.warning(f"Report {report.id}: attesa del risultato scaduta, esecuzione senza coordinamento")
+            return await _execute_report(report, server, key, refresh, full_refresh, on_phase, on_batch, config)
+
+    try:
+        # Calcolato da un altro worker durante l'attesa
+        if not forced:
+            cached = result_cache.get(key, revalidate=True)
+            if cached is not None:
+                return ReportResult(cached.table, "cache")
+        return await _execute_report(report, server, key, refresh, full_refresh, on_phase, on_batch, config)
+    finally:
+        lock.release()
+
+
+async def _wait_for_published(key: str, lock: FileLock, forced: bool) -> Optional[ReportResult]:
+    """
+    Attesa del risultato calcolato da un altro worker (o richiesta) che tiene il lock
+    Il lock non viene atteso: si controlla la versione su disco del risultato.
+
+    Returns:
+        il risultato pubblicato; None se il lock si è liberato senza un nuovo risultato
+        (lock acquisito, il chiamante esegue) o se l'attesa è scaduta (lock non acquisito)
+    """
+    start_version = result_cache.disk.meta_mtime(key)
+    deadline = time.monotonic() + settings.HOST_LOCK_WAIT_SECONDS
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(_PUBLISH_POLL_SECONDS)
+        # Refresh forzato: serve un risultato più recente di quello presente all'inizio
+        if not forced or result_cache.disk.meta_mtime(key) != start_version:
+            cached = result_cache.get(key, revalidate=True)
+            if cached is not None:
+                return ReportResult(cached.table, "cache")
+        if lock.try_acquire():
+            return None
+
+    return None
+
+
+async def _execute_report(
+    report: Report,
+    server: DBServer,
+    key: str,
+    refresh: bool,
+    full_refresh: bool,
+    on_phase: Optional[PhaseCallback] = None,
+    on_batch: Optional[BatchCallback] = None,
+    config: Optional[Dict[str, Any]] = None
+) -> ReportResult:
+    """Validazione del segnale di modifica, refresh incrementale o esecuzione completa"""
+    config = config or build_server_config(server)
+    previous = result_cache.peek(key, revalidate=True) if settings.RESULT_CACHE_ENABLED else None
+    tracked = settings.RESULT_CACHE_ENABLED and change_detector.tracks(report)
+
+    if tracked and previous is not None and not (refresh or full_refresh):
+        if await change_detector.is_unchanged(report, server, config, previous.signal):
+            result_cache.touch(key)
+            return ReportResult(previous.table, "validated")
+
+    signal = await _read_signal(report, server, config) if tracked else None
+
+    async with priority_slot(report.priority):
+        if on_phase is not None:
+            await on_phase("executing")
+
+        if report.watermark_column and previous is not None and not full_refresh:
+            table = await _incremental_refresh(report, server, config, previous.table)
+            if table is not None:
+                table = apply_row_limit(table, report.max_rows)
+                await run_in_threadpool(result_cache.put, key, table, report.cache_ttl_seconds, signal)
+                return ReportResult(table, "incremental")
+
+        # Una riga in più del limite per sapere se il risultato è troncato
+        fetch_rows = report.max_rows + 1 if report.max_rows else None
+        if report.partition_column:
+            table = await execute_partitioned(
+                server_id=str(server.id),
+                db_type=server.db_type,
+                config=config,
+                query=report.sql_query,
+                column=report.partition_column,
+                count=report.partition_count,
+                ranges=report.partition_ranges,
+                max_rows=fetch_rows,
+                timeout_seconds=report.timeout_seconds
+            )
+        elif on_batch is not None:
+            table = await _stream_report(report, server, config, fetch_rows, on_batch)
+        else:
+            table = await db_engine.execute_arrow(
+                server_id=str(server.id),
+                db_type=server.db_type,
+                config=config,
+                query=report.sql_query,
+                max_rows=fetch_rows,
+                timeout_seconds=report.timeout_seconds
+            )
+
+    if on_phase is not None:
+        await on_phase("converting")
+    table = apply_row_limit(table, report.max_rows)
+
+    if settings.RESULT_CACHE_ENABLED:
+        await run_in_threadpool(result_cache.put, key, table, report.cache_ttl_seconds, signal)
+
+    return ReportResult(table, "partitioned" if report.partition_column else "full")
+
+
+async def _stream_report(
+    report: Report,
+    server: DBServer,
+    config: Dict[str, Any],
+    fetch_rows: Optional[int],
+    on_batch: BatchCallback
+) -> pa.Table:
+    """Esecuzione completa con i blocchi inoltrati a on_batch man mano che arrivano"""
+    batches: List[pa.RecordBatch] = []
+    sent = 0
+    stream = db_engine.stream_arrow(
+        server_id=str(server.id),
+        db_type=server.db_type,
+        config=config,
+        query=report.sql_query,
+        max_rows=fetch_rows,
+        timeout_seconds=report.timeout_seconds
+    )
+    try:
+        async for batch in stream:
+            batches.append(batch)
+            # La riga oltre max_rows serve solo a rilevare il troncamento
+            if report.max_rows:
+                batch = batch.slice(0, max(0, report.max_rows - sent))
+            if batch.num_rows or not sent:
+                sent += batch.num_rows
+                await on_batch(batch)
+    finally:
+        await stream.aclose()
+
+    return await run_in_threadpool(ArrowConverter.batches_to_table, batches)
+
+
+async def _read_signal(report: Report, server: DBServer, config: Dict[str, Any]) -> Optional[str]:
+    """Segnale di modifica letto prima della query dati (None se non disponibile)"""
+    try:
+        return await change_detector.read_signal(report, server, config)
+    except Exception as e:
+        logger.warning(f"Report {report.id}: segnale di modifica non disponibile: {e}")
+        return None
+
+
+def _watermark_lower_bound(value: Any, lookback: Optional[int]) -> Any:
+    """
+    Ultimo watermark meno la finestra di ricalcolo (giorni per le date, unità per i numeri)
+    come valore tipizzato per il driver: le date serializzate in ISO dalla conversione
+    Arrow diventano date/datetime, i datetime sono troncati al millisecondo
+    (precisione di datetime SQL Server, i microsecondi falliscono il confronto)
+    """
+    value = bind_value(value)
+
+    if lookback:
+        if isinstance(value, (int, float)):
+            value = value - lookback
+        elif isinstance(value, (datetime, date)):
+            value = value - timedelta(days=lookback)
+
+    if isinstance(value, datetime):
+        value = value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+async def _incremental_refresh(
+    report: Report,
+    server: DBServer,
+    config: Dict[str, Any],
+    previous: pa.Table
+) -> Optional[pa.Table]:
+    """
+    Righe nuove/modificate dal server + righe precedenti sotto il limite inferiore
+    Restituisce None se il refresh incrementale non è applicabile (refresh completo)
+    """
+    column = report.watermark_column
+    if column not in previous.column_names or previous.num_rows == 0:
+        return None
+
+    # Risultato precedente tagliato a max_rows: le righe mancanti non tornerebbero più
+    if is_truncated(previous):
+        return None
+
+    last_watermark = pc.max(previous[column]).as_py()
+    if last_watermark is None:
+        return None
+
+    lower_bound = _watermark_lower_bound(last_watermark, report.watermark_lookback)
+
+    query, params = db_engine.build_pushdown_query(
+        db_type=server.db_type,
+        query=report.sql_query,
+        filters=[{"column": column, "op": ">=", "value": lower_bound}]
+    )
+    delta = await db_engine.execute_arrow(
+        server_id=str(server.id),
+        db_type=server.db_type,
+        config=config,
+        query=query,
+        params=params,
+        timeout_seconds=report.timeout_seconds
+    )
+
+    if delta.column_names != previous.column_names:
+        logger.warning(f"Report {report.id}: colonne cambiate, refresh completo")
+        return None
+
+    # Righe precedenti sotto il limite (i watermark NULL restano: la query delta non li rilegge)
+    column_type = previous.schema.field(column).type
+    # Colonne testo (date in ISO): confronto sulla stessa forma serializzata
+    mask_bound = lower_bound.isoformat() if pa.types.is_string(column_type) and isinstance(lower_bound, date) else lower_bound
+    keep_mask = pc.fill_null(
+        pc.less(previous[column], pa.scalar(mask_bound, type=column_type)),
+        True
+    )
+    kept = previous.filter(keep_mask)
+
+    # Con la chiave primaria una riga riletta dal server sostituisce sempre quella precedente
+    keys = report_primary_key(report)
+    if keys and delta.num_rows and all(k in kept.column_names for k in keys):
+        try:
+            kept = kept.join(delta.select(keys), keys=keys, join_type="left anti")
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            logger.warning(f"Report {report.id}: chiave non confrontabile, refresh completo")
+            return None
+
+    logger.info(
+        f"Report {report.id}: refresh incrementale da {lower_bound} "
+        f"({kept.num_rows} righe mantenute, {delta.num_rows} aggiornate)"
+    )
+    return ArrowConverter.concat_tables([kept, delta])
@@ -0,0 +1,517 @@
+"""
+Cache dei risultati dei report (Table Arrow)
+Base per le ri-analisi (DuckDB) senza tornare sul server sorgente
+Due livelli: memoria (per processo) e disco (Arrow IPC memory-mapped,
+sopravvive ai riavvii e condiviso tra i worker dello stesso host)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pyarrow as pa
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# File dati non referenziati più vecchi di così vengono rimossi (scritture in corso escluse)
+_ORPHAN_GRACE_SECONDS = 300
+# Rilettura completa della cartella (scritture di altri worker, file orfani)
+_RESCAN_SECONDS = 60
+
+
+def _open_noatime(path: str, flags: int) -> int:
+    """
+    Apertura senza aggiornare l'atime (Linux, relatime): l'atime dei metadati
+    è l'ultimo accesso per l'eviction LRU e viene impostato solo da load()
+    """
+    noatime = getattr(os, "O_NOATIME", 0)
+    if noatime:
+        try:
+            return os.open(path, flags | noatime)
+        except PermissionError:
+            # O_NOATIME solo per il proprietario del file
+            pass
+    return os.open(path, flags)
+
+
+@dataclass
+class CachedResult:
+    table: pa.Table
+    created_at: float
+    ttl_seconds: int
+    # Segnale di modifica dei dati sorgente al momento dell'esecuzione (change detection)
+    signal: Optional[str] = None
+    # mtime del file metadati su disco alla lettura/scrittura (None = solo memoria)
+    disk_mtime_ns: Optional[int] = None
+    # Ultimo confronto con la versione su disco (time.monotonic)
+    disk_checked_at: float = 0.0
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.created_at
+
+    @property
+    def expired(self) -> bool:
+        return self.age_seconds > self.ttl_seconds
+
+
+class DiskResultStore:
+    """
+    Risultati su disco: <hash>-<versione>.arrow (IPC file, non compresso per il
+    memory-mapping) + <hash>.json (metadati: chiave, creazione, TTL, segnale, file dati)
+    - Scritture atomiche (file temporaneo + rename), nuova versione del file dati
+      a ogni scrittura: un file mappato da un altro processo non viene mai riscritto
+    - Quota con eviction LRU sull'ultimo accesso (atime dei metadati, aggiornato a mano)
+    - Indice in memoria (metadati -> ultimo accesso, dimensione, file dati): a ogni
+      scrittura vengono letti solo i metadati nuovi (anche di altri worker); rilettura
+      completa ogni _RESCAN_SECONDS e prima di ogni eviction (quota condivisa)
+    - File dati letti con memory-map chiuso subito dopo la lettura: il mapping resta
+      solo finché la Table è referenziata (rilasciato quando esce dalla cache in memoria)
+    """
+
+    def __init__(self, base_path: Path, max_bytes: int):
+        self.base_path = base_path
+        self.max_bytes = max_bytes
+        self._index: Dict[str, Tuple[float, int, str]] = {}
+        self._index_lock = threading.Lock()
+        self._scanned_at: Optional[float] = None
+        self._dir_mtime: Optional[int] = None
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:40]
+
+    def _meta_path(self, key: str) -> Path:
+        return self.base_path / f"{self._name(key)}.json"
+
+    def meta_mtime(self, key: str) -> Optional[int]:
+        """Versione su disco di un risultato (None se assente)"""
+        try:
+            return self._meta_path(key).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_meta(self, path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8", opener=_open_noatime) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Result cache: metadati illeggibili {path.name}: {e}")
+            return None
+
+    def _write_meta(self, key: str, meta: Dict[str, Any]) -> int:
+        path = self._meta_path(key)
+        tmp_path = self.base_path / f".{path.name}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+        return path.stat().st_mtime_ns
+
+    def load(self, key: str) -> Optional[CachedResult]:
+        """Risultato su disco, memory-mapped (anche se scaduto)"""
+        meta_path = self._meta_path(key)
+        meta = self._read_meta(meta_path)
+        if meta is None or meta.get("key") != key:
+            return None
+
+        try:
+            mtime_ns = meta_path.stat().st_mtime_ns
+            # Handle chiuso subito: i buffer della Table mantengono solo il mapping
+            with pa.memory_map(str(self.base_path / meta["file"]), "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+        except (OSError, KeyError, pa.ArrowInvalid) as e:
+            logger.warning(f"Result cache: file dati non leggibile per {key}: {e}")
+            return None
+
+        # Ultimo accesso per l'eviction LRU (mtime invariato: è la versione)
+        now_ns = time.time_ns()
+        try:
+            os.utime(meta_path, ns=(now_ns, mtime_ns))
+        except OSError:
+            pass
+        with self._index_lock:
+            self._index[meta_path.name] = (now_ns / 1e9, meta.get("size", 0), meta["file"])
+
+        return CachedResult(
+            table=table,
+            created_at=meta["created_at"],
+            ttl_seconds=meta["ttl_seconds"],
+            signal=meta.get("signal"),
+            disk_mtime_ns=mtime_ns
+        )
+
+    def write(self, key: str, entry: CachedResult) -> Optional[int]:
+        """Salva un risultato, restituisce la versione dei metadati (None se oltre quota)"""
+        if entry.table.nbytes > self.max_bytes:
+            return None
+
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        name = self._name(key)
+        previous = self._read_meta(self._meta_path(key))
+
+        data_file = f"{name}-{time.time_ns()}.arrow"
+        tmp_path = self.base_path / f".{data_file}.{uuid.uuid4().hex}.tmp"
+        try:
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, entry.table.schema) as writer:
+                    writer.write_table(entry.table)
+            os.replace(tmp_path, self.base_path / data_file)
+        except OSError:
+            self._remove(tmp_path)
+            raise
+
+        size = (self.base_path / data_file).stat().st_size
+        mtime_ns = self._write_meta(key, {
+            "key": key,
+            "file": data_file,
+            "created_at": entry.created_at,
+            "ttl_seconds": entry.ttl_seconds,
+            "signal": entry.signal,
+            "rows": entry.table.num_rows,
+            "size": size,
+        })
+        with self._index_lock:
+            self._index[self._meta_path(key).name] = (time.time(), size, data_file)
+
+        if previous and previous.get("file") != data_file:
+            self._remove(self.base_path / previous["file"])
+
+        self._enforce_quota()
+        return mtime_ns
+
+    def update_created_at(self, key: str, created_at: float) -> Optional[int]:
+        """Aggiorna l'istante di creazione (rinnovo/scadenza), restituisce la nuova versione"""
+        meta = self._read_meta(self._meta_path(key))
+        if meta is None:
+            return None
+        meta["created_at"] = created_at
+        return self._write_meta(key, meta)
+
+    def remove(self, key: str):
+        meta_path = self._meta_path(key)
+        meta = self._read_meta(meta_path)
+        self._remove(meta_path)
+        if meta and meta.get("file"):
+            self._remove(self.base_path / meta["file"])
+        with self._index_lock:
+            self._index.pop(meta_path.name, None)
+
+    def clear(self):
+        if self.base_path.exists():
+            for path in self.base_path.iterdir():
+                if path.is_file():
+                    self._remove(path)
+        with self._index_lock:
+            self._index.clear()
+
+    def _scan(self):
+        """Ricostruisce l'indice dai metadati su disco e rimuove i file dati orfani"""
+        index: Dict[str, Tuple[float, int, str]] = {}
+        now = time.time()
+
+        for path in self.base_path.glob("*.json"):
+            meta = self._read_meta(path)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if meta is None or "file" not in meta:
+                continue
+            index[path.name] = (stat.st_atime, meta.get("size", 0), meta["file"])
+
+        # File dati di versioni precedenti non più referenziati (es. non rimovibili perché mappati)
+        referenced = {data_file for _, _, data_file in index.values()}
+        for path in self.base_path.glob("*.arrow"):
+            if path.name in referenced:
+                continue
+            try:
+                if now - path.stat().st_mtime > _ORPHAN_GRACE_SECONDS:
+                    self._remove(path)
+            except FileNotFoundError:
+                pass
+
+        with self._index_lock:
+            self._index = index
+            self._scanned_at = time.monotonic()
+
+    def _refresh_index(self, force: bool = False):
+        """
+        Allinea l'indice alla cartella: rilettura completa se richiesta o dopo _RESCAN_SECONDS,
+        altrimenti (cartella modificata) solo i metadati nuovi o rimossi, senza rileggere gli altri
+        """
+        try:
+            dir_mtime = self.base_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        if force or self._scanned_at is None or time.monotonic() - self._scanned_at > _RESCAN_SECONDS:
+            self._scan()
+            self._dir_mtime = dir_mtime
+            return
+        if dir_mtime == self._dir_mtime:
+            return
+
+        names = {path.name for path in self.base_path.glob("*.json")}
+        with self._index_lock:
+            known = set(self._index)
+            for name in known - names:
+                self._index.pop(name, None)
+        for name in names - known:
+            path = self.base_path / name
+            meta = self._read_meta(path)
+            try:
+                atime = path.stat().st_atime
+            except FileNotFoundError:
+                continue
+            if meta is not None and "file" in meta:
+                with self._index_lock:
+                    self._index[name] = (atime, meta.get("size", 0), meta["file"])
+        self._dir_mtime = dir_mtime
+
+    def _total_size(self) -> int:
+        with self._index_lock:
+            return sum(size for _, size, _ in self._index.values())
+
+    def _enforce_quota(self):
+        self._refresh_index()
+        if self._total_size() <= self.max_bytes:
+            return
+
+        # Oltre quota secondo l'indice: riletto per includere accessi e scritture degli altri worker
+        self._refresh_index(force=True)
+        with self._index_lock:
+            entries = sorted(self._index.items(), key=lambda item: item[1][0])
+        total_size = sum(size for _, (_, size, _) in entries)
+
+        for name, (_, size, data_file) in entries:
+            if total_size <= self.max_bytes:
+                break
+            meta = self._read_meta(self.base_path / name)
+            self._remove(self.base_path / name)
+            self._remove(self.base_path / data_file)
+            with self._index_lock:
+                self._index.pop(name, None)
+            total_size -= size
+            logger.info(f"Result cache: rimosso da disco {meta.get('key') if meta else name} (quota)")
+
+    def stats(self) -> Dict[str, Any]:
+        self._refresh_index()
+        with self._index_lock:
+            entries = len(self._index)
+        return {
+            "entries": entries,
+            "size_mb": round(self._total_size() / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+        }
+
+    @staticmethod
+    def _remove(path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Windows: file ancora mappato da un processo, ritentato alla prossima scansione
+            logger.debug(f"Result cache: impossibile rimuovere {path.name}: {e}")
+
+
+class ResultCache:
+    """
+    Risultati per report, con TTL e quota in MB
+    - Eviction LRU quando la quota è superata
+    - I risultati scaduti non vengono serviti ma restano disponibili per il refresh incrementale
+    - Le Table Arrow sono immutabili: condivise senza copia
+    - Con il livello disco: caricamento pigro (memory-mapped) dopo un riavvio e
+      allineamento tra worker tramite la versione dei metadati
+    """
+
+    def __init__(self, ttl_seconds: int, max_bytes: int, disk: Optional[DiskResultStore] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self._entries: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+
+        # Statistiche
+        self._hits = 0
+        self._misses = 0
+        self._disk_loads = 0
+
+    @staticmethod
+    def report_key(report_id: int) -> str:
+        return f"report:{report_id}"
+
+    def _lookup(self, key: str, revalidate: bool = False) -> Optional[CachedResult]:
+        """
+        Risultato in memoria, allineato alla versione su disco (lock già acquisito)
+        La versione su disco è riletta al più ogni RESULT_CACHE_DISK_CHECK_SECONDS
+        (revalidate=True: sempre)
+        """
+        entry = self._entries.get(key)
+        if self.disk is None:
+            return entry
+
+        now = time.monotonic()
+        if (entry is not None and not revalidate
+                and now - entry.disk_checked_at < settings.RESULT_CACHE_DISK_CHECK_SECONDS):
+            return entry
+
+        disk_mtime = self.disk.meta_mtime(key)
+        if entry is not None and entry.disk_mtime_ns == disk_mtime:
+            entry.disk_checked_at = now
+            return entry
+
+        # Assente in memoria, oppure riscritto/rimosso da un altro worker
+        self._remove(key)
+        if disk_mtime is None:
+            return None
+
+        entry = self.disk.load(key)
+        if entry is not None:
+            entry.disk_checked_at = now
+            self._disk_loads += 1
+            self._store(key, entry)
+        return entry
+
+    def get(self, key: str, revalidate: bool = False) -> Optional[CachedResult]:
+        """
+        Risultato in cache se presente e non scaduto
+        revalidate=True: confronto immediato con il disco (es. attesa di un altro worker)
+        """
+        with self._lock:
+            entry = self._lookup(key, revalidate)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            if entry.expired:
+                # Resta disponibile (fino a eviction) come base per il refresh incrementale
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def peek(self, key: str, revalidate: bool = False) -> Optional[CachedResult]:
+        """Risultato presente anche se scaduto (base per il refresh incrementale)"""
+        with self._lock:
+            return self._lookup(key, revalidate)
+
+    def put(
+        self,
+        key: str,
+        table: pa.Table,
+        ttl_seconds: Optional[int] = None,
+        signal: Optional[str] = None
+    ) -> CachedResult:
+        """Salva un risultato e applica la quota (scrittura su disco: chiamare da un thread)"""
+        entry = CachedResult(
+            table=table,
+            created_at=time.time(),
+            ttl_seconds=ttl_seconds if ttl_seconds is not None else self.ttl_seconds,
+            signal=signal
+        )
+
+        if self.disk is not None:
+            try:
+                entry.disk_mtime_ns = self.disk.write(key, entry)
+                entry.disk_checked_at = time.monotonic()
+            except OSError as e:
+                logger.warning(f"Result cache: scrittura su disco fallita per {key}: {e}")
+            if entry.disk_mtime_ns is None:
+                # Scrittura saltata (oltre quota) o fallita: la versione precedente su disco
+                # verrebbe ricaricata da _lookup al posto di questo risultato
+                self.disk.remove(key)
+
+        with self._lock:
+            self._remove(key)
+            self._store(key, entry)
+
+        return entry
+
+    def _store(self, key: str, entry: CachedResult):
+        """Inserisce in memoria e applica la quota (lock già acquisito)"""
+        if entry.table.nbytes > self.max_bytes:
+            logger.info(f"Result cache: {key} troppo grande ({entry.table.nbytes} bytes), non tenuto in memoria")
+            return
+
+        self._entries[key] = entry
+        self._size += entry.table.nbytes
+
+        while self._size > self.max_bytes and self._entries:
+            evicted_key = next(iter(self._entries))
+            self._remove(evicted_key)
+            logger.info(f"Result cache: rimosso {evicted_key} dalla memoria (quota)")
+
+    def _set_created_at(self, key: str, created_at: float):
+        with self._lock:
+            entry = self._lookup(key, revalidate=True)
+            if entry is None:
+                return
+            entry.created_at = created_at
+            self._entries.move_to_end(key)
+            if self.disk is not None:
+                entry.disk_mtime_ns = self.disk.update_created_at(key, created_at)
+                entry.disk_checked_at = time.monotonic()
+
+    def touch(self, key: str):
+        """Rinnova la validità di un risultato (dati sorgente invariati)"""
+        self._set_created_at(key, time.time())
+
+    def expire(self, key: str):
+        """Segna un risultato come scaduto senza rimuoverlo (resta la base del refresh incrementale)"""
+        self._set_created_at(key, 0.0)
+
+    def invalidate(self, key: Optional[str] = None):
+        """Rimuove un risultato (o tutti), anche dal disco"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._size = 0
+                if self.disk is not None:
+                    self.disk.clear()
+            else:
+                self._remove(key)
+                if self.disk is not None:
+                    self.disk.remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.table.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.RESULT_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "size_mb": round(self._size / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+            "hits": self._hits,
+            "misses": self._misses,
+            "disk_loads": self._disk_loads,
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+# Istanza globale
+result_cache = ResultCache(
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+    max_bytes=settings.RESULT_CACHE_MAX_MB * 1024 * 1024,
+    disk=DiskResultStore(
+        base_path=settings.RESULT_CACHE_PATH,
+        max_bytes=settings.RESULT_CACHE_DISK_MAX_MB * 1024 * 1024
+    ) if settings.RESULT_CACHE_DISK_ENABLED else None
+)
@@ -0,0 +1,195 @@
+"""
+Versioni dei risultati dei report per le risposte delta
+Il client riceve un token di versione insieme al risultato; al refresh successivo
+lo ripresenta e riceve solo le righe inserite, modificate e cancellate
+(confronto sulla chiave primaria del report con join Arrow).
+Versioni su disco (Arrow IPC) condivise tra i worker: il token è valido su
+qualunque worker dello stesso host. Token sconosciuto = risultato completo.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def compute_delta(previous: pa.Table, current: pa.Table, keys: List[str]) -> Optional[Dict[str, pa.Table]]:
+    """
+    Differenze tra due risultati sulla chiave primaria
+    - insert: righe con chiave nuova
+    - update: righe con chiave esistente e almeno un valore diverso
+    - delete: solo colonne chiave delle righe sparite
+    Le righe con valori NULL non trovano corrispondenza nel join e vengono
+    sempre reinviate come update (idempotente per il client).
+
+    Returns:
+        None se i risultati non sono confrontabili (colonne cambiate, chiave assente)
+    """
+    if previous.column_names != current.column_names or not keys or any(k not in current.column_names for k in keys):
+        return None
+
+    if not previous.schema.equals(current.schema):
+        try:
+            previous = previous.cast(current.schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            return None
+
+    previous_keys = previous.select(keys)
+    if previous is current:
+        return {
+            "insert": current.slice(0, 0),
+            "update": current.slice(0, 0),
+            "delete": previous_keys.slice(0, 0),
+        }
+
+    # Righe nuove o modificate: nessuna riga identica nel risultato precedente
+    changed = current.join(previous, keys=current.column_names, join_type="left anti")
+    return {
+        "insert": changed.join(previous_keys, keys=keys, join_type="left anti"),
+        "update": changed.join(previous_keys, keys=keys, join_type="left semi"),
+        "delete": previous_keys.join(current.select(keys), keys=keys, join_type="left anti"),
+    }
+
+
+class ResultVersionStore:
+    """
+    Ultime versioni del risultato per report: <base>/<report_id>/<ns>-<token>.arrow
+    - Stessa Table registrata due volte dallo stesso worker (hit di cache) = stesso token
+    - Al massimo per_report versioni per report, spazio totale limitato:
+      eviction delle versioni più vecchie (la versione appena scritta resta)
+    Scritture e letture su disco: chiamare da un thread
+    """
+
+    def __init__(self, base_path: Path, per_report: int, max_bytes: int):
+        self.base_path = base_path
+        self.per_report = max(2, per_report)
+        self.max_bytes = max_bytes
+        # Ultima Table registrata per report in questo worker (senza trattenerla in memoria)
+        self._last: Dict[int, Tuple[str, "weakref.ref[pa.Table]"]] = {}
+        self._lock = threading.Lock()
+
+    def _report_dir(self, report_id: int) -> Path:
+        return self.base_path / str(int(report_id))
+
+    def _files(self, report_id: int) -> List[Path]:
+        """File delle versioni di un report, dalla più vecchia"""
+        report_dir = self._report_dir(report_id)
+        if not report_dir.exists():
+            return []
+        return sorted(report_dir.glob("*.arrow"))
+
+    def register(self, report_id: int, table: pa.Table) -> str:
+        """Token di versione del risultato attuale del report"""
+        with self._lock:
+            last = self._last.get(report_id)
+            if last is not None and last[1]() is table and self._path(report_id, last[0]) is not None:
+                return last[0]
+
+        token = uuid.uuid4().hex
+        report_dir = self._report_dir(report_id)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        path = report_dir / f"{time.time_ns()}-{token}.arrow"
+        tmp_path = report_dir / f".{path.name}.tmp"
+        try:
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        except OSError:
+            self._remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._last[report_id] = (token, weakref.ref(table))
+
+        for old in self._files(report_id)[:-self.per_report]:
+            self._remove(old)
+        self._enforce_quota(keep=path)
+        return token
+
+    def _path(self, report_id: int, token: str) -> Optional[Path]:
+        if not token or not _TOKEN_RE.match(token):
+            return None
+        matches = list(self._report_dir(report_id).glob(f"*-{token}.arrow"))
+        return matches[0] if matches else None
+
+    def get(self, report_id: int, token: str) -> Optional[pa.Table]:
+        """Versione del risultato (None se sconosciuta o già rimossa)"""
+        path = self._path(report_id, token)
+        if path is None:
+            return None
+        try:
+            # Lettura in memoria (non mappata): il file resta rimovibile da un altro worker
+            with pa.OSFile(str(path), "rb") as source:
+                return pa.ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowInvalid) as e:
+            logger.warning(f"Versioni risultati: {path.name} non leggibile: {e}")
+            return None
+
+    def invalidate(self, report_id: int):
+        with self._lock:
+            self._last.pop(report_id, None)
+        for path in self._files(report_id):
+            self._remove(path)
+
+    def _scan(self) -> List[Tuple[int, int, Path]]:
+        """Versioni su disco (mtime, dimensione, path)"""
+        entries = []
+        if not self.base_path.exists():
+            return entries
+        for path in self.base_path.glob("*/*.arrow"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def _enforce_quota(self, keep: Path):
+        entries = self._scan()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug(f"Versioni risultati: impossibile rimuovere {path.name}: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        entries = self._scan()
+        return {
+            "reports": len({path.parent for _, _, path in entries}),
+            "versions": len(entries),
+            "size_mb": round(sum(size for _, size, _ in entries) / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+        }
+
+
+# Istanza globale
+result_versions = ResultVersionStore(
+    base_path=settings.RESULT_VERSIONS_PATH,
+    per_report=settings.RESULT_VERSIONS_PER_REPORT,
+    max_bytes=settings.RESULT_VERSIONS_MAX_MB * 1024 * 1024
+)
@@ -0,0 +1,239 @@
+"""
+Scheduler dei refresh pianificati (pre-warming della cache risultati)
+Le pianificazioni sono nel DB interno (ReportSchedule), la logica cron in app.core.cron
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.cron import CronExpression
+from app.core.file_lock import FileLock, named_lock
+from app.core.models import SessionLocal, DBServer, Report, ReportSchedule
+from app.core.report_runner import run_report
+
+logger = logging.getLogger(__name__)
+
+
+def compute_next_run(cron: str, after: Optional[datetime] = None) -> datetime:
+    """Prossima esecuzione (ora locale) di un'espressione cron"""
+    return CronExpression(cron).next_after(after or datetime.now())
+
+
+def sync_report_schedule(db: Session, report: Report, previous_cron: Optional[str] = None):
+    """
+    Allinea le pianificazioni al campo refresh_schedule del report
+    (rimuove quella del valore precedente, crea quella del nuovo). Non esegue il commit.
+    """
+    if previous_cron == report.refresh_schedule:
+        return
+
+    if previous_cron:
+        db.query(ReportSchedule).filter(
+            ReportSchedule.report_id == report.id,
+            ReportSchedule.cron == previous_cron
+        ).delete(synchronize_session=False)
+
+    if report.refresh_schedule:
+        exists = db.query(ReportSchedule).filter(
+            ReportSchedule.report_id == report.id,
+            ReportSchedule.cron == report.refresh_schedule
+        ).first()
+        if not exists:
+            db.add(ReportSchedule(
+                report_id=report.id,
+                cron=report.refresh_schedule,
+                next_run_at=compute_next_run(report.refresh_schedule)
+            ))
+
+
+class ReportScheduler:
+    """
+    Esegue i refresh pianificati
+    - Controllo delle scadenze ogni SCHEDULER_TICK_SECONDS
+    - Jitter casuale per schedule, per distribuire il carico
+    - Semaforo per server sorgente (SCHEDULER_SERVER_CONCURRENCY)
+    - Un refresh alla volta per schedule, anche tra worker (lock su file per schedule:
+      "esegui ora" può partire in un worker diverso dal leader)
+    - Con più worker gira solo nel worker leader (lock su file); se il leader
+      termina il lock viene rilasciato e un altro worker subentra al tick successivo
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._leader = named_lock("scheduler-leader")
+        self._running: Set[int] = set()
+        self._jobs: Set[asyncio.Task] = set()
+        self._server_semaphores: Dict[int, asyncio.Semaphore] = {}
+
+        # Statistiche
+        self._runs_total = 0
+        self._errors_total = 0
+        self._last_tick: Optional[datetime] = None
+
+    async def start(self):
+        """Avvia il ciclo dello scheduler (chiamato allo startup)"""
+        if self._task is None and settings.SCHEDULER_ENABLED:
+            self._task = asyncio.create_task(self._loop())
+            logger.info("Scheduler refresh avviato")
+
+    async def close(self):
+        """Ferma il ciclo e annulla i refresh in corso (chiamato allo shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for job in list(self._jobs):
+            job.cancel()
+        if self._jobs:
+            await asyncio.gather(*self._jobs, return_exceptions=True)
+        self._leader.release()
+
+    async def _loop(self):
+        while True:
+            if self._leader.try_acquire():
+                try:
+                    await self.tick()
+                except Exception as e:
+                    logger.error(f"Errore scheduler: {e}")
+            await asyncio.sleep(settings.SCHEDULER_TICK_SECONDS)
+
+    async def tick(self):
+        """Avvia i refresh scaduti (query sul DB interno fuori dall'event loop)"""
+        now = datetime.now()
+        self._last_tick = now
+
+        for schedule_id, jitter_seconds in await asyncio.to_thread(self._claim_due, now):
+            if schedule_id not in self._running:
+                self.trigger(schedule_id, jitter_seconds=jitter_seconds)
+
+    @staticmethod
+    def _claim_due(now: datetime) -> List[Tuple[int, int]]:
+        """Pianificazioni scadute (id, jitter), con la prossima esecuzione già calcolata"""
+        db = SessionLocal()
+        try:
+            due = (
+                db.query(ReportSchedule)
+                .filter(ReportSchedule.is_active == True)  # noqa: E712
+                .filter((ReportSchedule.next_run_at == None) | (ReportSchedule.next_run_at <= now))  # noqa: E711
+                .all()
+            )
+
+            claimed = []
+            for schedule in due:
+                # Prossima esecuzione calcolata subito: un refresh lento non si accoda a se stesso
+                schedule.next_run_at = compute_next_run(schedule.cron, now)
+                claimed.append((schedule.id, schedule.jitter_seconds or 0))
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def trigger(self, schedule_id: int, jitter_seconds: int = 0) -> bool:
+        """Avvia il refresh di una pianificazione (False se già in corso, anche in un altro worker)"""
+        if schedule_id in self._running:
+            return False
+
+        lock = named_lock(f"schedule-{schedule_id}")
+        if not lock.try_acquire():
+            return False
+
+        self._running.add(schedule_id)
+        job = asyncio.create_task(self._run(schedule_id, jitter_seconds, lock))
+        self._jobs.add(job)
+        job.add_done_callback(self._jobs.discard)
+        return True
+
+    def _semaphore(self, server_id: int) -> asyncio.Semaphore:
+        if server_id not in self._server_semaphores:
+            self._server_semaphores[server_id] = asyncio.Semaphore(max(1, settings.SCHEDULER_SERVER_CONCURRENCY))
+        return self._server_semaphores[server_id]
+
+    @staticmethod
+    def _load(schedule_id: int) -> Optional[Tuple[Report, DBServer]]:
+        """Report e server di una pianificazione, staccati dalla sessione (None se non disponibili)"""
+        db = SessionLocal()
+        try:
+            schedule = db.query(ReportSchedule).filter(ReportSchedule.id == schedule_id).first()
+            report = db.query(Report).filter(Report.id == schedule.report_id).first() if schedule else None
+            server = db.query(DBServer).filter(DBServer.id == report.server_id).first() if report else None
+
+            if not schedule or not report or not report.is_active or not server or not server.is_active:
+                return None
+
+            db.expunge(report)
+            db.expunge(server)
+            return report, server
+        finally:
+            db.close()
+
+    @staticmethod
+    def _record(schedule_id: int, **values: Any):
+        """Aggiorna lo stato dell'ultima esecuzione di una pianificazione"""
+        db = SessionLocal()
+        try:
+            db.query(ReportSchedule).filter(ReportSchedule.id == schedule_id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _run(self, schedule_id: int, jitter_seconds: int, lock: FileLock):
+        """Refresh di una pianificazione, con il lock dello schedule già acquisito (rilasciato alla fine)"""
+        try:
+            if jitter_seconds > 0:
+                await asyncio.sleep(random.uniform(0, jitter_seconds))
+
+            loaded = await asyncio.to_thread(self._load, schedule_id)
+            if loaded is None:
+                logger.warning(f"Schedule {schedule_id}: report o server non disponibile, saltato")
+                return
+            report, server = loaded
+
+            async with self._semaphore(server.id):
+                await asyncio.to_thread(self._record, schedule_id, last_status="running", last_run_at=datetime.now())
+
+                outcome: Dict[str, Any] = {}
+                started = time.perf_counter()
+                try:
+                    result = await run_report(report, server, refresh=True)
+                    outcome = {"last_status": "ok", "last_rows": result.table.num_rows, "last_error": None}
+                except Exception as e:
+                    self._errors_total += 1
+                    outcome = {"last_status": "error", "last_error": str(e)}
+                    logger.error(f"Schedule {schedule_id}: refresh report {report.id} fallito: {e}")
+                finally:
+                    outcome["last_duration_ms"] = int((time.perf_counter() - started) * 1000)
+                    self._runs_total += 1
+                    await asyncio.to_thread(self._record, schedule_id, **outcome)
+
+            logger.info(
+                f"Schedule {schedule_id}: report {report.id} {outcome['last_status']} "
+                f"in {outcome['last_duration_ms']} ms"
+            )
+        finally:
+            self._running.discard(schedule_id)
+            lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.SCHEDULER_ENABLED,
+            "active": self._task is not None,
+            "leader": self._leader.locked,
+            "running": sorted(self._running),
+            "runs_total": self._runs_total,
+            "errors_total": self._errors_total,
+            "last_tick": self._last_tick.isoformat() if self._last_tick else None,
+        }
+
+
+# Istanza globale
+report_scheduler = ReportScheduler()
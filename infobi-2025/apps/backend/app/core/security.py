@@ -133,7 +133,13 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     """
     Dependency per estrarre e validare l'utente dal token JWT
     """
-    token = credentials.credentials
+    return get_user_from_token(credentials.credentials)
+
+
+def get_user_from_token(token: str) -> Dict[str, Any]:
+    """
+    Utente dal token JWT (anche fuori dall'header Authorization, es. WebSocket)
+    """
     payload = JWTHandler.decode_token(token)
     
     username = payload.get("sub")
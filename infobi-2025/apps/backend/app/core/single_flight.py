@@ -0,0 +1,71 @@
+"""
+Single-flight: esecuzioni identiche e contemporanee condividono un solo round-trip
+Chiave: server + SQL + parametri. Indipendente dalla cache dei risultati
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalescenza delle richieste in volo
+    - La prima richiesta avvia l'esecuzione, le successive con la stessa chiave la attendono
+    - Il risultato (es. Table Arrow, immutabile) viene condiviso da tutte
+    - Se una richiesta viene annullata l'esecuzione prosegue per le altre
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+        # Statistiche
+        self._executions = 0
+        self._coalesced = 0
+        self._errors = 0
+
+    @staticmethod
+    def make_key(server_id: str, query: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Chiave normalizzata (parametri ordinati)"""
+        normalized_params = json.dumps(params or {}, sort_keys=True, separators=(",", ":"), default=str)
+        raw_key = f"{server_id}|{query}|{normalized_params}"
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Esegue fn una sola volta per chiave tra le richieste contemporanee"""
+        task = self._in_flight.get(key)
+
+        if task is None:
+            self._executions += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self._coalesced += 1
+            logger.debug(f"Single-flight: richiesta accodata a esecuzione in corso ({key[:12]})")
+
+        # shield: l'annullamento di un chiamante non interrompe la query condivisa
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self._errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._executions + self._coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+            "errors": self._errors,
+            "coalesced_ratio": round(self._coalesced / total, 4) if total else 0.0,
+        }
+
+
+# Istanza globale
+query_coalescer = SingleFlight()
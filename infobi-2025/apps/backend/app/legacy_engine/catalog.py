@@ -0,0 +1,220 @@
+"""
+Catalogo in memoria di query .qry e configurazioni .rep
+Costruito allo startup e aggiornato da una scansione periodica degli mtime:
+le richieste non toccano mai il disco
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def compute_etag(payload: Any) -> str:
+    """ETag forte calcolato sul JSON normalizzato"""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Confronto header If-None-Match (lista, '*' e prefisso W/ gestiti)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ReportCatalog:
+    """
+    Indice di .qry e .rep
+    - Elenco query raggruppato per categoria (come /api/v1/reports-list)
+    - Configurazioni .rep già parse, con ETag
+    - Rilettura solo dei file nuovi o modificati (mtime/size)
+    """
+
+    def __init__(self, queries_path: Path, reports_path: Path):
+        self.queries_path = queries_path
+        self.reports_path = reports_path
+
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._snapshot: Optional[Dict[Path, Tuple[int, int]]] = None
+
+        self._grouped: Dict[str, Any] = {}
+        self._grouped_etag = compute_etag({})
+        self._reports: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        self._last_scan: Optional[float] = None
+        self._scans = 0
+
+    # --- Scansione ---
+
+    @staticmethod
+    def _scan_files(root: Path, suffix: str) -> Dict[Path, Tuple[int, int]]:
+        files: Dict[Path, Tuple[int, int]] = {}
+        if not root.exists():
+            return files
+
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if not filename.endswith(suffix):
+                    continue
+                path = Path(dirpath) / filename
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def refresh(self) -> bool:
+        """
+        Aggiorna il catalogo dal disco (sincrono)
+        Returns: True se qualcosa è cambiato
+        """
+        queries_root = self.queries_path.resolve()
+        reports_root = self.reports_path.resolve()
+
+        query_files = self._scan_files(queries_root, ".qry")
+        report_files = self._scan_files(reports_root, ".rep")
+        snapshot = {**query_files, **report_files}
+
+        self._last_scan = time.time()
+        self._scans += 1
+
+        if self._snapshot is not None and snapshot == self._snapshot:
+            return False
+
+        grouped = self._build_grouped(queries_root, query_files)
+        reports = self._build_reports(reports_root, report_files)
+
+        with self._lock:
+            self._grouped = grouped
+            self._grouped_etag = compute_etag(grouped)
+            self._reports = reports
+            self._snapshot = snapshot
+
+        logger.info(f"Catalogo report aggiornato: {len(query_files)} query, {len(reports)} config")
+        return True
+
+    @staticmethod
+    def _build_grouped(root: Path, files: Dict[Path, Tuple[int, int]]) -> Dict[str, Any]:
+        """Elenco query raggruppato per categoria"""
+        if not root.exists():
+            return {"error": f"Cartella non trovata: {root}"}
+
+        grouped: Dict[str, Any] = {}
+        for path in sorted(files):
+            relative_path = path.relative_to(root)
+            # Nome categoria (cartella padre) o "Generale" se è nella root
+            category = relative_path.parent.name if relative_path.parent.name else "Generale"
+            grouped.setdefault(category.capitalize(), []).append({
+                "name": path.name.replace(".qry", ""),
+                # Sostituiamo backslash con slash per standard web
+                "path": str(relative_path).replace("\\", "/").replace(".qry", ""),
+                "category": category.capitalize()
+            })
+        return grouped
+
+    def _build_reports(
+        self,
+        root: Path,
+        files: Dict[Path, Tuple[int, int]]
+    ) -> Dict[str, Tuple[Dict[str, Any], str]]:
+        """Config .rep indicizzate per percorso relativo (senza estensione)"""
+        reports: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        for path, signature in files.items():
+            key = str(path.relative_to(root).with_suffix("")).replace("\\", "/")
+
+            # File invariato: riusa la config già parsata
+            if self._snapshot and self._snapshot.get(path) == signature and key in self._reports:
+                reports[key] = self._reports[key]
+                continue
+
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.warning(f"Config report non valida {path}: {e}")
+                continue
+
+            if "initialConfig" not in data:
+                logger.warning(f"{path}: manca 'initialConfig', la griglia non saprà raggruppare")
+            reports[key] = (data, compute_etag(data))
+        return reports
+
+    # --- Lettura ---
+
+    def list_grouped(self) -> Tuple[Dict[str, Any], str]:
+        """Elenco query raggruppato per categoria + ETag"""
+        return self._grouped, self._grouped_etag
+
+    def get_report_config(self, report_name: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """
+        Config .rep + ETag
+        Cerca prima con la stessa struttura della query (vendite/file),
+        poi nella root dei report (file)
+        """
+        key = report_name.replace("\\", "/").strip("/")
+        if key.endswith(".rep"):
+            key = key[:-4]
+
+        reports = self._reports
+        found = reports.get(key)
+        if found is None:
+            found = reports.get(key.rsplit("/", 1)[-1])
+        return found
+
+    # --- Ciclo di vita ---
+
+    async def start(self):
+        """Prima scansione e avvio dell'aggiornamento periodico (chiamato allo startup)"""
+        await run_in_threadpool(self.refresh)
+        if self._task is None and settings.CATALOG_SCAN_SECONDS > 0:
+            self._task = asyncio.create_task(self._scan_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _scan_loop(self):
+        while True:
+            await asyncio.sleep(settings.CATALOG_SCAN_SECONDS)
+            try:
+                await run_in_threadpool(self.refresh)
+            except Exception as e:
+                logger.warning(f"Scansione catalogo report fallita: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queries": sum(len(v) for v in self._grouped.values() if isinstance(v, list)),
+            "reports": len(self._reports),
+            "scans": self._scans,
+            "last_scan": self._last_scan,
+            "scan_seconds": settings.CATALOG_SCAN_SECONDS,
+        }
+
+
+# Istanza globale
+report_catalog = ReportCatalog(settings.QUERIES_PATH, settings.REPORTS_PATH)
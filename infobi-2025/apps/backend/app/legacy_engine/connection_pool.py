@@ -0,0 +1,154 @@
+"""
+Pool aioodbc condiviso per il Legacy Engine
+Creato una sola volta allo startup, riusato da tutte le query .qry
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aioodbc
+import pyodbc
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LegacyConnectionPool:
+    """
+    Pool persistente verso il SQL Server del gestionale
+    - Creazione allo startup (o lazy alla prima query se il server non era raggiungibile)
+    - Health-check periodico in background
+    - Statistiche d'uso per il monitoraggio
+    """
+
+    def __init__(self):
+        self._pool: Optional[aioodbc.Pool] = None
+        self._lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+
+        # Statistiche
+        self._in_use = 0
+        self._acquired_total = 0
+        self._errors_total = 0
+        self._wait_time_total = 0.0
+        self._healthy: Optional[bool] = None
+        self._last_health_check: Optional[float] = None
+        self._last_error: Optional[str] = None
+
+    async def start(self):
+        """Crea il pool e avvia l'health-check (chiamato allo startup)"""
+        try:
+            await self._ensure_pool()
+        except Exception as e:
+            # Il backend parte comunque: il pool verrà creato alla prima query
+            logger.warning(f"Pool legacy non disponibile allo startup: {e}")
+
+        if self._health_task is None and settings.LEGACY_POOL_HEALTHCHECK_SECONDS > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        """Chiude il pool e ferma l'health-check (chiamato allo shutdown)"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+        async with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                await self._pool.wait_closed()
+                self._pool = None
+                logger.info("Pool legacy chiuso")
+
+    async def _ensure_pool(self) -> aioodbc.Pool:
+        if self._pool is not None and not self._pool.closed:
+            return self._pool
+
+        async with self._lock:
+            if self._pool is None or self._pool.closed:
+                self._pool = await aioodbc.create_pool(
+                    dsn=settings.SQL_CONNECTION_STRING,
+                    minsize=settings.LEGACY_POOL_MIN_SIZE,
+                    maxsize=settings.LEGACY_POOL_MAX_SIZE,
+                    pool_recycle=settings.LEGACY_POOL_RECYCLE_SECONDS,
+                )
+                logger.info(
+                    f"Pool legacy creato (min={settings.LEGACY_POOL_MIN_SIZE}, "
+                    f"max={settings.LEGACY_POOL_MAX_SIZE})"
+                )
+            return self._pool
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aioodbc.Connection]:
+        """Ottiene una connessione dal pool (context manager asincrono)"""
+        pool = await self._ensure_pool()
+
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            self._wait_time_total += time.perf_counter() - started
+            self._acquired_total += 1
+            self._in_use += 1
+            try:
+                yield conn
+            except (pyodbc.OperationalError, pyodbc.InterfaceError) as e:
+                # Connessione compromessa: chiusa, così il pool non la riusa
+                self._errors_total += 1
+                self._last_error = str(e)
+                await conn.close()
+                raise
+            except Exception as e:
+                self._errors_total += 1
+                self._last_error = str(e)
+                raise
+            finally:
+                self._in_use -= 1
+
+    async def health_check(self) -> bool:
+        """Verifica la connessione con SELECT 1"""
+        self._last_health_check = time.time()
+        try:
+            async with self.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("SELECT 1")
+                    await cur.fetchone()
+            self._healthy = True
+        except Exception as e:
+            self._healthy = False
+            self._last_error = str(e)
+            logger.warning(f"Health-check pool legacy fallito: {e}")
+
+        return self._healthy
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(settings.LEGACY_POOL_HEALTHCHECK_SECONDS)
+            await self.health_check()
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiche d'uso del pool"""
+        pool = self._pool
+        return {
+            "active": pool is not None and not pool.closed,
+            "minsize": settings.LEGACY_POOL_MIN_SIZE,
+            "maxsize": settings.LEGACY_POOL_MAX_SIZE,
+            "size": pool.size if pool else 0,
+            "free": pool.freesize if pool else 0,
+            "in_use": self._in_use,
+            "acquired_total": self._acquired_total,
+            "errors_total": self._errors_total,
+            "avg_wait_ms": round(self._wait_time_total / self._acquired_total * 1000, 2)
+            if self._acquired_total else 0.0,
+            "healthy": self._healthy,
+            "last_health_check": self._last_health_check,
+            "last_error": self._last_error,
+        }
+
+
+# Istanza globale
+legacy_pool = LegacyConnectionPool()
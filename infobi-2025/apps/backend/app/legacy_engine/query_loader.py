@@ -1,17 +1,36 @@
-import aioodbc
-import os
 import re
+import asyncio
 import datetime
-from decimal import Decimal
-from typing import List, Dict, Any
+import logging
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator
+import pyarrow as pa
 from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.core.arrow_utils import ArrowConverter
+from app.legacy_engine.connection_pool import legacy_pool
+from app.legacy_engine.template_cache import QueryTemplateCache
+from app.legacy_engine.sql_rewriter import rewrite_query, SqlRewriteError
+from app.legacy_engine.snapshots import snapshot_store
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# Scenari di filtro: ognuno produce una forma compilata diversa della .qry
+SCENARIO_YEARS = "years"
+SCENARIO_DATES = "dates"
+SCENARIO_NONE = "none"
+
+# Colonna aggiunta ai risultati multi-azienda
+COMPANY_COLUMN = "Azienda"
+
+# {{AZIENDA}} durante la riscrittura: parte di identificatore valida per il parser SQL
+COMPANY_PLACEHOLDER = "INFOBI__AZIENDA__"
+
 class LegacyQueryEngine:
     
     @staticmethod
-    def _read_query_file(query_path_str: str) -> str:
+    def _resolve_query_path(query_path_str: str) -> Path:
         clean_path = Path(query_path_str)
         if not clean_path.name.endswith(".qry"):
             clean_path = clean_path.with_suffix(".qry")
@@ -23,28 +42,75 @@ class LegacyQueryEngine:
             
         if not full_path.exists():
             raise HTTPException(status_code=404, detail=f"Query '{clean_path}' non trovata")
-            
-        try:
-            with open(full_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Errore lettura file: {str(e)}")
+        
+        return full_path
 
     @staticmethod
-    async def execute(query_name: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        if params is None:
-            params = {}
+    def _read_query_file(query_path_str: str) -> str:
+        return query_template_cache.get_raw(query_path_str)
 
-        # 1. Caricamento Query Base
-        raw_sql = LegacyQueryEngine._read_query_file(query_name)
-        final_query = raw_sql
-        sql_parameters = []
+    @staticmethod
+    def _resolve_scenario(params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """
+        Determina lo scenario di filtro e i parametri SQL da passare al cursore
+        - years: confronto tra due esercizi (year1, year2)
+        - dates: intervallo di date (date_from, date_to)
+        - none: nessun filtro
+        """
+        year1 = params.get('year1')
+        year2 = params.get('year2')
+        date_from = params.get('date_from')
+        date_to = params.get('date_to')
 
-        # 2. Gestione Codice Azienda (Sostituzione {{AZIENDA}})
-        codazi = params.get('codazi', '')
+        # SCENARIO A: Filtro per Anni (Confronto)
+        if year1 is not None and year2 is not None:
+            try:
+                return SCENARIO_YEARS, [int(year1), int(year2)]
+            except ValueError:
+                logger.warning(f"Errore conversione anni: {year1}, {year2}")
+
+        # SCENARIO B: Filtro per Date (Range)
+        if date_from and date_to:
+            # SQL Server vuole date in formato 'YYYY-MM-DD' o parametri datetime
+            return SCENARIO_DATES, [date_from, date_to]
+
+        return SCENARIO_NONE, []
+
+    @staticmethod
+    def _clean_codazi(params: Dict[str, Any]) -> str:
         # Sanitizzazione base per evitare injection brutali sul nome tabella
-        codazi_clean = re.sub(r'[^a-zA-Z0-9_]', '', codazi)
-        final_query = final_query.replace('{{AZIENDA}}', codazi_clean)
+        codazi = params.get('codazi', '')
+        return re.sub(r'[^a-zA-Z0-9_]', '', codazi)
+
+    @staticmethod
+    def _prepare(query_name: str, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """SQL compilato (dalla cache) + parametri per l'esecuzione"""
+        codazi_clean = LegacyQueryEngine._clean_codazi(params)
+
+        scenario, sql_parameters = LegacyQueryEngine._resolve_scenario(params)
+        final_query, parameter_sets = query_template_cache.get_compiled(query_name, scenario, codazi_clean)
+        # Con UNION i filtri sono iniettati in ogni ramo: parametri ripetuti
+        return final_query, sql_parameters * parameter_sets
+
+    @staticmethod
+    def compile_query(raw_sql: str, scenario: str, codazi_clean: str) -> Tuple[str, int]:
+        """
+        Applica al testo .qry le sostituzioni e la chirurgia SQL dello scenario
+        Dipende solo da (testo, scenario, azienda): il risultato è cacheabile,
+        i valori dei filtri viaggiano come parametri (?)
+
+        Returns:
+            (SQL compilato, quante volte ripetere i parametri dei filtri)
+        """
+        # 2. Gestione Codice Azienda: sostituita dopo la chirurgia, perché il codice
+        # (es. 01) davanti al nome tabella (01INFOVBI) non è un identificatore analizzabile
+        template = raw_sql.replace('{{AZIENDA}}', COMPANY_PLACEHOLDER)
+        final_query, parameter_sets = LegacyQueryEngine._compile_template(template, scenario)
+        return final_query.replace(COMPANY_PLACEHOLDER, codazi_clean), parameter_sets
+
+    @staticmethod
+    def _compile_template(final_query: str, scenario: str) -> Tuple[str, int]:
+        """Filtri, colonna Esercizio e {{_COSTO_}} dello scenario (azienda ancora come segnaposto)"""
 
         # --- LOGICA DI FILTRO (PORTING DA DB_UTILS) ---
         where_conditions = []
@@ -55,32 +121,21 @@ class LegacyQueryEngine:
         esercizio_select_sql = ""
         esercizio_group_by_expression = ""
 
-        year1 = params.get('year1')
-        year2 = params.get('year2')
-        date_from = params.get('date_from')
-        date_to = params.get('date_to')
-
         # SCENARIO A: Filtro per Anni (Confronto)
-        if year1 is not None and year2 is not None:
-            try:
-                where_conditions.append("year(mvdatdoc) IN (?, ?)")
-                sql_parameters.extend([int(year1), int(year2)])
-                
-                # Logica costo complessa per confronto anni
-                costo_to_replace_with = 'case when year(MVDATDOC)=year(getdate()) then costo else costoe end'
-                
-                # Preparazione iniezione colonna Esercizio
-                esercizio_select_sql = "rtrim(str(year(MVDATDOC),4,0)) as Esercizio"
-                esercizio_group_by_expression = "rtrim(str(year(MVDATDOC),4,0))"
-                add_esercizio_to_query = True
-            except ValueError:
-                print(f"Errore conversione anni: {year1}, {year2}")
+        if scenario == SCENARIO_YEARS:
+            where_conditions.append("year(mvdatdoc) IN (?, ?)")
+            
+            # Logica costo complessa per confronto anni
+            costo_to_replace_with = 'case when year(MVDATDOC)=year(getdate()) then costo else costoe end'
+            
+            # Preparazione iniezione colonna Esercizio
+            esercizio_select_sql = "rtrim(str(year(MVDATDOC),4,0)) as Esercizio"
+            esercizio_group_by_expression = "rtrim(str(year(MVDATDOC),4,0))"
+            add_esercizio_to_query = True
 
         # SCENARIO B: Filtro per Date (Range)
-        elif date_from and date_to:
-            # SQL Server vuole date in formato 'YYYY-MM-DD' o parametri datetime
+        elif scenario == SCENARIO_DATES:
             where_conditions.append("MVdatdoc >= CONVERT(DATETIME2, ?, 121) AND MVdatdoc <= CONVERT(DATETIME2, ?, 121)")
-            sql_parameters.extend([date_from, date_to])
             costo_to_replace_with = 'COSTO' # Usa il campo costo standard
 
         # 3. Gestione {{_COSTO_}}
@@ -92,6 +147,38 @@ class LegacyQueryEngine:
             if '{{_COSTO_}}' in final_query:
                 final_query = final_query.replace('{{_COSTO_}}', '0')
 
+        if not where_conditions and not add_esercizio_to_query:
+            return final_query, 1
+
+        # 4-6. CHIRURGIA SQL: riscrittura su AST (CTE, subquery e commenti gestiti)
+        if settings.LEGACY_SQL_REWRITER == "ast":
+            try:
+                return rewrite_query(
+                    final_query,
+                    select_expressions=[esercizio_select_sql] if add_esercizio_to_query else [],
+                    where_conditions=where_conditions,
+                    group_by_expressions=[esercizio_group_by_expression] if add_esercizio_to_query else []
+                )
+            except SqlRewriteError as e:
+                logger.warning(f"Riscrittura AST non riuscita, uso la chirurgia testuale: {e}")
+
+        return LegacyQueryEngine._string_surgery(
+            final_query,
+            where_conditions,
+            esercizio_select_sql if add_esercizio_to_query else "",
+            esercizio_group_by_expression if add_esercizio_to_query else ""
+        ), 1
+
+    @staticmethod
+    def _string_surgery(
+        final_query: str,
+        where_conditions: List[str],
+        esercizio_select_sql: str,
+        esercizio_group_by_expression: str
+    ) -> str:
+        """Chirurgia SQL testuale originale (fallback per SQL non analizzabile)"""
+        add_esercizio_to_query = bool(esercizio_select_sql)
+
         # 4. CHIRURGIA SQL: Iniezione colonna Esercizio nella SELECT
         if add_esercizio_to_query and esercizio_select_sql:
             from_pos = final_query.upper().find("FROM")
@@ -150,42 +237,201 @@ class LegacyQueryEngine:
                 else:
                      final_query += f" GROUP BY {esercizio_group_by_expression}"
 
-        # DEBUG: Fondamentale per vedere cosa abbiamo combinato
-        print(f"DEBUG SQL Eseguita:\n{final_query}")
-        print(f"DEBUG Parametri: {sql_parameters}")
+        return final_query
+
+    @staticmethod
+    async def iter_batches(
+        query_name: str,
+        params: Dict[str, Any] = None,
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[pa.RecordBatch]:
+        """
+        Esegue la .qry e restituisce i risultati a blocchi (RecordBatch Arrow)
+        Il cursore viene letto con fetchmany: conversione per colonna, niente dict per riga.
+        La connessione resta presa dal pool finché il generatore non è esaurito/chiuso.
+        """
+        if params is None:
+            params = {}
+        batch_size = batch_size or settings.STREAM_BATCH_SIZE
+
+        # Più aziende o esercizi chiusi da snapshot: l'unione è già materializzata,
+        # viene restituita a blocchi
+        if LegacyQueryEngine._is_multi_company(params) or LegacyQueryEngine._has_closed_years(params):
+            table = await LegacyQueryEngine.execute_arrow(query_name, params)
+            batches = table.to_batches(max_chunksize=batch_size)
+            for batch in batches or [pa.RecordBatch.from_pylist([], schema=table.schema)]:
+                yield batch
+            return
+
+        async for batch in LegacyQueryEngine._iter_live(query_name, params, batch_size):
+            yield batch
+
+    @staticmethod
+    async def _iter_live(
+        query_name: str,
+        params: Dict[str, Any],
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[pa.RecordBatch]:
+        """Blocchi letti dal server sorgente (una sola azienda, nessuno snapshot)"""
+        batch_size = batch_size or settings.STREAM_BATCH_SIZE
+
+        # 1. Query compilata dalla cache (.qry riletto solo se cambiato su disco)
+        final_query, sql_parameters = LegacyQueryEngine._prepare(query_name, params)
+
+        # Solo il numero dei parametri: i valori dei filtri non finiscono nei log
+        logger.debug(f"SQL eseguita ({len(sql_parameters)} parametri):\n{final_query}")
+
+        # 7. ESECUZIONE (pool condiviso creato allo startup)
+        async with legacy_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(final_query, tuple(sql_parameters))
+
+                if not cur.description:
+                    return
+
+                columns = [col[0] for col in cur.description]
+                emitted = False
+                while True:
+                    rows = await cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    emitted = True
+                    yield ArrowConverter.rows_to_record_batch(columns, rows)
+
+                # Nessuna riga: blocco vuoto per trasmettere comunque lo schema
+                if not emitted:
+                    yield ArrowConverter.rows_to_record_batch(columns, [])
+
+    @staticmethod
+    async def _collect(query_name: str, params: Dict[str, Any]) -> pa.Table:
+        batches = [batch async for batch in LegacyQueryEngine._iter_live(query_name, params)]
+        return ArrowConverter.batches_to_table(batches)
+
+    @staticmethod
+    async def execute_arrow(query_name: str, params: Dict[str, Any] = None) -> pa.Table:
+        """
+        Esegue la .qry e restituisce una Table Arrow
+        Nel confronto anni gli esercizi chiusi arrivano dagli snapshot Parquet
+        """
+        if params is None:
+            params = {}
+
+        if LegacyQueryEngine._is_multi_company(params):
+            return await LegacyQueryEngine._execute_companies(query_name, params)
 
-        # 7. ESECUZIONE
-        dsn = settings.SQL_CONNECTION_STRING
         try:
-            pool = await aioodbc.create_pool(dsn=dsn)
-            async with pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute(final_query, tuple(sql_parameters))
-                    rows = await cur.fetchall()
-                    
-                    if cur.description:
-                        columns = [col[0] for col in cur.description]
-                        # Conversione Decimal -> Float per JSON serialization
-                        results = []
-                        for row in rows:
-                            record = {}
-                            for col_name, val in zip(columns, row):
-                                if isinstance(val, Decimal):
-                                    record[col_name] = float(val)
-                                elif isinstance(val, (datetime.date, datetime.datetime)):
-                                    record[col_name] = val.isoformat()
-                                else:
-                                    record[col_name] = val
-                            results.append(record)
-                    else:
-                        results = []
-            
-            pool.close()
-            await pool.wait_closed()
-            return results
-            
+            if settings.LEGACY_SNAPSHOT_ENABLED:
+                scenario, sql_parameters = LegacyQueryEngine._resolve_scenario(params)
+                if scenario == SCENARIO_YEARS:
+                    return await LegacyQueryEngine._execute_years(query_name, params, sql_parameters)
+
+            return await LegacyQueryEngine._collect(query_name, params)
+        except HTTPException:
+            raise
         except Exception as e:
-            print(f"Errore SQL: {e}")
+            logger.error(f"Errore SQL: {e}")
             raise HTTPException(status_code=500, detail=f"Errore SQL Server: {str(e)}")
 
+    @staticmethod
+    def _is_multi_company(params: Dict[str, Any]) -> bool:
+        return isinstance(params.get('codazi'), (list, tuple))
+
+    @staticmethod
+    def _closed_year_cutoff() -> int:
+        """Ultimo esercizio chiuso (gli anni successivi sono sempre live)"""
+        return datetime.date.today().year - settings.LEGACY_SNAPSHOT_OPEN_YEARS
+
+    @staticmethod
+    def _has_closed_years(params: Dict[str, Any]) -> bool:
+        """Confronto anni con almeno un esercizio chiuso servito dagli snapshot"""
+        if not settings.LEGACY_SNAPSHOT_ENABLED:
+            return False
+        scenario, years = LegacyQueryEngine._resolve_scenario(params)
+        return scenario == SCENARIO_YEARS and min(years) <= LegacyQueryEngine._closed_year_cutoff()
+
+    @staticmethod
+    async def _execute_companies(query_name: str, params: Dict[str, Any]) -> pa.Table:
+        """
+        Esegue la .qry per più aziende in parallelo (max LEGACY_FANOUT_CONCURRENCY alla volta)
+        e unisce i risultati aggiungendo la colonna Azienda
+        """
+        companies = []
+        for codazi in params['codazi']:
+            codazi_clean = LegacyQueryEngine._clean_codazi({'codazi': str(codazi)})
+            if codazi_clean and codazi_clean not in companies:
+                companies.append(codazi_clean)
+
+        if not companies:
+            raise HTTPException(status_code=400, detail="Nessun codice azienda valido")
+
+        semaphore = asyncio.Semaphore(max(1, settings.LEGACY_FANOUT_CONCURRENCY))
+
+        async def _run(codazi: str) -> pa.Table:
+            async with semaphore:
+                table = await LegacyQueryEngine.execute_arrow(query_name, {**params, 'codazi': codazi})
+            return table.add_column(0, COMPANY_COLUMN, pa.array([codazi] * table.num_rows, type=pa.string()))
+
+        tables = await asyncio.gather(*(_run(codazi) for codazi in companies))
+        return ArrowConverter.concat_tables(tables)
+
+    @staticmethod
+    async def _execute_years(query_name: str, params: Dict[str, Any], years: List[int]) -> pa.Table:
+        """
+        Confronto anni: esercizi chiusi da snapshot, anni aperti live, unione in Arrow
+        La query raggruppa per Esercizio, quindi ogni anno è calcolabile separatamente
+        """
+        cutoff = LegacyQueryEngine._closed_year_cutoff()
+        years = sorted(set(years))
+        closed_years = [y for y in years if y <= cutoff]
+        live_years = [y for y in years if y > cutoff]
+
+        if not closed_years:
+            return await LegacyQueryEngine._collect(query_name, params)
+
+        parts = [LegacyQueryEngine._closed_year(query_name, params, y) for y in closed_years]
+        if live_years:
+            parts.append(LegacyQueryEngine._collect(
+                query_name, {**params, "year1": live_years[0], "year2": live_years[-1]}
+            ))
+
+        tables = await asyncio.gather(*parts)
+        return ArrowConverter.concat_tables(tables)
+
+    @staticmethod
+    async def _closed_year(query_name: str, params: Dict[str, Any], year: int) -> pa.Table:
+        """Risultato di un esercizio chiuso: snapshot se valido, altrimenti query + salvataggio"""
+        year_params = {**params, "year1": year, "year2": year}
+        codazi_clean = LegacyQueryEngine._clean_codazi(params)
+        final_query, _ = LegacyQueryEngine._prepare(query_name, year_params)
+        signature = snapshot_store.signature(final_query)
+
+        try:
+            table = await run_in_threadpool(snapshot_store.read, query_name, codazi_clean, year, signature)
+        except ValueError:
+            raise HTTPException(status_code=403, detail="Accesso negato.")
+        if table is not None:
+            return table
+
+        # Un solo build per anno: le richieste concorrenti attendono lo snapshot
+        async with snapshot_store.lock(query_name, codazi_clean, year):
+            table = await run_in_threadpool(snapshot_store.read, query_name, codazi_clean, year, signature)
+            if table is None:
+                table = await LegacyQueryEngine._collect(query_name, year_params)
+                await run_in_threadpool(snapshot_store.write, query_name, codazi_clean, year, signature, table)
+            return table
+
+    @staticmethod
+    async def execute(query_name: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Esegue la .qry e restituisce una lista di dizionari
+        Decimal -> float e date -> ISO già gestiti nella conversione Arrow
+        """
+        table = await LegacyQueryEngine.execute_arrow(query_name, params)
+        return table.to_pylist()
+
+query_template_cache = QueryTemplateCache(
+    resolve_path=LegacyQueryEngine._resolve_query_path,
+    compiler=LegacyQueryEngine.compile_query
+)
+
 legacy_engine = LegacyQueryEngine()
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Snapshot Parquet degli esercizi chiusi (Legacy Engine)
+Struttura: <base>/<query>/<azienda>/year=YYYY/part-0.parquet
+Ogni file porta nei metadati la firma dell'SQL che l'ha prodotto:
+se la .qry cambia lo snapshot non è più valido e viene rigenerato
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_KEY = b"infobi_signature"
+
+
+class YearSnapshotStore:
+    """
+    Risultati per esercizio chiuso, materializzati su disco
+    - Lettura memory-mapped
+    - Scrittura atomica (file temporaneo + rename)
+    - Un solo build concorrente per (query, azienda, anno)
+    """
+
+    def __init__(self, base_path: Path):
+        self.base_path = base_path
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+        # Statistiche
+        self._hits = 0
+        self._builds = 0
+
+    @staticmethod
+    def signature(sql: str) -> str:
+        """Firma dell'SQL compilato"""
+        return hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+    def _partition_dir(self, query_name: str, codazi: str, year: int) -> Path:
+        """
+        Cartella della partizione, sempre dentro base_path
+
+        Raises:
+            ValueError: nome query che esce dalla cartella degli snapshot ("..", percorso assoluto)
+        """
+        query_dir = Path(query_name.replace("\\", "/")).with_suffix("")
+        directory = (self.base_path / query_dir / (codazi or "_") / f"year={year}").resolve()
+        if not directory.is_relative_to(self.base_path.resolve()):
+            raise ValueError(f"Percorso snapshot non valido per la query '{query_name}'")
+        return directory
+
+    def lock(self, query_name: str, codazi: str, year: int) -> asyncio.Lock:
+        key = f"{query_name}|{codazi}|{year}"
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+        return self._locks[key]
+
+    def read(self, query_name: str, codazi: str, year: int, signature: str) -> Optional[pa.Table]:
+        """Snapshot dell'anno se presente e generato dallo stesso SQL"""
+        path = self._partition_dir(query_name, codazi, year) / "part-0.parquet"
+        if not path.exists():
+            return None
+
+        try:
+            table = pq.read_table(path, memory_map=True)
+        except Exception as e:
+            logger.warning(f"Snapshot illeggibile {path}: {e}")
+            return None
+
+        metadata = table.schema.metadata or {}
+        if metadata.get(SIGNATURE_KEY, b"").decode() != signature:
+            logger.info(f"Snapshot {path} obsoleto (query modificata)")
+            return None
+
+        self._hits += 1
+        return table.replace_schema_metadata(None)
+
+    def write(self, query_name: str, codazi: str, year: int, signature: str, table: pa.Table) -> Path:
+        """Salva lo snapshot dell'anno (scrittura atomica)"""
+        directory = self._partition_dir(query_name, codazi, year)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / "part-0.parquet"
+
+        metadata = dict(table.schema.metadata or {})
+        metadata[SIGNATURE_KEY] = signature.encode()
+
+        tmp_path = directory / f".part-0.{uuid.uuid4().hex}.tmp"
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+        self._builds += 1
+        logger.info(f"Snapshot creato: {path} ({table.num_rows} righe)")
+        return path
+
+    def clear(self, query_name: Optional[str] = None) -> int:
+        """Elimina gli snapshot (di una query o tutti), restituisce le partizioni rimosse"""
+        root = self.base_path
+        if query_name:
+            root = (self.base_path / Path(query_name.replace("\\", "/")).with_suffix("")).resolve()
+            if not root.is_relative_to(self.base_path.resolve()):
+                return 0
+        if not root.exists():
+            return 0
+
+        removed = len(list(root.rglob("part-0.parquet")))
+        shutil.rmtree(root, ignore_errors=True)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        files = list(self.base_path.rglob("part-0.parquet")) if self.base_path.exists() else []
+        return {
+            "enabled": settings.LEGACY_SNAPSHOT_ENABLED,
+            "open_years": settings.LEGACY_SNAPSHOT_OPEN_YEARS,
+            "partitions": len(files),
+            "size_mb": round(sum(f.stat().st_size for f in files) / (1024 * 1024), 2),
+            "hits": self._hits,
+            "builds": self._builds,
+        }
+
+
+# Istanza globale
+snapshot_store = YearSnapshotStore(settings.LEGACY_SNAPSHOT_PATH)
@@ -0,0 +1,88 @@
+"""
+Riscrittura SQL basata su AST (sqlglot, dialetto T-SQL)
+Inietta colonne, predicati WHERE e termini GROUP BY nella SELECT principale,
+ignorando CTE, subquery e commenti
+"""
+from typing import List, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+DIALECT = "tsql"
+
+
+class SqlRewriteError(Exception):
+    """Query non riscrivibile via AST (il chiamante usa il fallback testuale)"""
+    pass
+
+
+def _main_selects(node: exp.Expression) -> List[exp.Select]:
+    """SELECT del livello principale: la query stessa o i rami di UNION/EXCEPT/INTERSECT"""
+    if isinstance(node, exp.Select):
+        return [node]
+    if isinstance(node, exp.SetOperation):
+        return _main_selects(node.left) + _main_selects(node.right)
+    if isinstance(node, exp.Subquery):
+        return _main_selects(node.this)
+    return []
+
+
+def _has_aggregate(select: exp.Select) -> bool:
+    """True se la SELECT aggrega (funzioni di aggregazione al suo livello, non nelle subquery)"""
+    for projection in select.expressions:
+        for agg in projection.find_all(exp.AggFunc):
+            if agg.find_ancestor(exp.Select) is select:
+                return True
+    return False
+
+
+def rewrite_query(
+    sql: str,
+    select_expressions: List[str],
+    where_conditions: List[str],
+    group_by_expressions: List[str]
+) -> Tuple[str, int]:
+    """
+    Riscrive la query aggiungendo colonne, filtri e raggruppamenti
+
+    - Le colonne vanno in coda alla SELECT principale
+    - I filtri vanno in AND con l'eventuale WHERE esistente (con parentesi)
+    - I termini GROUP BY vengono aggiunti solo se la SELECT aggrega già
+    Con UNION le modifiche si applicano a ogni ramo.
+
+    Returns:
+        (SQL riscritto, numero di SELECT modificate): i parametri dei filtri
+        vanno ripetuti una volta per ogni SELECT
+
+    Raises:
+        SqlRewriteError: SQL non analizzabile o senza SELECT principale
+    """
+    try:
+        statements = [s for s in sqlglot.parse(sql, read=DIALECT) if s is not None]
+    except SqlglotError as e:
+        raise SqlRewriteError(str(e)) from e
+
+    if len(statements) != 1:
+        raise SqlRewriteError(f"Attesa una sola istruzione, trovate {len(statements)}")
+
+    tree = statements[0]
+    selects = _main_selects(tree)
+    if not selects:
+        raise SqlRewriteError("Nessuna SELECT principale")
+
+    try:
+        for select in selects:
+            # La decisione sul GROUP BY va presa prima di aggiungere colonne
+            aggregated = bool(select.args.get("group")) or _has_aggregate(select)
+
+            if select_expressions:
+                select.select(*select_expressions, dialect=DIALECT, copy=False)
+            if where_conditions:
+                select.where(*where_conditions, dialect=DIALECT, copy=False)
+            if group_by_expressions and aggregated:
+                select.group_by(*group_by_expressions, dialect=DIALECT, copy=False)
+
+        return tree.sql(dialect=DIALECT, pretty=True), len(selects)
+    except SqlglotError as e:
+        raise SqlRewriteError(str(e)) from e
@@ -0,0 +1,130 @@
+"""
+Cache dei template .qry compilati
+Per ogni file: testo grezzo + una forma compilata per ogni (scenario, azienda)
+Invalidata dalla modifica del file su disco (mtime/size)
+"""
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _TemplateEntry:
+    path: Path
+    mtime_ns: int
+    size: int
+    raw_sql: str
+    checked_at: float
+    compiled: Dict[Tuple[str, str], Any] = field(default_factory=dict)
+
+
+class QueryTemplateCache:
+    """
+    Template .qry in memoria
+    - Il file viene riletto solo se mtime o dimensione cambiano
+    - Lo stat del file è limitato a uno ogni LEGACY_TEMPLATE_CHECK_SECONDS
+    - La compilazione (sostituzioni + chirurgia SQL) avviene una volta per scenario
+    """
+
+    def __init__(
+        self,
+        resolve_path: Callable[[str], Path],
+        compiler: Callable[[str, str, str], Any]
+    ):
+        self._resolve_path = resolve_path
+        self._compiler = compiler
+        self._entries: Dict[str, _TemplateEntry] = {}
+        self._lock = threading.Lock()
+
+        # Statistiche
+        self._hits = 0
+        self._compiles = 0
+        self._reloads = 0
+
+    def _load(self, query_name: str) -> _TemplateEntry:
+        """Entry aggiornata del template (riletto da disco se modificato)"""
+        now = time.monotonic()
+        entry = self._entries.get(query_name)
+
+        if entry is not None and now - entry.checked_at < settings.LEGACY_TEMPLATE_CHECK_SECONDS:
+            return entry
+
+        path = entry.path if entry is not None else self._resolve_path(query_name)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self.invalidate(query_name)
+            raise HTTPException(status_code=404, detail=f"Query '{query_name}' non trovata")
+
+        if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            entry.checked_at = now
+            return entry
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw_sql = f.read()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Errore lettura file: {str(e)}")
+
+        if entry is not None:
+            self._reloads += 1
+            logger.info(f"Template '{query_name}' modificato su disco, ricaricato")
+
+        entry = _TemplateEntry(
+            path=path,
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            raw_sql=raw_sql,
+            checked_at=now
+        )
+        with self._lock:
+            self._entries[query_name] = entry
+        return entry
+
+    def get_raw(self, query_name: str) -> str:
+        """Testo originale della .qry"""
+        return self._load(query_name).raw_sql
+
+    def get_compiled(self, query_name: str, scenario: str, codazi: str) -> Any:
+        """Risultato del compilatore (SQL pronto) per lo scenario e l'azienda richiesti"""
+        entry = self._load(query_name)
+        key = (scenario, codazi)
+
+        compiled = entry.compiled.get(key)
+        if compiled is not None:
+            self._hits += 1
+            return compiled
+
+        compiled = self._compiler(entry.raw_sql, scenario, codazi)
+        with self._lock:
+            entry.compiled[key] = compiled
+        self._compiles += 1
+        return compiled
+
+    def invalidate(self, query_name: str = None):
+        """Rimuove un template (o tutti) dalla cache"""
+        with self._lock:
+            if query_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(query_name, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiche d'uso della cache"""
+        return {
+            "templates": len(self._entries),
+            "compiled": sum(len(e.compiled) for e in self._entries.values()),
+            "hits": self._hits,
+            "compiles": self._compiles,
+            "reloads": self._reloads,
+            "check_seconds": settings.LEGACY_TEMPLATE_CHECK_SECONDS,
+        }
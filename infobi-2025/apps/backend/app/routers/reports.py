@@ -1,22 +1,44 @@
 """
 Router per gestione Report e esecuzione query
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
+import asyncio
+import itertools
 import json
 import io
+import time
+import uuid
 
+import pyarrow as pa
+
+from app.core.config import settings
 from app.core.models import get_db, Report, DBServer
-from app.core.security import get_current_user, require_admin, CredentialEncryption
+from app.core.security import get_current_user, get_user_from_token, require_admin, CredentialEncryption
 from app.core.database import db_engine
-from app.core.arrow_utils import ArrowConverter, create_arrow_response_headers
-from app.utils.excel_export import export_to_excel_with_pivot
+from app.core.single_flight import query_coalescer
+from app.core.result_cache import result_cache
+from app.core.result_versions import compute_delta, result_versions
+from app.core.change_detection import change_detector
+from app.core.report_runner import REPORT_PRIORITIES, ReportResult, priority_slot, report_primary_key, run_report, build_server_config
+from app.core.scheduler import sync_report_schedule
+from app.core.cron import CronError, CronExpression
+from app.core.partitioning import parse_partition_ranges
+from app.core.analytics import build_spec_sql, run_analysis, validate_select
+from app.core.arrow_utils import IPC_COMPRESSIONS, ArrowConverter, StreamSchema, create_arrow_response_headers
+from app.utils.excel_export import export_to_excel_with_pivot, export_to_excel_multisheet
+from app.utils.excel_pivot import export_to_excel_native_pivot
+from app.utils.csv_export import stream_csv, validate_csv_options
+from app.utils.export_cache import ExportCache, export_cache
 
 router = APIRouter(prefix="/api/v1/reports", tags=["Reports"])
 
+EXCEL_EXPORT_MODES = ("hierarchy", "sheets", "pivot")
+
 
 # --- Pydantic Models ---
 
@@ -29,6 +51,23 @@ class ReportCreate(BaseModel):
     perspective_layout: Optional[str] = None
     config_json: Optional[str] = None
     is_public: bool = False
+    watermark_column: Optional[str] = None
+    watermark_lookback: Optional[int] = None
+    # Policy di esecuzione
+    cache_ttl_seconds: Optional[int] = None
+    max_rows: Optional[int] = None
+    timeout_seconds: Optional[int] = None
+    priority: str = "normal"  # low, normal, high
+    output_format: Optional[str] = None  # arrow, json
+    output_compression: Optional[str] = None  # lz4, zstd
+    refresh_schedule: Optional[str] = None  # cron del pre-warming
+    version_query: Optional[str] = None  # rilevamento modifiche: SELECT di una versione dei dati
+    change_tables: Optional[str] = None  # oppure tabelle sorgente separate da virgola
+    # Esecuzione partizionata (sotto-query parallele sulla colonna)
+    partition_column: Optional[str] = None
+    partition_count: Optional[int] = None
+    partition_ranges: Optional[str] = None  # JSON: [{"from": .., "to": ..}, {"values": [..]}]
+    primary_key: Optional[str] = None  # colonne chiave separate da virgola (risposte delta)
 
 
 class ReportUpdate(BaseModel):
@@ -39,6 +78,21 @@ class ReportUpdate(BaseModel):
     perspective_layout: Optional[str] = None
     config_json: Optional[str] = None
     is_public: Optional[bool] = None
+    watermark_column: Optional[str] = None
+    watermark_lookback: Optional[int] = None
+    cache_ttl_seconds: Optional[int] = None
+    max_rows: Optional[int] = None
+    timeout_seconds: Optional[int] = None
+    priority: Optional[str] = None
+    output_format: Optional[str] = None
+    output_compression: Optional[str] = None
+    refresh_schedule: Optional[str] = None
+    version_query: Optional[str] = None
+    change_tables: Optional[str] = None
+    partition_column: Optional[str] = None
+    partition_count: Optional[int] = None
+    partition_ranges: Optional[str] = None
+    primary_key: Optional[str] = None
 
 
 class ReportResponse(BaseModel):
@@ -50,6 +104,21 @@ class ReportResponse(BaseModel):
     server_id: int
     is_public: bool
     is_active: bool
+    watermark_column: Optional[str] = None
+    watermark_lookback: Optional[int] = None
+    cache_ttl_seconds: Optional[int] = None
+    max_rows: Optional[int] = None
+    timeout_seconds: Optional[int] = None
+    priority: Optional[str] = None
+    output_format: Optional[str] = None
+    output_compression: Optional[str] = None
+    refresh_schedule: Optional[str] = None
+    version_query: Optional[str] = None
+    change_tables: Optional[str] = None
+    partition_column: Optional[str] = None
+    partition_count: Optional[int] = None
+    partition_ranges: Optional[str] = None
+    primary_key: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -62,6 +131,226 @@ class QueryExecute(BaseModel):
     format: str = "arrow"  # arrow, json
 
 
+class QueryPreview(BaseModel):
+    server_id: int
+    sql_query: str
+    params: Optional[Dict[str, Any]] = None
+    rows: Optional[int] = None  # default PREVIEW_DEFAULT_ROWS, massimo PREVIEW_MAX_ROWS
+    sample_percent: Optional[float] = None  # TABLESAMPLE (MSSQL, PostgreSQL)
+    estimate: bool = True  # stima righe totali dal piano di esecuzione
+
+
+class PushdownFilter(BaseModel):
+    column: str
+    op: str = "="  # =, !=, <, <=, >, >=, like, not like, in, not in, between, is null, is not null
+    value: Optional[Any] = None
+
+
+class PushdownOrder(BaseModel):
+    column: str
+    direction: str = "asc"  # asc, desc
+
+
+class ReportExecuteRequest(BaseModel):
+    columns: Optional[List[str]] = None
+    filters: Optional[List[PushdownFilter]] = None
+    order_by: Optional[List[PushdownOrder]] = None
+    limit: Optional[int] = None
+    format: Optional[str] = None  # arrow, json (default: output_format del report)
+
+    @property
+    def has_pushdown(self) -> bool:
+        return bool(self.columns or self.filters or self.order_by or self.limit is not None)
+
+
+class BatchReportItem(ReportExecuteRequest):
+    report_id: int
+    refresh: bool = False
+    full_refresh: bool = False
+
+
+class BatchExecuteRequest(BaseModel):
+    reports: List[BatchReportItem]
+
+
+class AnalysisSpec(BaseModel):
+    columns: Optional[List[str]] = None
+    filters: Optional[List[PushdownFilter]] = None
+    group_by: Optional[List[str]] = None
+    aggregations: Optional[Dict[str, str]] = None  # {campo: sum|count|count_distinct|avg|min|max}
+    order_by: Optional[List[PushdownOrder]] = None
+    limit: Optional[int] = None
+
+
+class AnalyzeRequest(BaseModel):
+    sql: Optional[str] = None  # SELECT sulla tabella "result"
+    spec: Optional[AnalysisSpec] = None
+    refresh: bool = False  # riesegue la query del report invece di usare la cache
+    format: Optional[str] = None  # arrow, json (default: output_format del report)
+
+
+# --- Helper ---
+
+def _validate_policy(data: Dict[str, Any]):
+    """Valida i campi policy di un report (400 se non validi)"""
+    for field in ("cache_ttl_seconds", "max_rows", "timeout_seconds"):
+        value = data.get(field)
+        if value is not None and value < (0 if field == "cache_ttl_seconds" else 1):
+            raise HTTPException(status_code=400, detail=f"Valore non valido per {field}: {value}")
+    
+    if data.get("priority") is not None and data["priority"] not in REPORT_PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Priorità non valida: {data['priority']}")
+    
+    if data.get("output_format") is not None and data["output_format"] not in ("arrow", "json"):
+        raise HTTPException(status_code=400, detail=f"Formato non supportato: {data['output_format']}")
+    
+    if data.get("output_compression") not in IPC_COMPRESSIONS:
+        raise HTTPException(status_code=400, detail=f"Compressione non supportata: {data['output_compression']}")
+    
+    if data.get("refresh_schedule"):
+        try:
+            CronExpression(data["refresh_schedule"])
+        except CronError as e:
+            raise HTTPException(status_code=400, detail=f"Espressione cron non valida: {e}")
+    
+    count = data.get("partition_count")
+    if count is not None and not 1 <= count <= settings.PARTITION_MAX_COUNT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"partition_count deve essere tra 1 e {settings.PARTITION_MAX_COUNT}"
+        )
+    
+    try:
+        parse_partition_ranges(data.get("partition_ranges"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _table_response(
+    table,
+    report: Report,
+    requested_format: Optional[str],
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Risposta Arrow o JSON secondo il formato richiesto o la policy del report"""
+    headers = headers or {}
+    
+    if _wants_arrow(report, requested_format):
+        return Response(
+            content=ArrowConverter.table_to_arrow_bytes(table, compression=report.output_compression),
+            media_type="application/vnd.apache.arrow.stream",
+            headers={**create_arrow_response_headers(), **headers}
+        )
+    
+    return JSONResponse(
+        content={"count": table.num_rows, "data": table.to_pylist()},
+        headers=headers
+    )
+
+
+def _wants_arrow(report: Report, requested_format: Optional[str]) -> bool:
+    return (requested_format or report.output_format or "arrow") == "arrow"
+
+
+def _table_payload(table, report: Report, requested_format: Optional[str]) -> Tuple[bytes, str]:
+    """Corpo e content type di un risultato (parti della risposta batch)"""
+    if _wants_arrow(report, requested_format):
+        return (
+            ArrowConverter.table_to_arrow_bytes(table, compression=report.output_compression),
+            "application/vnd.apache.arrow.stream"
+        )
+    payload = json.dumps({"count": table.num_rows, "data": table.to_pylist()}, default=str)
+    return payload.encode("utf-8"), "application/json"
+
+
+def _multipart_part(boundary: str, headers: Dict[str, str], body: bytes, media_type: str) -> bytes:
+    """Una parte di una risposta multipart/mixed (batch, delta)"""
+    head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return (
+        f"--{boundary}\r\nContent-Type: {media_type}\r\n{head}"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode("utf-8") + body + b"\r\n"
+
+
+def _get_report_for_user(report_id: int, current_user: dict, db: Session) -> Report:
+    """Carica un report verificando esistenza e permessi di lettura"""
+    report = db.query(Report).filter(Report.id == report_id).first()
+    
+    if not report:
+        raise HTTPException(status_code=404, detail="Report non trovato")
+    
+    if not report.is_public and report.owner_id != current_user["user_id"] and current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Accesso negato")
+    
+    return report
+
+
+async def _run_saved_report(
+    report: Report,
+    db: Session,
+    refresh: bool = False,
+    full_refresh: bool = False
+) -> ReportResult:
+    """Risultato del report (cache o server sorgente), errori come HTTPException"""
+    server = db.query(DBServer).filter(DBServer.id == report.server_id).first()
+    if not server or not server.is_active:
+        raise HTTPException(status_code=404, detail="Server non trovato o inattivo")
+    
+    try:
+        return await run_report(report, server, refresh=refresh, full_refresh=full_refresh)
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore esecuzione query: {str(e)}"
+        )
+
+
+async def _run_pushdown(
+    report: Report,
+    server: DBServer,
+    config: Dict[str, Any],
+    request: ReportExecuteRequest
+) -> pa.Table:
+    """Query salvata con proiezione/filtri/ordinamento/limite sul server sorgente (HTTPException)"""
+    limit = request.limit
+    if report.max_rows and (limit is None or limit > report.max_rows):
+        limit = report.max_rows
+    
+    try:
+        query, params = db_engine.build_pushdown_query(
+            db_type=server.db_type,
+            query=report.sql_query,
+            columns=request.columns,
+            filters=[f.model_dump() for f in request.filters or []],
+            order_by=[o.model_dump() for o in request.order_by or []],
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        async with priority_slot(report.priority):
+            table = await db_engine.execute_arrow(
+                server_id=str(server.id),
+                db_type=server.db_type,
+                config=config,
+                query=query,
+                params=params,
+                timeout_seconds=report.timeout_seconds
+            )
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore esecuzione query: {str(e)}"
+        )
+    
+    return table
+
+
 # --- Endpoints ---
 
 @router.post("/", response_model=ReportResponse, dependencies=[Depends(get_current_user)])
@@ -76,6 +365,8 @@ async def create_report(
     if not server:
         raise HTTPException(status_code=404, detail="Server non trovato")
     
+    _validate_policy(report_data.model_dump())
+    
     new_report = Report(
         name=report_data.name,
         description=report_data.description,
@@ -85,12 +376,32 @@ async def create_report(
         perspective_layout=report_data.perspective_layout,
         config_json=report_data.config_json,
         is_public=report_data.is_public,
+        watermark_column=report_data.watermark_column,
+        watermark_lookback=report_data.watermark_lookback,
+        cache_ttl_seconds=report_data.cache_ttl_seconds,
+        max_rows=report_data.max_rows,
+        timeout_seconds=report_data.timeout_seconds,
+        priority=report_data.priority,
+        output_format=report_data.output_format,
+        output_compression=report_data.output_compression,
+        refresh_schedule=report_data.refresh_schedule,
+        version_query=report_data.version_query,
+        change_tables=report_data.change_tables,
+        partition_column=report_data.partition_column,
+        partition_count=report_data.partition_count,
+        partition_ranges=report_data.partition_ranges,
+        primary_key=report_data.primary_key,
         owner_id=current_user["user_id"]
     )
     
     db.add(new_report)
     db.commit()
+    
+    sync_report_schedule(db, new_report)
+    db.commit()
     db.refresh(new_report)
+    # La cache su disco sopravvive ai riavvii: nessun residuo di un report con lo stesso id
+    result_cache.invalidate(result_cache.report_key(new_report.id))
     
     return new_report
 
@@ -114,6 +425,24 @@ async def list_reports(current_user: dict = Depends(get_current_user), db: Sessi
     return reports
 
 
+@router.get("/stats/coalescing", dependencies=[Depends(require_admin)])
+async def query_coalescing_stats():
+    """Statistiche single-flight: esecuzioni reali e richieste accodate"""
+    return query_coalescer.stats()
+
+
+@router.get("/stats/result-cache", dependencies=[Depends(require_admin)])
+async def result_cache_stats():
+    """Statistiche della cache dei risultati e delle versioni per le risposte delta"""
+    return {**result_cache.stats(), "versions": result_versions.stats()}
+
+
+@router.get("/stats/change-detection", dependencies=[Depends(require_admin)])
+async def change_detection_stats():
+    """Statistiche del rilevamento modifiche dei dati sorgente"""
+    return change_detector.stats()
+
+
 @router.get("/{report_id}", response_model=ReportResponse)
 async def get_report(report_id: int, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
     """Dettagli report"""
@@ -148,11 +477,17 @@ async def update_report(
     
     # Aggiorna campi
     update_data = report_data.model_dump(exclude_unset=True)
+    _validate_policy(update_data)
+    
+    previous_schedule = report.refresh_schedule
     for key, value in update_data.items():
         setattr(report, key, value)
     
+    sync_report_schedule(db, report, previous_schedule)
     db.commit()
     db.refresh(report)
+    result_cache.invalidate(result_cache.report_key(report.id))
+    result_versions.invalidate(report.id)
     
     return report
 
@@ -171,6 +506,8 @@ async def delete_report(report_id: int, current_user: dict = Depends(get_current
     
     report.is_active = False
     db.commit()
+    result_cache.invalidate(result_cache.report_key(report.id))
+    result_versions.invalidate(report.id)
     
     return {"message": "Report eliminato"}
 
@@ -205,9 +542,9 @@ async def execute_query(
     if server.password_encrypted:
         config["password"] = CredentialEncryption.decrypt(server.password_encrypted)
     
-    # Esegui query
+    # Esegui query (richieste identiche contemporanee condividono il risultato)
     try:
-        results = await db_engine.execute_query(
+        table = await db_engine.execute_arrow(
             server_id=str(server.id),
             db_type=server.db_type,
             config=config,
@@ -218,7 +555,7 @@ async def execute_query(
         # Formato risposta
         if query_data.format == "arrow":
             # Converti in Arrow bytes
-            arrow_bytes = ArrowConverter.to_arrow_bytes(results)
+            arrow_bytes = ArrowConverter.table_to_arrow_bytes(table)
             
             return Response(
                 content=arrow_bytes,
@@ -228,8 +565,8 @@ async def execute_query(
         else:
             # JSON standard
             return {
-                "count": len(results),
-                "data": results
+                "count": table.num_rows,
+                "data": table.to_pylist()
             }
             
     except Exception as e:
@@ -239,82 +576,592 @@ async def execute_query(
         )
 
 
+@router.post("/preview")
+async def preview_query(
+    preview: QueryPreview,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Anteprima veloce di una query in fase di scrittura
+    - Prime N righe con TOP/LIMIT del dialetto (ORDER BY originale mantenuto)
+    - sample_percent: campionamento TABLESAMPLE dove supportato
+    - Schema e stima delle righe totali dal piano dell'ottimizzatore (senza eseguire la query)
+    """
+    rows = preview.rows or settings.PREVIEW_DEFAULT_ROWS
+    if rows < 1 or rows > settings.PREVIEW_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Righe di anteprima tra 1 e {settings.PREVIEW_MAX_ROWS}")
+    if preview.sample_percent is not None and not 0 < preview.sample_percent <= 100:
+        raise HTTPException(status_code=400, detail="Percentuale di campionamento tra 0 e 100")
+    
+    server = db.query(DBServer).filter(DBServer.id == preview.server_id).first()
+    if not server or not server.is_active:
+        raise HTTPException(status_code=404, detail="Server non trovato o inattivo")
+    
+    config = build_server_config(server)
+    started = time.perf_counter()
+    
+    try:
+        query, sampled = db_engine.build_preview_query(server.db_type, preview.sql_query, rows, preview.sample_percent)
+    except ValueError:
+        # Query non analizzabile: query originale, lettura del cursore fermata a N righe
+        query, sampled = preview.sql_query, False
+    
+    async def _fetch(sql: str):
+        return await db_engine.execute_arrow(
+            server_id=str(server.id),
+            db_type=server.db_type,
+            config=config,
+            query=sql,
+            params=preview.params,
+            max_rows=rows,
+            timeout_seconds=settings.PREVIEW_TIMEOUT_SECONDS
+        )
+    
+    async def _estimate() -> Optional[int]:
+        if not preview.estimate:
+            return None
+        try:
+            return await asyncio.wait_for(
+                run_in_threadpool(
+                    db_engine.estimate_row_count,
+                    str(server.id), server.db_type, config, preview.sql_query, preview.params
+                ),
+                settings.PREVIEW_ESTIMATE_TIMEOUT_SECONDS
+            )
+        except Exception:
+            return None
+    
+    async def _preview():
+        nonlocal sampled
+        try:
+            return await _fetch(query)
+        except Exception:
+            if not sampled:
+                raise
+            # TABLESAMPLE non applicabile (es. viste): anteprima senza campionamento
+            sampled = False
+            fallback, _ = db_engine.build_preview_query(server.db_type, preview.sql_query, rows)
+            return await _fetch(fallback)
+    
+    try:
+        table, estimated_rows = await asyncio.gather(_preview(), _estimate())
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore esecuzione query: {str(e)}"
+        )
+    
+    return {
+        "columns": [{"name": field.name, "type": str(field.type)} for field in table.schema],
+        "count": table.num_rows,
+        "data": table.to_pylist(),
+        "estimated_total_rows": estimated_rows,
+        "sampled": sampled,
+        "elapsed_ms": int((time.perf_counter() - started) * 1000)
+    }
+
+
+@router.post("/batch")
+async def execute_reports_batch(
+    request: BatchExecuteRequest,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Esegue più report salvati in parallelo (caricamento dashboard)
+    - Autenticazione, caricamento report e decifratura credenziali una sola volta per richiesta
+    - Ogni elemento accetta refresh/full_refresh o proiezione/filtri/ordinamento/limite (pushdown)
+    - Risposta multipart/mixed in streaming: una parte per report appena pronta, nell'ordine
+      di completamento (header X-Batch-Index, X-Report-Id, X-Status)
+    - Un report in errore produce una parte JSON {"detail": ...} senza interrompere gli altri
+    """
+    if not request.reports:
+        raise HTTPException(status_code=400, detail="Nessun report richiesto")
+    if len(request.reports) > settings.BATCH_MAX_REPORTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Massimo {settings.BATCH_MAX_REPORTS} report per richiesta"
+        )
+    
+    # Definizioni caricate prima dell'esecuzione parallela e staccate dalla Session:
+    # i task non la usano mai (non è utilizzabile in concorrenza)
+    report_ids = {item.report_id for item in request.reports}
+    reports = {r.id: r for r in db.query(Report).filter(Report.id.in_(report_ids)).all()}
+    server_ids = {r.server_id for r in reports.values()}
+    servers = {s.id: s for s in db.query(DBServer).filter(DBServer.id.in_(server_ids)).all()}
+    for instance in [*reports.values(), *servers.values()]:
+        db.expunge(instance)
+    configs: Dict[int, Dict[str, Any]] = {}
+    
+    async def run_item(index: int, item: BatchReportItem) -> Tuple[Dict[str, str], bytes, str]:
+        headers = {"X-Batch-Index": str(index), "X-Report-Id": str(item.report_id)}
+        try:
+            report = reports.get(item.report_id)
+            if report is None:
+                raise HTTPException(status_code=404, detail="Report non trovato")
+            if not report.is_public and report.owner_id != current_user["user_id"] and current_user["role"] != "admin":
+                raise HTTPException(status_code=403, detail="Accesso negato")
+            
+            server = servers.get(report.server_id)
+            if not server or not server.is_active:
+                raise HTTPException(status_code=404, detail="Server non trovato o inattivo")
+            if server.id not in configs:
+                configs[server.id] = build_server_config(server)
+            
+            if item.has_pushdown:
+                table = await _run_pushdown(report, server, configs[server.id], item)
+            else:
+                result = await run_report(
+                    report, server,
+                    refresh=item.refresh,
+                    full_refresh=item.full_refresh,
+                    config=configs[server.id]
+                )
+                table = result.table
+                headers.update(result.headers())
+            
+            body, media_type = await run_in_threadpool(_table_payload, table, report, item.format)
+            headers["X-Status"] = "200"
+            return headers, body, media_type
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                error_status, detail = e.status_code, e.detail
+            elif isinstance(e, TimeoutError):
+                error_status, detail = 504, str(e)
+            else:
+                error_status, detail = 500, f"Errore esecuzione query: {str(e)}"
+            headers["X-Status"] = str(error_status)
+            return headers, json.dumps({"detail": detail}).encode("utf-8"), "application/json"
+    
+    boundary = uuid.uuid4().hex
+    
+    async def parts():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(request.reports)]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                headers, body, media_type = await completed
+                yield _multipart_part(boundary, headers, body, media_type)
+            yield f"--{boundary}--\r\n".encode("utf-8")
+        finally:
+            # Client disconnesso: annulla i report ancora in esecuzione
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        parts(),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers={"Cache-Control": "no-store"}
+    )
+
+
 @router.get("/{report_id}/execute")
 async def execute_saved_report(
     report_id: int,
-    format: str = "arrow",
+    format: Optional[str] = None,
+    refresh: bool = False,
+    full_refresh: bool = False,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Esegue un report salvato"""
-    report = db.query(Report).filter(Report.id == report_id).first()
+    """
+    Esegue un report salvato
+    Il risultato resta in cache per le ri-analisi
+    - refresh=true: riesegue (incrementale se il report ha una colonna watermark)
+    - full_refresh=true: riesegue sempre la query completa
+    Formato e compressione di default dalla policy del report
+    """
+    report = _get_report_for_user(report_id, current_user, db)
+    result = await _run_saved_report(report, db, refresh, full_refresh)
     
-    if not report:
-        raise HTTPException(status_code=404, detail="Report non trovato")
+    return _table_response(result.table, report, format, result.headers())
+
+
+@router.get("/{report_id}/delta")
+async def execute_saved_report_delta(
+    report_id: int,
+    since: Optional[str] = None,
+    refresh: bool = False,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Esegue un report salvato restituendo solo le differenze rispetto a una versione precedente
+    Richiede primary_key sul report. Risposta multipart/mixed con parti Arrow (header X-Delta-Part):
+    - since noto: insert, update (upsert in Perspective) e delete (solo colonne chiave, remove)
+    - since assente o non più disponibile, risultato troncato: una parte full con il risultato completo
+    X-Result-Version: token da passare come since al refresh successivo
+    """
+    report = _get_report_for_user(report_id, current_user, db)
+    keys = report_primary_key(report)
+    if not keys:
+        raise HTTPException(status_code=400, detail="Il report non ha una chiave primaria (primary_key)")
     
-    # Verifica permessi
-    if not report.is_public and report.owner_id != current_user["user_id"] and current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Accesso negato")
+    result = await _run_saved_report(report, db, refresh)
     
-    # Esegui query del report
-    query_data = QueryExecute(
-        server_id=report.server_id,
-        sql_query=report.sql_query,
-        format=format
+    # Versione del client letta prima di registrare la nuova (la registrazione può rimuoverla)
+    delta = None
+    previous = await run_in_threadpool(result_versions.get, report.id, since) if since else None
+    version = await run_in_threadpool(result_versions.register, report.id, result.table)
+    # Risultato troncato (max_rows): le righe oltre il limite risulterebbero cancellate
+    if previous is not None and not result.truncated:
+        try:
+            delta = await run_in_threadpool(compute_delta, previous, result.table, keys)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # Tipi di colonna non confrontabili nel join: risultato completo
+            delta = None
+    
+    parts = {"full": result.table} if delta is None else delta
+    boundary = uuid.uuid4().hex
+    body = b""
+    for name, table in parts.items():
+        payload, media_type = await run_in_threadpool(_table_payload, table, report, "arrow")
+        body += _multipart_part(boundary, {"X-Delta-Part": name, "X-Rows": str(table.num_rows)}, payload, media_type)
+    body += f"--{boundary}--\r\n".encode("utf-8")
+    
+    return Response(
+        content=body,
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers={
+            **result.headers(),
+            "X-Result-Version": version,
+            "X-Delta": "full" if delta is None else "delta",
+            "Cache-Control": "no-store",
+        }
     )
+
+
+@router.websocket("/{report_id}/ws")
+async def execute_saved_report_ws(
+    websocket: WebSocket,
+    report_id: int,
+    token: str,
+    refresh: bool = False,
+    full_refresh: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Esecuzione di un report salvato via WebSocket (token JWT nella query string)
+    Messaggi testo JSON con la fase: queued, executing, fetching (righe ricevute),
+    converting, done (righe, source, truncated, elapsed_ms), error (status, detail), cancelled
+    Messaggi binari: un blocco per frame (stream Arrow IPC autonomo, da accodare in Perspective),
+    inviati appena letti dal cursore; tutti i frame hanno lo stesso schema
+    Il client annulla con {"action": "cancel"} o chiudendo la connessione;
+    un messaggio binario dal client chiude la connessione (1003)
+    """
+    try:
+        current_user = get_user_from_token(token)
+        report = _get_report_for_user(report_id, current_user, db)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    
+    await websocket.accept()
+    started = time.perf_counter()
+    rows = 0
+    received = 0
+    # Schema fissato una volta: i blocchi successivi vengono adeguati (tipi null, int/float)
+    stream_schema = StreamSchema()
+    
+    server = db.query(DBServer).filter(DBServer.id == report.server_id).first()
+    if not server or not server.is_active:
+        await websocket.send_json({"phase": "error", "status": 404, "detail": "Server non trovato o inattivo"})
+        await websocket.close()
+        return
+    
+    async def send_phase(phase: str):
+        await websocket.send_json({"phase": phase})
     
-    return await execute_query(query_data, current_user, db)
+    async def send_frames(batches: List[pa.RecordBatch]):
+        for batch in batches:
+            await websocket.send_bytes(ArrowConverter.table_to_arrow_bytes(
+                pa.Table.from_batches([batch], schema=stream_schema.schema),
+                compression=report.output_compression
+            ))
+    
+    async def send_batch(batch: pa.RecordBatch):
+        nonlocal rows, received
+        rows += batch.num_rows
+        received += 1
+        await websocket.send_json({"phase": "fetching", "rows": rows})
+        await send_frames(stream_schema.push(batch))
+    
+    async def listen() -> bool:
+        # True alla richiesta di annullamento, False per un messaggio binario;
+        # WebSocketDisconnect alla chiusura del client
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except KeyError:
+                return False
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get("action") == "cancel":
+                return True
+    
+    async def close(code: int = status.WS_1000_NORMAL_CLOSURE):
+        try:
+            await websocket.close(code=code)
+        except RuntimeError:
+            # Connessione già chiusa dal client
+            pass
+    
+    execution = asyncio.create_task(run_report(
+        report, server,
+        refresh=refresh,
+        full_refresh=full_refresh,
+        on_phase=send_phase,
+        on_batch=send_batch
+    ))
+    listener = asyncio.create_task(listen())
+    await asyncio.wait({execution, listener}, return_when=asyncio.FIRST_COMPLETED)
+    
+    if not execution.done():
+        execution.cancel()
+        try:
+            await execution
+        except (asyncio.CancelledError, Exception):
+            pass
+        if listener.exception() is not None:
+            await close()
+        elif listener.result():
+            try:
+                await websocket.send_json({"phase": "cancelled", "rows": rows})
+            except (WebSocketDisconnect, RuntimeError):
+                pass
+            await close()
+        else:
+            await close(status.WS_1003_UNSUPPORTED_DATA)
+        return
+    
+    listener.cancel()
+    try:
+        result = execution.result()
+        # Cache, refresh incrementale o partizionato: blocchi inviati a risultato pronto
+        if received == 0:
+            batches = result.table.to_batches(max_chunksize=settings.STREAM_BATCH_SIZE)
+            for batch in batches or [pa.RecordBatch.from_pylist([], schema=result.table.schema)]:
+                await send_batch(batch)
+        # Blocchi trattenuti in attesa dello schema (colonne ancora tutte NULL)
+        await send_frames(stream_schema.flush())
+        await websocket.send_json({
+            "phase": "done",
+            "rows": result.table.num_rows,
+            "source": result.source,
+            "truncated": result.truncated,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        await close()
+    except WebSocketDisconnect:
+        return
+    except Exception as e:
+        error_status = 504 if isinstance(e, TimeoutError) else 500
+        detail = str(e) if isinstance(e, TimeoutError) else f"Errore esecuzione query: {str(e)}"
+        try:
+            await websocket.send_json({"phase": "error", "status": error_status, "detail": detail})
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        await close()
+
+
+@router.post("/{report_id}/analyze")
+async def analyze_report(
+    report_id: int,
+    request: AnalyzeRequest,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Ri-analizza il risultato in cache di un report con DuckDB
+    - sql: SELECT libera sulla tabella "result"
+    - spec: filtri / raggruppamenti / aggregazioni / ordinamento strutturati
+    Il server sorgente viene interrogato solo se il risultato non è in cache
+    """
+    if (request.sql is None) == (request.spec is None):
+        raise HTTPException(status_code=400, detail="Specificare 'sql' oppure 'spec'")
+    
+    try:
+        if request.sql is not None:
+            sql, params = validate_select(request.sql), []
+        else:
+            spec = request.spec.model_dump()
+            sql, params = build_spec_sql(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    report = _get_report_for_user(report_id, current_user, db)
+    report_result = await _run_saved_report(report, db, request.refresh)
+    
+    try:
+        result = await run_in_threadpool(run_analysis, report_result.table, sql, params)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Errore analisi: {str(e)}")
+    
+    return _table_response(result, report, request.format, report_result.headers())
+
+
+@router.post("/{report_id}/execute")
+async def execute_saved_report_pushdown(
+    report_id: int,
+    request: ReportExecuteRequest,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Esegue un report salvato con proiezione, filtri, ordinamento e limite
+    applicati dal database sorgente (query salvata come tabella derivata)
+    Il limite non supera max_rows del report
+    """
+    report = _get_report_for_user(report_id, current_user, db)
+    
+    server = db.query(DBServer).filter(DBServer.id == report.server_id).first()
+    if not server or not server.is_active:
+        raise HTTPException(status_code=404, detail="Server non trovato o inattivo")
+    
+    table = await _run_pushdown(report, server, build_server_config(server), request)
+    
+    return _table_response(table, report, request.format)
 
 
 @router.post("/{report_id}/export/excel")
 async def export_report_excel(
     report_id: int,
     pivot_config: Optional[Dict[str, Any]] = None,
+    mode: str = "hierarchy",
+    refresh: bool = False,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Esporta report in Excel con mantenimento gerarchia pivot
+    Modalità:
+    - hierarchy: un foglio con outline collassabile (default)
+    - sheets: un foglio per ogni valore del primo campo di row_groups,
+      scritti in streaming (write-only)
+    - pivot: dati grezzi su un foglio + Tabella Pivot nativa Excel
+      (da pivot_config o dal perspective_layout del report)
+    Dati dalla cache risultati del report (refresh=true per rieseguire la query);
+    il file generato viene messo in cache su disco: export ripetuti
+    con stesso risultato e stessa pivot_config non rigenerano il .xlsx
     """
-    report = db.query(Report).filter(Report.id == report_id).first()
+    if mode not in EXCEL_EXPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"Modalità export non supportata: {mode}")
     
-    if not report:
-        raise HTTPException(status_code=404, detail="Report non trovato")
-    
-    # Verifica permessi
-    if not report.is_public and report.owner_id != current_user["user_id"] and current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Accesso negato")
+    report = _get_report_for_user(report_id, current_user, db)
     
-    # Ottieni dati
-    server = db.query(DBServer).filter(DBServer.id == report.server_id).first()
+    # Stesso percorso dell'esecuzione (cache risultati, policy, refresh incrementale)
+    report_result = await _run_saved_report(report, db, refresh)
+    table = report_result.table
     
-    config: Dict[str, Any] = {
-        "server": server.server,
-        "database": server.database,
-        "port": server.port,
-        "driver": server.driver
+    headers = {
+        "Content-Disposition": f"attachment; filename={report.name}.xlsx",
+        **report_result.headers()
     }
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     
-    if server.username_encrypted:
-        config["username"] = CredentialEncryption.decrypt(server.username_encrypted)
+    cache_key = None
+    if settings.EXPORT_CACHE_ENABLED:
+        fingerprint = await run_in_threadpool(ArrowConverter.fingerprint, table)
+        # In modalità pivot l'output dipende anche dal layout salvato
+        variant = f"{mode}|{report.perspective_layout or ''}" if mode == "pivot" else mode
+        cache_key = ExportCache.build_key(report.id, pivot_config, fingerprint, variant=variant)
+        
+        cached_path = export_cache.get(cache_key)
+        if cached_path:
+            return FileResponse(
+                cached_path,
+                media_type=media_type,
+                headers={**headers, "X-Export-Cache": "HIT"}
+            )
     
-    if server.password_encrypted:
-        config["password"] = CredentialEncryption.decrypt(server.password_encrypted)
+    # Esporta in Excel (CPU-bound: fuori dall'event loop)
+    if mode == "sheets":
+        excel_bytes = await run_in_threadpool(
+            export_to_excel_multisheet, table, pivot_config or {}
+        )
+    elif mode == "pivot":
+        try:
+            excel_bytes = await run_in_threadpool(
+                export_to_excel_native_pivot, table, pivot_config, report.perspective_layout
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        excel_bytes = await run_in_threadpool(
+            export_to_excel_with_pivot, table.to_pylist(), pivot_config or {}
+        )
     
-    results = await db_engine.execute_query(
+    if cache_key:
+        export_cache.put(cache_key, excel_bytes)
+    
+    return StreamingResponse(
+        io.BytesIO(excel_bytes),
+        media_type=media_type,
+        headers={**headers, "X-Export-Cache": "MISS"}
+    )
+
+
+@router.get("/{report_id}/export/csv")
+async def export_report_csv(
+    report_id: int,
+    delimiter: str = ";",
+    decimal_separator: str = ",",
+    encoding: str = "utf-8",
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Esporta report in CSV/TSV in streaming
+    I blocchi vengono letti dal cursore e scritti con Arrow man mano:
+    la memoria resta costante indipendentemente dal numero di righe
+    """
+    report = _get_report_for_user(report_id, current_user, db)
+    
+    # "\t" o "tab" come alias del tabulatore (TSV)
+    if delimiter in ("\\t", "tab"):
+        delimiter = "\t"
+    
+    try:
+        validate_csv_options(delimiter, decimal_separator, encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    server = db.query(DBServer).filter(DBServer.id == report.server_id).first()
+    if not server or not server.is_active:
+        raise HTTPException(status_code=404, detail="Server non trovato o inattivo")
+    
+    batches = db_engine.iter_arrow_batches(
         server_id=str(server.id),
         db_type=server.db_type,
-        config=config,
-        query=report.sql_query
+        config=build_server_config(server),
+        query=report.sql_query,
+        max_rows=report.max_rows,
+        timeout_seconds=report.timeout_seconds
     )
+    chunks = stream_csv(batches, delimiter, decimal_separator, encoding)
     
-    # Esporta in Excel
-    excel_bytes = export_to_excel_with_pivot(results, pivot_config or {})
+    # Il primo chunk viene prodotto prima di inviare gli header:
+    # errori di connessione/SQL diventano un 500 invece di un file troncato
+    try:
+        first_chunk = await run_in_threadpool(next, chunks, b"")
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Errore esecuzione query: {str(e)}"
+        )
+    
+    is_tsv = delimiter == "\t"
+    extension = "tsv" if is_tsv else "csv"
+    media_type = "text/tab-separated-values" if is_tsv else "text/csv"
     
     return StreamingResponse(
-        io.BytesIO(excel_bytes),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        itertools.chain([first_chunk], chunks),
+        media_type=f"{media_type}; charset={encoding}",
         headers={
-            "Content-Disposition": f"attachment; filename={report.name}.xlsx"
+            "Content-Disposition": f"attachment; filename={report.name}.{extension}"
         }
     )
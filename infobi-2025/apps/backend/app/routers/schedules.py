@@ -0,0 +1,153 @@
+"""
+Router per le pianificazioni di refresh dei report
+Solo ADMIN
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+from app.core.models import get_db, Report, ReportSchedule
+from app.core.security import require_admin
+from app.core.cron import CronError
+from app.core.scheduler import compute_next_run, report_scheduler
+
+router = APIRouter(prefix="/api/v1/schedules", tags=["Schedules"], dependencies=[Depends(require_admin)])
+
+
+# --- Pydantic Models ---
+
+class ScheduleCreate(BaseModel):
+    report_id: int
+    cron: str
+    jitter_seconds: int = 0
+    is_active: bool = True
+
+
+class ScheduleUpdate(BaseModel):
+    cron: Optional[str] = None
+    jitter_seconds: Optional[int] = None
+    is_active: Optional[bool] = None
+
+
+class ScheduleResponse(BaseModel):
+    id: int
+    report_id: int
+    cron: str
+    jitter_seconds: Optional[int]
+    is_active: bool
+    next_run_at: Optional[datetime]
+    last_run_at: Optional[datetime]
+    last_duration_ms: Optional[int]
+    last_status: Optional[str]
+    last_rows: Optional[int]
+    last_error: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+
+# --- Helper ---
+
+def _next_run_or_400(cron: str) -> datetime:
+    try:
+        return compute_next_run(cron)
+    except CronError as e:
+        raise HTTPException(status_code=400, detail=f"Espressione cron non valida: {e}")
+
+
+def _get_schedule(schedule_id: int, db: Session) -> ReportSchedule:
+    schedule = db.query(ReportSchedule).filter(ReportSchedule.id == schedule_id).first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Pianificazione non trovata")
+    return schedule
+
+
+# --- Endpoints ---
+
+@router.get("/status")
+async def scheduler_status():
+    """Stato dello scheduler"""
+    return report_scheduler.stats()
+
+
+@router.post("/", response_model=ScheduleResponse, status_code=status.HTTP_201_CREATED)
+async def create_schedule(schedule_data: ScheduleCreate, db: Session = Depends(get_db)):
+    """Crea una pianificazione di refresh"""
+    report = db.query(Report).filter(Report.id == schedule_data.report_id).first()
+    if not report:
+        raise HTTPException(status_code=404, detail="Report non trovato")
+
+    if schedule_data.jitter_seconds < 0:
+        raise HTTPException(status_code=400, detail="Il jitter non può essere negativo")
+
+    new_schedule = ReportSchedule(
+        report_id=schedule_data.report_id,
+        cron=schedule_data.cron,
+        jitter_seconds=schedule_data.jitter_seconds,
+        is_active=schedule_data.is_active,
+        next_run_at=_next_run_or_400(schedule_data.cron)
+    )
+
+    db.add(new_schedule)
+    db.commit()
+    db.refresh(new_schedule)
+
+    return new_schedule
+
+
+@router.get("/", response_model=List[ScheduleResponse])
+async def list_schedules(report_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Lista pianificazioni (con stato dell'ultimo refresh)"""
+    query = db.query(ReportSchedule)
+    if report_id is not None:
+        query = query.filter(ReportSchedule.report_id == report_id)
+    return query.all()
+
+
+@router.get("/{schedule_id}", response_model=ScheduleResponse)
+async def get_schedule(schedule_id: int, db: Session = Depends(get_db)):
+    """Dettaglio pianificazione"""
+    return _get_schedule(schedule_id, db)
+
+
+@router.put("/{schedule_id}", response_model=ScheduleResponse)
+async def update_schedule(schedule_id: int, schedule_data: ScheduleUpdate, db: Session = Depends(get_db)):
+    """Aggiorna pianificazione"""
+    schedule = _get_schedule(schedule_id, db)
+
+    update_data = schedule_data.model_dump(exclude_unset=True)
+    if "cron" in update_data:
+        schedule.next_run_at = _next_run_or_400(update_data["cron"])
+    if update_data.get("jitter_seconds") is not None and update_data["jitter_seconds"] < 0:
+        raise HTTPException(status_code=400, detail="Il jitter non può essere negativo")
+
+    for key, value in update_data.items():
+        setattr(schedule, key, value)
+
+    db.commit()
+    db.refresh(schedule)
+
+    return schedule
+
+
+@router.delete("/{schedule_id}")
+async def delete_schedule(schedule_id: int, db: Session = Depends(get_db)):
+    """Elimina pianificazione"""
+    schedule = _get_schedule(schedule_id, db)
+    db.delete(schedule)
+    db.commit()
+
+    return {"message": "Pianificazione eliminata"}
+
+
+@router.post("/{schedule_id}/run", status_code=status.HTTP_202_ACCEPTED)
+async def run_schedule_now(schedule_id: int, db: Session = Depends(get_db)):
+    """Avvia subito il refresh (senza jitter)"""
+    _get_schedule(schedule_id, db)
+
+    if not report_scheduler.trigger(schedule_id):
+        raise HTTPException(status_code=409, detail="Refresh già in corso")
+
+    return {"message": "Refresh avviato"}
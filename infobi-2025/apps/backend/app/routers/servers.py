@@ -18,7 +18,7 @@ router = APIRouter(prefix="/api/v1/servers", tags=["Database Servers"], dependen
 
 class ServerCreate(BaseModel):
     name: str
-    db_type: str  # mssql, postgresql, mysql
+    db_type: str  # mssql, postgresql, mysql, sqlite
     server: str
     database: str
     port: Optional[int] = None
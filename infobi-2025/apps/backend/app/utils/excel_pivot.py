@@ -0,0 +1,287 @@
+"""
+Export Excel con Tabella Pivot nativa
+I dati vengono scritti una sola volta (foglio compatto, write-only);
+la pivot (cache + definizione) viene ricalcolata da Excel all'apertura
+"""
+import json
+import io
+import openpyxl
+import pyarrow as pa
+from openpyxl.utils import get_column_letter
+from openpyxl.pivot.cache import (
+    CacheDefinition,
+    CacheField,
+    CacheSource,
+    SharedItems,
+    WorksheetSource,
+)
+from openpyxl.pivot.record import Missing
+from openpyxl.pivot.table import (
+    DataField,
+    FieldItem,
+    Location,
+    PivotField,
+    PivotTableStyle,
+    RowColField,
+    RowColItem,
+    TableDefinition,
+)
+from typing import Any, Dict, List, Optional, Tuple
+
+DATA_SHEET_TITLE = "Dati"
+PIVOT_SHEET_TITLE = "Pivot"
+
+# Aggregazioni Perspective / .rep -> subtotal Excel
+_SUBTOTALS = {
+    "sum": "sum",
+    "count": "count",
+    "avg": "average",
+    "mean": "average",
+    "average": "average",
+    "min": "min",
+    "max": "max",
+}
+
+# Conteggio distinti: la pivot nativa (senza Data Model) non lo supporta
+_DISTINCT_AGGREGATES = {"distinct count", "count distinct", "distinct"}
+
+_SUBTOTAL_LABELS = {
+    "sum": "Somma",
+    "count": "Conteggio",
+    "average": "Media",
+    "min": "Min",
+    "max": "Max",
+}
+
+
+def resolve_pivot_spec(
+    table: pa.Table,
+    pivot_config: Optional[Dict[str, Any]],
+    perspective_layout: Optional[str] = None
+) -> Tuple[List[str], List[str], List[Tuple[str, str]]]:
+    """
+    Ricava righe, colonne e valori della pivot
+
+    Ordine di priorità:
+    1. pivot_config: row_groups, split_by, aggregations {campo: funzione}
+       (accetta anche le chiavi .rep rowGroups, pivotCols, valueCols)
+    2. perspective_layout del report: group_by, split_by, columns, aggregates
+    3. Valori di default: somma di tutte le colonne numeriche
+
+    Returns:
+        (campi riga, campi colonna, [(campo valore, subtotal Excel)])
+
+    Raises:
+        ValueError: aggregazione non rappresentabile (conteggio distinti)
+    """
+    pivot_config = pivot_config or {}
+    layout: Dict[str, Any] = {}
+    if perspective_layout:
+        try:
+            layout = json.loads(perspective_layout)
+        except (TypeError, ValueError):
+            layout = {}
+
+    columns = table.column_names
+
+    rows = (pivot_config.get("row_groups") or pivot_config.get("rowGroups")
+            or layout.get("group_by") or layout.get("row_pivots") or [])
+    cols = (pivot_config.get("split_by") or pivot_config.get("pivotCols")
+            or layout.get("split_by") or layout.get("column_pivots") or [])
+
+    rows = [f for f in rows if f in columns]
+    cols = [f for f in cols if f in columns and f not in rows]
+
+    values: List[Tuple[str, str]] = []
+    if pivot_config.get("aggregations"):
+        values = list(pivot_config["aggregations"].items())
+    elif pivot_config.get("valueCols"):
+        values = [(v.get("field"), v.get("aggFunc", "sum")) for v in pivot_config["valueCols"]]
+    elif layout.get("columns"):
+        aggregates = layout.get("aggregates") or {}
+        values = [(f, aggregates.get(f, "sum")) for f in layout["columns"] if f]
+
+    axis_fields = set(rows) | set(cols)
+    for field, agg in values:
+        if str(agg).lower() in _DISTINCT_AGGREGATES:
+            raise ValueError(f"Aggregazione '{agg}' su {field} non supportata dalla pivot nativa Excel")
+
+    values = [
+        (field, _SUBTOTALS.get(str(agg).lower(), "sum"))
+        for field, agg in values
+        if field in columns and field not in axis_fields
+    ]
+
+    if not values:
+        values = [
+            (field.name, "sum")
+            for field in table.schema
+            if field.name not in axis_fields
+            and (pa.types.is_integer(field.type) or pa.types.is_floating(field.type))
+        ]
+
+    return rows, cols, values
+
+
+def export_to_excel_native_pivot(
+    table: pa.Table,
+    pivot_config: Optional[Dict[str, Any]] = None,
+    perspective_layout: Optional[str] = None
+) -> bytes:
+    """
+    Esporta i dati grezzi su un foglio compatto e aggiunge una Tabella Pivot nativa
+
+    La cache pivot non contiene record (saveData=0, refreshOnLoad=1):
+    Excel la ricostruisce dal foglio dati all'apertura del file.
+
+    Args:
+        table: Risultato della query in formato Arrow
+        pivot_config: Configurazione pivot della richiesta
+        perspective_layout: Layout Perspective salvato nel report (JSON)
+
+    Returns:
+        bytes: File Excel in formato bytes
+
+    Raises:
+        ValueError: aggregazione non supportata (vedi resolve_pivot_spec)
+    """
+    rows, cols, values = resolve_pivot_spec(table, pivot_config, perspective_layout)
+    columns = table.column_names
+
+    wb = openpyxl.Workbook(write_only=True)
+    pivot_ws = wb.create_sheet(title=PIVOT_SHEET_TITLE)
+    data_ws = wb.create_sheet(title=DATA_SHEET_TITLE)
+
+    # Foglio dati: header + righe, nessuno stile (file compatto)
+    data_ws.append(columns)
+    for batch in table.to_batches():
+        for row in zip(*(column.to_pylist() for column in batch.columns)):
+            data_ws.append(row)
+
+    if columns and values:
+        last_ref = f"{get_column_letter(len(columns))}{table.num_rows + 1}"
+        _add_pivot(pivot_ws, _build_pivot(columns, rows, cols, values, f"A1:{last_ref}"))
+    else:
+        pivot_ws.append(["Nessun valore numerico da aggregare"])
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def _add_pivot(ws: Any, pivot: TableDefinition):
+    """
+    Aggiunge la pivot a un foglio write-only
+    WriteOnlyWorksheet non espone add_pivot: usa l'attributo privato _pivots,
+    letto da ExcelWriter.write_worksheet (openpyxl fissato a 3.1.x in requirements.txt,
+    verificato da tests/test_excel_pivot.py rileggendo il file)
+    """
+    if not hasattr(ws, "_pivots"):
+        raise RuntimeError("Versione di openpyxl non supportata per la pivot nativa (richiesta 3.1.x)")
+    ws._pivots.append(pivot)
+
+
+def _location(rows: List[str], cols: List[str], values: List[Tuple[str, str]]) -> Location:
+    """
+    Area minima della pivot (intestazioni + riga del totale) a partire da A3
+    L'area effettiva dipende dai valori distinti: Excel la ricalcola al refresh all'apertura
+    """
+    has_col_header = bool(cols) or len(values) > 1
+    width = max(1, len(rows)) + max(1, len(values))
+    height = 2 + int(has_col_header)
+    return Location(
+        ref=f"A3:{get_column_letter(width)}{2 + height}",
+        firstHeaderRow=1,
+        firstDataRow=1 + int(has_col_header),
+        firstDataCol=max(1, len(rows)),
+    )
+
+
+def _build_pivot(
+    columns: List[str],
+    rows: List[str],
+    cols: List[str],
+    values: List[Tuple[str, str]],
+    source_ref: str
+) -> TableDefinition:
+    """Definizione pivot + cache (senza record) sul range del foglio dati"""
+    index = {name: idx for idx, name in enumerate(columns)}
+
+    cache = CacheDefinition(
+        refreshOnLoad=True,
+        saveData=False,
+        createdVersion=3,
+        refreshedVersion=3,
+        minRefreshableVersion=3,
+        recordCount=0,
+        cacheSource=CacheSource(
+            type="worksheet",
+            worksheetSource=WorksheetSource(ref=source_ref, sheet=DATA_SHEET_TITLE)
+        ),
+        cacheFields=[
+            CacheField(
+                name=name,
+                numFmtId=0,
+                sharedItems=SharedItems(_fields=[Missing()], containsBlank=True)
+            )
+            for name in columns
+        ],
+    )
+
+    data_fields = {field for field, _ in values}
+    pivot_fields = []
+    for name in columns:
+        if name in rows or name in cols:
+            pivot_fields.append(PivotField(
+                axis="axisRow" if name in rows else "axisCol",
+                showAll=False,
+                items=[FieldItem(t="default")],
+            ))
+        else:
+            pivot_fields.append(PivotField(dataField=name in data_fields, showAll=False))
+
+    col_fields = [RowColField(x=index[name]) for name in cols]
+    if len(values) > 1:
+        # x=-2: i valori multipli diventano colonne
+        col_fields.append(RowColField(x=-2))
+
+    pivot = TableDefinition(
+        name="PivotInfoBi",
+        cacheId=1,
+        dataCaption="Valori",
+        createdVersion=3,
+        updatedVersion=3,
+        minRefreshableVersion=3,
+        useAutoFormatting=True,
+        itemPrintTitles=True,
+        indent=0,
+        outline=True,
+        outlineData=True,
+        multipleFieldFilters=False,
+        location=_location(rows, cols, values),
+        pivotFields=pivot_fields,
+        rowFields=[RowColField(x=index[name]) for name in rows],
+        rowItems=[RowColItem()],
+        colFields=col_fields,
+        colItems=[RowColItem()],
+        dataFields=[
+            DataField(
+                name=f"{_SUBTOTAL_LABELS.get(subtotal, subtotal)} di {field}",
+                fld=index[field],
+                subtotal=subtotal,
+                baseField=0,
+                baseItem=0,
+            )
+            for field, subtotal in values
+        ],
+        pivotTableStyleInfo=PivotTableStyle(
+            name="PivotStyleLight16",
+            showRowHeaders=True,
+            showColHeaders=True,
+            showRowStripes=False,
+            showColStripes=False,
+            showLastColumn=True,
+        ),
+    )
+    pivot.cache = cache
+    return pivot
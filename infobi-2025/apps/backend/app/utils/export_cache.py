@@ -0,0 +1,140 @@
+"""
+Cache su disco dei file di export generati
+Chiave: report + configurazione pivot normalizzata + impronta dei dati
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ExportCache:
+    """
+    File di export su disco con TTL e quota
+    - TTL calcolato dalla creazione del file (mtime)
+    - Quota gestita con eviction LRU sull'ultimo accesso (atime, aggiornato a mano)
+    """
+
+    def __init__(self, cache_dir: Path, ttl_seconds: int, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def build_key(
+        report_id: int,
+        pivot_config: Optional[Dict[str, Any]],
+        fingerprint: str,
+        variant: str = "xlsx"
+    ) -> str:
+        """
+        Costruisce la chiave di cache
+        La pivot_config viene normalizzata (chiavi ordinate) per rendere
+        equivalenti configurazioni uguali inviate in ordine diverso
+        """
+        normalized_pivot = json.dumps(pivot_config or {}, sort_keys=True, separators=(",", ":"), default=str)
+        raw_key = f"{report_id}|{variant}|{normalized_pivot}|{fingerprint}"
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.cache_dir / f"{key}.{suffix}"
+
+    def get(self, key: str, suffix: str = "xlsx") -> Optional[Path]:
+        """Restituisce il path del file in cache se presente e non scaduto"""
+        path = self._path(key, suffix)
+
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        now = time.time()
+        if now - stat.st_mtime > self.ttl_seconds:
+            self._remove(path)
+            return None
+
+        # Aggiorna l'ultimo accesso (base per l'eviction LRU), mtime invariato
+        try:
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+
+        return path
+
+    def put(self, key: str, content: bytes, suffix: str = "xlsx") -> Path:
+        """Salva un file in cache (scrittura atomica) e applica la quota"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key, suffix)
+
+        # File temporaneo + rename: mai file parziali visibili ad altre richieste
+        tmp_path = self.cache_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        self._enforce_quota()
+        return path
+
+    def clear(self) -> int:
+        """Svuota la cache, restituisce il numero di file rimossi"""
+        removed = 0
+        if self.cache_dir.exists():
+            for path in self.cache_dir.iterdir():
+                if path.is_file():
+                    self._remove(path)
+                    removed += 1
+        return removed
+
+    def _enforce_quota(self):
+        """Rimuove file scaduti e poi i meno usati finché la quota è rispettata"""
+        now = time.time()
+        entries = []
+        total_size = 0
+
+        for path in self.cache_dir.iterdir():
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._remove(path)
+                continue
+
+            entries.append((stat.st_atime, stat.st_size, path))
+            total_size += stat.st_size
+
+        if total_size <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            self._remove(path)
+            total_size -= size
+            logger.info(f"Export cache: rimosso {path.name} (quota)")
+            if total_size <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _remove(path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Istanza globale
+export_cache = ExportCache(
+    cache_dir=settings.EXPORT_CACHE_PATH,
+    ttl_seconds=settings.EXPORT_CACHE_TTL_SECONDS,
+    max_bytes=settings.EXPORT_CACHE_MAX_MB * 1024 * 1024
+)
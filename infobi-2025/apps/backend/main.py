@@ -1,17 +1,27 @@
+import asyncio
 import uvicorn
-import os
-from pathlib import Path
 from typing import Dict, Any, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends, HTTPException, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
+import pyarrow as pa
 
 from app.core.config import settings
 from app.core.models import init_db, create_default_admin
+from app.core.security import require_admin, get_current_user
+from app.core.arrow_utils import ArrowConverter, IpcStreamEncoder, create_arrow_response_headers
+from app.legacy_engine.connection_pool import legacy_pool
+from app.legacy_engine.query_loader import legacy_engine, query_template_cache
+from app.legacy_engine.catalog import report_catalog, etag_matches
+from app.legacy_engine.snapshots import snapshot_store
+from app.core.scheduler import report_scheduler
+from app.core.change_detection import change_detector
+from app.core.file_lock import named_lock
 
 # Import routers
-from app.routers import auth, servers, reports
+from app.routers import auth, servers, reports, schedules
 
 # --- Configurazione App ---
 app = FastAPI(
@@ -26,10 +36,29 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup_event():
     """Inizializzazione al startup"""
-    init_db()
-    create_default_admin()
+    # Con più worker: migrazioni e admin di default creati da un worker alla volta
+    # (attesa del lock e lavoro sul DB fuori dall'event loop)
+    init_lock = named_lock("init-db")
+    await init_lock.acquire()
+    try:
+        await asyncio.to_thread(init_db)
+        await asyncio.to_thread(create_default_admin)
+    finally:
+        init_lock.release()
+    await legacy_pool.start()
+    await report_catalog.start()
+    await report_scheduler.start()
+    await change_detector.start()
     print("✅ InfoBi Platform avviata")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Rilascio risorse allo shutdown"""
+    await legacy_pool.close()
+    await report_catalog.close()
+    await report_scheduler.close()
+    await change_detector.close()
+
 # --- Configurazione CORS ---
 origins = [
     "http://localhost:3000",
@@ -44,18 +73,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Type"]
+    expose_headers=["Content-Type", "ETag"]
 )
 
 # --- Modelli Dati ---
 class QueryRequest(BaseModel):
     query_name: str
     params: Optional[Dict[str, Any]] = {}
+    format: str = "arrow"  # "arrow" o "json"
+    stream: bool = False  # solo arrow: blocchi IPC inviati man mano
 
 # --- Include Routers ---
 app.include_router(auth.router)
 app.include_router(servers.router)
 app.include_router(reports.router)
+app.include_router(schedules.router)
 
 # --- Rotte API ---
 
@@ -68,48 +100,121 @@ def read_root():
     }
 
 @app.get("/api/v1/reports-list")
-def list_reports():
+def list_reports(if_none_match: Optional[str] = Header(None)):
+    """
+    Elenco delle query .qry raggruppate per categoria (dal catalogo in memoria).
+    Supporta ETag / If-None-Match (304 se invariato).
     """
-    Scansiona la cartella queries e restituisce l'albero dei file.
+    grouped, etag = report_catalog.list_grouped()
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=grouped, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.get("/api/v1/report-config/{report_name:path}")
+def get_report_config(report_name: str, if_none_match: Optional[str] = Header(None)):
+    """Configurazione .rep di un report (initialConfig, campi, metriche calcolate)"""
+    found = report_catalog.get_report_config(report_name)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"Configurazione '{report_name}' non trovata")
+
+    config, etag = found
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=config, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.post("/api/v1/legacy/query")
+async def execute_legacy_query(
+    request: QueryRequest,
+    current_user: dict = Depends(get_current_user)
+):
     """
-    reports = []
-    # Risolviamo il path in modo assoluto per sicurezza
-    root_path = settings.QUERIES_PATH.resolve()
-    
-    if not root_path.exists():
-        return {"error": f"Cartella non trovata: {root_path}"}
-
-    # Scorre ricorsivamente le cartelle
-    for root, dirs, files in os.walk(root_path):
-        for file in files:
-            if file.endswith(".qry"):
-                full_path = Path(root) / file
-                
-                try:
-                    # Calcola il percorso relativo (es. "vendite/mensile.qry")
-                    relative_path = full_path.relative_to(root_path)
-                    
-                    # Nome categoria (cartella padre) o "Generale" se è nella root
-                    category = relative_path.parent.name if relative_path.parent.name else "Generale"
-                    
-                    reports.append({
-                        "name": file.replace(".qry", ""),
-                        # Sostituiamo backslash con slash per standard web
-                        "path": str(relative_path).replace("\\", "/").replace(".qry", ""),
-                        "category": category.capitalize()
-                    })
-                except ValueError:
-                    continue
-    
-    # Raggruppa per categoria
-    grouped = {}
-    for r in reports:
-        cat = r["category"]
-        if cat not in grouped:
-            grouped[cat] = []
-        grouped[cat].append(r)
-        
-    return grouped
+    Esegue una query .qry del Legacy Engine
+    - format=json: {count, data}
+    - format=arrow: Arrow IPC stream (con stream=true i blocchi arrivano man mano)
+    - params.codazi può essere una lista: esecuzione parallela e colonna Azienda
+    """
+    if request.format not in ("arrow", "json"):
+        raise HTTPException(status_code=400, detail="Formato non supportato (arrow, json)")
+
+    if request.format == "json":
+        results = await legacy_engine.execute(request.query_name, request.params)
+        return {"count": len(results), "data": results}
+
+    if not request.stream:
+        table = await legacy_engine.execute_arrow(request.query_name, request.params)
+        return Response(
+            content=ArrowConverter.table_to_arrow_bytes(table),
+            media_type="application/vnd.apache.arrow.stream",
+            headers=create_arrow_response_headers()
+        )
+
+    batches = legacy_engine.iter_batches(request.query_name, request.params)
+
+    # Il primo blocco viene letto prima di inviare gli header:
+    # errori di connessione/SQL diventano un 500 invece di uno stream troncato
+    try:
+        first_batch = await batches.__anext__()
+    except StopAsyncIteration:
+        first_batch = None
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore SQL Server: {str(e)}")
+
+    if first_batch is None:
+        # Query senza result set (es. solo istruzioni)
+        return Response(
+            content=ArrowConverter.table_to_arrow_bytes(pa.table({})),
+            media_type="application/vnd.apache.arrow.stream",
+            headers=create_arrow_response_headers()
+        )
+
+    async def _ipc_chunks():
+        encoder = IpcStreamEncoder()
+        try:
+            chunk = encoder.encode(first_batch)
+            if chunk:
+                yield chunk
+            async for batch in batches:
+                chunk = encoder.encode(batch)
+                if chunk:
+                    yield chunk
+            yield encoder.finish()
+        finally:
+            # Rilascia la connessione anche se il client si disconnette
+            await batches.aclose()
+
+    return StreamingResponse(
+        _ipc_chunks(),
+        media_type="application/vnd.apache.arrow.stream",
+        headers=create_arrow_response_headers()
+    )
+
+@app.get("/api/v1/legacy/pool-stats", dependencies=[Depends(require_admin)])
+def legacy_pool_stats():
+    """Statistiche del pool di connessioni del Legacy Engine"""
+    return legacy_pool.stats()
+
+@app.get("/api/v1/legacy/template-cache", dependencies=[Depends(require_admin)])
+def legacy_template_cache_stats():
+    """Statistiche della cache dei template .qry compilati"""
+    return query_template_cache.stats()
+
+@app.delete("/api/v1/legacy/template-cache", dependencies=[Depends(require_admin)])
+def legacy_template_cache_clear():
+    """Svuota la cache dei template (i file vengono riletti alla prossima query)"""
+    query_template_cache.invalidate()
+    return {"status": "ok"}
+
+@app.get("/api/v1/legacy/snapshots", dependencies=[Depends(require_admin)])
+def legacy_snapshot_stats():
+    """Statistiche degli snapshot Parquet degli esercizi chiusi"""
+    return snapshot_store.stats()
+
+@app.delete("/api/v1/legacy/snapshots", dependencies=[Depends(require_admin)])
+def legacy_snapshot_clear(query_name: Optional[str] = None):
+    """Elimina gli snapshot (di una query o tutti): verranno rigenerati alla prossima esecuzione"""
+    return {"removed": snapshot_store.clear(query_name)}
 
 # --- Router Registration ---
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
@@ -118,4 +223,8 @@ app.include_router(reports.router, prefix="/api/v1/reports", tags=["Reports"])
 
 if __name__ == "__main__":
     # Avvio su porta 8090
-    uvicorn.run("main:app", host="0.0.0.0", port=8090, reload=True)
\ No newline at end of file
+    if settings.WORKERS > 1:
+        # Produzione: più processi, cache risultati su disco condivisa e lock su file
+        uvicorn.run("main:app", host="0.0.0.0", port=8090, workers=settings.WORKERS)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8090, reload=settings.RELOAD)
\ No newline at end of file
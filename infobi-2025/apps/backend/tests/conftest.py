@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Import del package "app" eseguendo pytest da qualsiasi cartella
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,69 @@
+"""
+Conversione a blocchi e unificazione dei tipi (ArrowConverter, StreamSchema, IpcStreamEncoder)
+"""
+from decimal import Decimal
+
+import pyarrow as pa
+
+from app.core.arrow_utils import ArrowConverter, IpcStreamEncoder, StreamSchema
+
+
+def _batches():
+    # Primo blocco con la colonna numerica tutta NULL, poi valori float/Decimal
+    return [
+        ArrowConverter.rows_to_record_batch(["id", "v"], [(1, None), (2, None)]),
+        ArrowConverter.rows_to_record_batch(["id", "v"], [(3, Decimal("1.5")), (4, Decimal("2"))]),
+    ]
+
+
+def test_all_null_block_is_null_type():
+    batch = ArrowConverter.rows_to_record_batch(["v"], [(None,), (None,)])
+    assert pa.types.is_null(batch.schema.field("v").type)
+
+
+def test_mixed_batches_keep_numeric_type():
+    table = ArrowConverter.batches_to_table(_batches())
+    assert table.schema.field("v").type == pa.float64()
+    assert table.column("v").to_pylist() == [None, None, 1.5, 2.0]
+
+
+def test_column_null_in_every_batch_becomes_string():
+    batches = [ArrowConverter.rows_to_record_batch(["v"], [(None,)]) for _ in range(2)]
+    table = ArrowConverter.batches_to_table(batches)
+    assert table.schema.field("v").type == pa.string()
+
+
+def test_concat_tables_ignores_all_null_columns():
+    # Table con la sola riga NULL: colonna già risolta a string dall'esecuzione
+    typed = ArrowConverter.batches_to_table(_batches())
+    nulls = ArrowConverter.batches_to_table([ArrowConverter.rows_to_record_batch(["id", "v"], [(None, None)])])
+    table = ArrowConverter.concat_tables([typed, nulls])
+    assert table.schema.field("id").type == pa.int64()
+    assert table.schema.field("v").type == pa.float64()
+    assert table.num_rows == 5
+
+
+def test_stream_schema_waits_for_typed_column():
+    resolver = StreamSchema()
+    first, second = _batches()
+    assert resolver.push(first) == []
+    ready = resolver.push(second)
+    assert [b.num_rows for b in ready] == [2, 2]
+    assert all(b.schema.field("v").type == pa.float64() for b in ready)
+    # Blocchi successivi adeguati allo schema fissato
+    later = resolver.push(ArrowConverter.rows_to_record_batch(["id", "v"], [(5, None)]))
+    assert later[0].schema.equals(resolver.schema)
+
+
+def test_ipc_stream_encoder_single_schema():
+    encoder = IpcStreamEncoder()
+    data = b"".join(encoder.encode(batch) for batch in _batches()) + encoder.finish()
+    table = pa.ipc.open_stream(data).read_all()
+    assert table.schema.field("v").type == pa.float64()
+    assert table.column("v").to_pylist() == [None, None, 1.5, 2.0]
+
+
+def test_ipc_stream_encoder_empty_stream():
+    encoder = IpcStreamEncoder()
+    table = pa.ipc.open_stream(encoder.finish()).read_all()
+    assert table.num_rows == 0
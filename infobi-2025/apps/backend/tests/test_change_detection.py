@@ -0,0 +1,125 @@
+"""
+Rilevamento modifiche (build_change_signal_query, ChangeDetector) su un DB SQLite
+"""
+import asyncio
+import sqlite3
+
+import pyarrow as pa
+import pytest
+
+# Driver ODBC importato dal motore multi-DB (import del modulo)
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+from app.core.change_detection import ChangeDetector  # noqa: E402
+from app.core.database import db_engine  # noqa: E402
+from app.core.models import DBServer, Report  # noqa: E402
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.db"
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE ordini (id INTEGER PRIMARY KEY, importo REAL)")
+    connection.executemany("INSERT INTO ordini (importo) VALUES (?)", [(1.5,), (2.0,)])
+    connection.commit()
+    yield connection, {"database": str(path)}
+    connection.close()
+    db_engine.close_engine("1", "sqlite")
+
+
+def _server(db_type="sqlite", server_id=1):
+    return DBServer(id=server_id, name="test", db_type=db_type, server="", database="", is_active=True)
+
+
+def _report(**kw):
+    return Report(id=1, name="test", sql_query="SELECT 1", server_id=1, **kw)
+
+
+def test_signal_query_requires_tables():
+    with pytest.raises(ValueError):
+        db_engine.build_change_signal_query("sqlite", [" ", ""])
+    with pytest.raises(ValueError):
+        db_engine.build_change_signal_query("oracle", ["ordini"])
+
+
+def test_signal_query_binds_table_names():
+    sql, params = db_engine.build_change_signal_query("postgresql", ["public.ordini", "righe"])
+    assert params == {"_cs0": "public.ordini", "_cs1": "righe"}
+    assert "public.ordini" not in sql
+    assert "to_regclass(:_cs0)" in sql and "to_regclass(:_cs1)" in sql
+
+
+def test_mssql_signal_query_without_usage_stats():
+    full, _ = db_engine.build_change_signal_query("mssql", ["dbo.ordini"])
+    rows_only, _ = db_engine.build_change_signal_query("mssql", ["dbo.ordini"], usage_stats=False)
+    assert "dm_db_index_usage_stats" in full
+    assert "dm_db_index_usage_stats" not in rows_only
+    assert "dm_db_partition_stats" in rows_only
+
+
+def test_sqlite_signal_changes_with_data(source):
+    connection, config = source
+    detector = ChangeDetector()
+    report, server = _report(change_tables="ordini"), _server()
+
+    baseline = asyncio.run(detector.read_signal(report, server, config))
+    assert asyncio.run(detector.is_unchanged(report, server, config, baseline))
+
+    connection.execute("INSERT INTO ordini (importo) VALUES (3.0)")
+    connection.commit()
+    assert not asyncio.run(detector.is_unchanged(report, server, config, baseline))
+    assert detector.stats()["changes"] == 1
+
+
+def test_version_query_signal(source):
+    connection, config = source
+    detector = ChangeDetector()
+    report, server = _report(version_query="SELECT MAX(importo) AS v FROM ordini"), _server()
+
+    baseline = asyncio.run(detector.read_signal(report, server, config))
+    connection.execute("UPDATE ordini SET importo = 9 WHERE id = 1")
+    connection.commit()
+    assert asyncio.run(detector.read_signal(report, server, config)) != baseline
+
+
+def test_unreadable_signal_is_not_a_change(source):
+    _, config = source
+    detector = ChangeDetector()
+    report, server = _report(change_tables="mancante"), _server()
+
+    assert not asyncio.run(detector.is_unchanged(report, server, config, "baseline"))
+    stats = detector.stats()
+    assert stats["errors"] == 1
+    assert stats["changes"] == 0
+
+
+def test_mssql_permission_denied_falls_back_to_row_counts(monkeypatch):
+    queries = []
+
+    async def fake_execute_arrow(**kw):
+        queries.append(kw["query"])
+        if "dm_db_index_usage_stats" in kw["query"]:
+            raise RuntimeError("VIEW SERVER STATE permission was denied on object 'server'")
+        return pa.table({"object_id": [10], "row_count": [2]})
+
+    monkeypatch.setattr(db_engine, "execute_arrow", fake_execute_arrow)
+    detector = ChangeDetector()
+    report, server = _report(change_tables="dbo.ordini"), _server("mssql", server_id=7)
+
+    baseline = asyncio.run(detector.read_signal(report, server, {}))
+    assert asyncio.run(detector.is_unchanged(report, server, {}, baseline))
+    assert len(queries) == 3
+    assert detector.stats()["row_count_only_servers"] == [7]
+
+
+def test_other_errors_do_not_downgrade(monkeypatch):
+    async def fake_execute_arrow(**kw):
+        raise RuntimeError("Login timeout expired")
+
+    monkeypatch.setattr(db_engine, "execute_arrow", fake_execute_arrow)
+    detector = ChangeDetector()
+    report, server = _report(change_tables="dbo.ordini"), _server("mssql")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(detector.read_signal(report, server, {}))
+    assert detector.stats()["row_count_only_servers"] == []
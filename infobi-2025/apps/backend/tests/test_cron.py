@@ -0,0 +1,87 @@
+"""
+Parser cron (CronExpression): sintassi dei campi e calcolo della prossima esecuzione
+"""
+from datetime import datetime
+
+import pytest
+
+from app.core.cron import CronError, CronExpression
+
+
+def test_ranges_steps_and_lists():
+    cron = CronExpression("0-10/5,30 8-9 * * *")
+    assert cron.minutes == {0, 5, 10, 30}
+    assert cron.hours == {8, 9}
+
+
+def test_step_from_start_value():
+    assert CronExpression("5/15 * * * *").minutes == {5, 20, 35, 50}
+    assert CronExpression("*/20 * * * *").minutes == {0, 20, 40}
+
+
+def test_sunday_as_zero_or_seven():
+    assert CronExpression("0 0 * * 7").weekdays == {0}
+    assert CronExpression("0 0 * * 5-7").weekdays == {0, 5, 6}
+
+
+@pytest.mark.parametrize("expression", [
+    "* * * *",
+    "60 * * * *",
+    "* 24 * * *",
+    "* * 0 * *",
+    "* * * 13 *",
+    "* * * * 8",
+    "5-1 * * * *",
+    "*/0 * * * *",
+    "a * * * *",
+    "1-x * * * *",
+])
+def test_invalid_expressions(expression):
+    with pytest.raises(CronError):
+        CronExpression(expression)
+
+
+def test_next_after_is_strictly_later():
+    cron = CronExpression("30 8 * * *")
+    assert cron.next_after(datetime(2025, 3, 10, 8, 30)) == datetime(2025, 3, 11, 8, 30)
+    assert cron.next_after(datetime(2025, 3, 10, 8, 29, 59)) == datetime(2025, 3, 10, 8, 30)
+
+
+def test_day_of_month_or_day_of_week():
+    # Entrambi vincolati: il 15 del mese OPPURE di lunedì
+    cron = CronExpression("0 6 15 * 1")
+    # 2025-03-12 è mercoledì: lunedì 17 viene dopo sabato 15
+    assert cron.next_after(datetime(2025, 3, 12)) == datetime(2025, 3, 15, 6, 0)
+    assert cron.next_after(datetime(2025, 3, 15, 7)) == datetime(2025, 3, 17, 6, 0)
+
+
+def test_day_of_week_only():
+    # Solo giorni lavorativi: da venerdì sera a lunedì
+    cron = CronExpression("0 7 * * 1-5")
+    assert cron.next_after(datetime(2025, 3, 14, 20)) == datetime(2025, 3, 17, 7, 0)
+
+
+def test_month_and_year_rollover():
+    cron = CronExpression("0 0 1 * *")
+    assert cron.next_after(datetime(2025, 12, 31, 23, 59)) == datetime(2026, 1, 1, 0, 0)
+    assert cron.next_after(datetime(2025, 1, 31, 12)) == datetime(2025, 2, 1, 0, 0)
+
+
+def test_day_missing_in_some_months():
+    cron = CronExpression("0 0 31 * *")
+    assert cron.next_after(datetime(2025, 1, 31, 1)) == datetime(2025, 3, 31, 0, 0)
+
+
+def test_leap_day():
+    cron = CronExpression("0 12 29 2 *")
+    assert cron.next_after(datetime(2025, 1, 1)) == datetime(2028, 2, 29, 12, 0)
+
+
+def test_restricted_months():
+    cron = CronExpression("15 3 * 1,7 *")
+    assert cron.next_after(datetime(2025, 2, 1)) == datetime(2025, 7, 1, 3, 15)
+
+
+def test_impossible_date():
+    with pytest.raises(CronError):
+        CronExpression("0 0 30 2 *").next_after(datetime(2025, 1, 1))
@@ -0,0 +1,74 @@
+"""
+Export CSV in streaming (stream_csv): numeri localizzati, virgolette, encoding
+"""
+from decimal import Decimal
+
+import pyarrow as pa
+import pytest
+
+from app.utils.csv_export import stream_csv, validate_csv_options
+
+
+def _csv(table, **kw):
+    return b"".join(stream_csv(table.to_batches(max_chunksize=2), **kw)).decode(kw.get("encoding", "utf-8"))
+
+
+def test_localized_decimals_are_not_quoted():
+    table = pa.table({"cliente": ["Rossi", "Bianchi"], "importo": [1.25, -3.0]})
+    assert _csv(table) == "cliente;importo\nRossi;1,25\nBianchi;-3\n"
+
+
+def test_no_scientific_notation():
+    table = pa.table({"v": [1e20, 1e-7, 123456789012.5, 0.1]})
+    assert _csv(table).splitlines()[1:] == ["100000000000000000000", "0,0000001", "123456789012,5", "0,1"]
+
+
+def test_dot_separator_keeps_plain_numbers():
+    table = pa.table({"v": [2.5e-8]})
+    assert _csv(table, delimiter=",", decimal_separator=".") == "v\n0.000000025\n"
+
+
+def test_decimal_columns_localized():
+    table = pa.table({"v": pa.array([Decimal("1.50"), None], pa.decimal128(10, 2))})
+    assert _csv(table) == "v\n1,50\n\n"
+
+
+def test_text_quoted_only_when_needed():
+    table = pa.table({"nota": ['semplice', 'con; punto e virgola', 'con "virgolette"', "a\ncapo", None], "n": [1, 2, 3, 4, None]})
+    assert _csv(table).splitlines() == [
+        "nota;n",
+        "semplice;1",
+        '"con; punto e virgola";2',
+        '"con ""virgolette""";3',
+        '"a',
+        'capo";4',
+        ";",
+    ]
+
+
+def test_header_once_across_batches():
+    table = pa.table({"a": list(range(5))})
+    assert _csv(table) == "a\n0\n1\n2\n3\n4\n"
+
+
+def test_reencoding_with_bom_once():
+    table = pa.table({"città": ["Forlì"] * 3})
+    data = b"".join(stream_csv(table.to_batches(max_chunksize=1), encoding="utf-8-sig"))
+    assert data.count(b"\xef\xbb\xbf") == 1
+    assert data.decode("utf-8-sig") == "città\nForlì\nForlì\nForlì\n"
+
+
+def test_empty_batch_has_header():
+    batch = pa.record_batch({"a": pa.array([], pa.int64()), "b": pa.array([], pa.float64())})
+    assert b"".join(stream_csv([batch])) == b"a;b\n"
+
+
+@pytest.mark.parametrize("delimiter, decimal_separator, encoding", [
+    (";;", ",", "utf-8"),
+    (";", ",,", "utf-8"),
+    (",", ",", "utf-8"),
+    (";", ",", "encoding-inesistente"),
+])
+def test_invalid_options(delimiter, decimal_separator, encoding):
+    with pytest.raises(ValueError):
+        validate_csv_options(delimiter, decimal_separator, encoding)
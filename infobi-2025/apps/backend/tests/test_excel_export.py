@@ -0,0 +1,26 @@
+"""
+Export Excel multi-foglio (un foglio per valore del primo raggruppamento)
+"""
+import io
+
+import openpyxl
+import pyarrow as pa
+
+from app.utils.excel_export import export_to_excel_multisheet
+
+
+def test_one_sheet_per_first_group():
+    table = pa.table({
+        "zona": ["Nord", "Sud", "Nord", None],
+        "agente": ["A", "B", "C", "A"],
+        "importo": [1.5, 2.0, 3.0, 4.0],
+    })
+    data = export_to_excel_multisheet(table, {"row_groups": ["zona", "agente"]})
+    wb = openpyxl.load_workbook(io.BytesIO(data))
+
+    assert sorted(wb.sheetnames) == ["(vuoto)", "Nord", "Sud"]
+    rows = list(wb["Nord"].iter_rows(values_only=True))
+    assert rows[0] == ("zona", "agente", "importo")
+    assert rows[1:] == [("Nord", "A", 1.5), ("Nord", "C", 3.0)]
+    assert wb["Nord"].row_dimensions[2].outline_level == 1
+    assert wb["Nord"].cell(row=2, column=3).number_format == "#,##0.00"
@@ -0,0 +1,61 @@
+"""
+Export Excel con Tabella Pivot nativa (resolve_pivot_spec, export_to_excel_native_pivot)
+"""
+import io
+import zipfile
+
+import openpyxl
+import pyarrow as pa
+import pytest
+
+from app.utils.excel_pivot import export_to_excel_native_pivot, resolve_pivot_spec
+
+
+def _table():
+    return pa.table({"zona": ["N", "S", "N"], "cliente": ["a", "b", "a"], "importo": [1.0, 2.0, 3.0]})
+
+
+def test_aggregations_mapped_to_subtotals():
+    rows, cols, values = resolve_pivot_spec(_table(), {"row_groups": ["zona"], "aggregations": {"importo": "avg"}})
+    assert rows == ["zona"]
+    assert cols == []
+    assert values == [("importo", "average")]
+
+
+def test_distinct_count_rejected():
+    with pytest.raises(ValueError):
+        resolve_pivot_spec(_table(), {"row_groups": ["zona"], "aggregations": {"cliente": "distinct count"}})
+
+
+def test_pivot_written_to_workbook():
+    data = export_to_excel_native_pivot(_table(), {"row_groups": ["zona"]})
+    names = zipfile.ZipFile(io.BytesIO(data)).namelist()
+    assert any(name.startswith("xl/pivotTables/") for name in names)
+
+
+def test_pivot_survives_reload():
+    data = export_to_excel_native_pivot(
+        _table(), {"row_groups": ["zona"], "split_by": ["cliente"], "aggregations": {"importo": "max"}}
+    )
+    workbook = openpyxl.load_workbook(io.BytesIO(data))
+    assert workbook.sheetnames == ["Pivot", "Dati"]
+    assert list(workbook["Dati"].values) == [("zona", "cliente", "importo"), ("N", "a", 1.0), ("S", "b", 2.0), ("N", "a", 3.0)]
+
+    pivots = workbook["Pivot"]._pivots
+    assert len(pivots) == 1
+    pivot = pivots[0]
+    assert [field.x for field in pivot.rowFields] == [0]
+    assert [field.x for field in pivot.colFields] == [1]
+    assert [(field.fld, field.subtotal) for field in pivot.dataFields] == [(2, "max")]
+    assert pivot.location.ref == "A3:B5"
+
+    source = pivot.cache.cacheSource.worksheetSource
+    assert (source.sheet, source.ref) == ("Dati", "A1:C4")
+    assert pivot.cache.refreshOnLoad
+    assert [field.name for field in pivot.cache.cacheFields] == ["zona", "cliente", "importo"]
+
+
+def test_no_numeric_values_without_pivot():
+    data = export_to_excel_native_pivot(pa.table({"zona": ["N"]}), {"row_groups": ["zona"]})
+    workbook = openpyxl.load_workbook(io.BytesIO(data))
+    assert workbook["Pivot"]._pivots == []
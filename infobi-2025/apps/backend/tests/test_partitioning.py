@@ -0,0 +1,124 @@
+"""
+Esecuzione partizionata: calcolo delle partizioni (split_range, split_values,
+parse_partition_ranges, plan_partitions su SQLite)
+"""
+import asyncio
+import sqlite3
+from datetime import date, datetime
+
+import pytest
+
+# Driver ODBC importato dal motore multi-DB (import del modulo)
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+from app.core.database import db_engine  # noqa: E402
+from app.core.partitioning import (  # noqa: E402
+    execute_partitioned,
+    parse_partition_ranges,
+    plan_partitions,
+    split_range,
+    split_values,
+)
+
+
+def _bounds(partitions):
+    return [tuple((f["op"], f["value"]) for f in filters) for filters in partitions]
+
+
+def test_split_int_range_covers_all_values():
+    partitions = split_range(1, 10, 3)
+    assert _bounds(partitions) == [
+        ((">=", 1), ("<", 4)),
+        ((">=", 4), ("<", 7)),
+        ((">=", 7), ("<=", 10)),
+    ]
+
+
+def test_split_int_range_smaller_than_count():
+    assert _bounds(split_range(1, 3, 8)) == [((">=", 1), ("<", 2)), ((">=", 2), ("<=", 3))]
+
+
+def test_split_single_value():
+    assert _bounds(split_range(5, 5, 4)) == [(("=", 5),)]
+
+
+def test_split_float_range():
+    partitions = split_range(0.0, 1.0, 2)
+    assert _bounds(partitions) == [((">=", 0.0), ("<", 0.5)), ((">=", 0.5), ("<=", 1.0))]
+
+
+def test_split_date_range_from_iso_strings():
+    partitions = split_range("2024-01-01", "2024-12-31", 4)
+    assert partitions[0][0] == {"op": ">=", "value": date(2024, 1, 1)}
+    assert partitions[-1][1] == {"op": "<=", "value": date(2024, 12, 31)}
+    # Intervalli contigui, senza buchi né sovrapposizioni
+    for current, following in zip(partitions, partitions[1:]):
+        assert current[1]["value"] == following[0]["value"]
+    assert all(type(f["value"]) is date for filters in partitions for f in filters)
+
+
+def test_split_datetime_range():
+    partitions = split_range(datetime(2024, 1, 1), datetime(2024, 1, 1, 12), 3)
+    assert [filters[0]["value"].hour for filters in partitions] == [0, 4, 8]
+
+
+def test_split_values_round_robin():
+    partitions = split_values(["01", "02", "03", "04", "05"], 2)
+    assert _bounds(partitions) == [(("in", ["01", "03", "05"]),), (("in", ["02", "04"]),)]
+    assert len(split_values(["01"], 4)) == 1
+
+
+def test_parse_partition_ranges():
+    partitions = parse_partition_ranges(
+        '[{"from": "2024-01-01", "to": "2024-07-01"}, {"from": "2024-07-01"}, {"values": ["01", "02"]}]'
+    )
+    assert _bounds(partitions) == [
+        ((">=", date(2024, 1, 1)), ("<", date(2024, 7, 1))),
+        ((">=", date(2024, 7, 1)),),
+        (("in", ["01", "02"]),),
+    ]
+    assert parse_partition_ranges(None) is None
+
+
+@pytest.mark.parametrize("raw", ["{", "[]", '{"from": 1}', "[1]", '[{"values": []}]', "[{}]"])
+def test_invalid_partition_ranges(raw):
+    with pytest.raises(ValueError):
+        parse_partition_ranges(raw)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.db"
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE movimenti (id INTEGER, azienda TEXT, importo REAL)")
+    connection.executemany(
+        "INSERT INTO movimenti VALUES (?, ?, ?)",
+        [(i, f"0{i % 3 + 1}", float(i)) for i in range(1, 21)] + [(None, None, 0.5)]
+    )
+    connection.commit()
+    connection.close()
+    yield {"database": str(path)}
+    db_engine.close_engine("part", "sqlite")
+
+
+def test_plan_numeric_partitions(source):
+    partitions = asyncio.run(plan_partitions("part", "sqlite", source, "SELECT * FROM movimenti", "id", 4))
+    assert partitions[0][0] == {"op": ">=", "value": 1}
+    assert partitions[-2][1] == {"op": "<=", "value": 20}
+    assert partitions[-1] == [{"op": "is null"}]
+
+
+def test_plan_text_partitions(source):
+    partitions = asyncio.run(plan_partitions("part", "sqlite", source, "SELECT * FROM movimenti", "azienda", 2))
+    assert len(partitions) == 3
+    assert partitions[-1] == [{"op": "is null"}]
+    assert sorted(v for filters in partitions[:-1] for v in filters[0]["value"]) == ["01", "02", "03"]
+
+
+def test_partitioned_execution_returns_every_row(source):
+    query = "SELECT id, azienda, importo FROM movimenti ORDER BY id"
+    table = asyncio.run(execute_partitioned("part", "sqlite", source, query, "id", count=3))
+    assert table.num_rows == 21
+    # La partizione dei NULL non cambia il tipo delle colonne
+    assert table.schema.field("id").type == "int64"
+    assert sorted(v for v in table.column("id").to_pylist() if v is not None) == list(range(1, 21))
@@ -0,0 +1,105 @@
+"""
+Pushdown sul database sorgente (build_pushdown_query, _derived_source):
+WITH spostato sulla query esterna, ORDER BY della query salvata, TOP/LIMIT
+"""
+import pytest
+
+# Driver ODBC importato dal motore multi-DB (import del modulo)
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+from app.core.database import db_engine  # noqa: E402
+
+CTE_QUERY = (
+    "WITH x AS (SELECT a, b FROM t WHERE a = :p) "
+    "SELECT a AS k, SUM(b) AS s FROM x GROUP BY a ORDER BY a DESC, 2;"
+)
+
+
+def test_cte_hoisted_and_order_by_reapplied_mssql():
+    sql, params = db_engine.build_pushdown_query("mssql", CTE_QUERY, limit=5)
+    assert sql == (
+        "WITH x AS (SELECT a AS a, b AS b FROM t WHERE a = :p) "
+        "SELECT TOP (5) * FROM (SELECT a AS k, SUM(b) AS s FROM x GROUP BY a) AS [_src] "
+        "ORDER BY [k] DESC, [s] ASC"
+    )
+    assert params == {}
+
+
+def test_cte_hoisted_postgresql():
+    sql, _ = db_engine.build_pushdown_query("postgresql", CTE_QUERY, limit=5)
+    assert sql == (
+        'WITH x AS (SELECT a, b FROM t WHERE a = :p) '
+        'SELECT * FROM (SELECT a AS k, SUM(b) AS s FROM x GROUP BY a) AS "_src" '
+        'ORDER BY "k" DESC, "s" ASC LIMIT 5'
+    )
+
+
+def test_multiple_ctes_with_filter():
+    sql, params = db_engine.build_pushdown_query(
+        "mssql",
+        "with x as (select a from t), y as (select a from x) select a from y",
+        filters=[{"column": "a", "op": ">", "value": 1}]
+    )
+    assert sql.startswith("WITH x AS (")
+    assert "y AS (" in sql
+    assert sql.endswith("SELECT * FROM (SELECT a FROM y) AS [_src] WHERE [a] > :_pd0")
+    assert params == {"_pd0": 1}
+
+
+def test_trailing_order_by_on_result_column():
+    sql, _ = db_engine.build_pushdown_query("mssql", "select a from t order by a", limit=5)
+    assert sql == "SELECT TOP (5) * FROM (SELECT a FROM t) AS [_src] ORDER BY [a] ASC"
+
+
+def test_requested_order_by_replaces_saved_one():
+    sql, _ = db_engine.build_pushdown_query(
+        "mssql", "select a from t order by a", limit=5, order_by=[{"column": "a", "direction": "desc"}]
+    )
+    assert sql == "SELECT TOP (5) * FROM (SELECT a FROM t) AS [_src] ORDER BY [a] DESC"
+
+
+def test_order_by_on_hidden_column_stays_inside():
+    # b non è una colonna del risultato: ORDER BY interno, con OFFSET per SQL Server
+    sql, _ = db_engine.build_pushdown_query("mssql", "select a from t order by b", limit=5)
+    assert sql == "SELECT TOP (5) * FROM (SELECT a FROM t ORDER BY b OFFSET 0 ROWS) AS [_src]"
+
+    sql, _ = db_engine.build_pushdown_query("postgresql", "select a from t order by b", limit=5)
+    assert sql == 'SELECT * FROM (SELECT a FROM t ORDER BY b) AS "_src" LIMIT 5'
+
+
+def test_order_by_inside_subquery_untouched():
+    sql, _ = db_engine.build_pushdown_query(
+        "mssql", "select a, (select max(b) from u order by 1 offset 0 rows) as m from t", limit=2
+    )
+    assert sql == (
+        "SELECT TOP (2) * FROM (select a, (select max(b) from u order by 1 offset 0 rows) as m from t) "
+        "AS [_src]"
+    )
+
+
+def test_saved_top_keeps_its_order_by():
+    # TOP ... ORDER BY è ammesso in una tabella derivata e definisce quali righe restano
+    sql, _ = db_engine.build_pushdown_query("mssql", "select top 10 a from t order by a", limit=5)
+    assert sql == "SELECT TOP (5) * FROM (select top 10 a from t order by a) AS [_src]"
+
+
+def test_saved_limit_keeps_its_order_by():
+    sql, _ = db_engine.build_pushdown_query("postgresql", "select a from t order by a limit 10", limit=5)
+    assert sql == 'SELECT * FROM (select a from t order by a limit 10) AS "_src" LIMIT 5'
+
+
+def test_query_without_options_is_unchanged():
+    query = "select a from (select top 3 a from t order by a) s order by a desc"
+    assert db_engine.build_pushdown_query("mssql", query) == (query, {})
+
+
+def test_partition_bounds_with_cte():
+    sql = db_engine.build_partition_bounds_query("mssql", "WITH x AS (SELECT 1 AS a) SELECT a FROM x", "a")
+    assert sql.startswith("WITH x AS (")
+    assert sql.endswith("SELECT MIN([a]) AS [_low], MAX([a]) AS [_high] FROM (SELECT a FROM x) AS [_src]")
+
+
+@pytest.mark.parametrize("limit", [-1, "10"])
+def test_invalid_limit(limit):
+    with pytest.raises(ValueError):
+        db_engine.build_pushdown_query("mssql", "select a from t", limit=limit)
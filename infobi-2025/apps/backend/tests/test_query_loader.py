@@ -0,0 +1,45 @@
+"""
+Compilazione delle .qry (LegacyQueryEngine.compile_query) sul percorso AST
+"""
+import logging
+
+import pytest
+
+# Driver ODBC richiesto dal pool del Legacy Engine (import del modulo)
+pytest.importorskip("pyodbc", exc_type=ImportError)
+
+from app.core.config import settings  # noqa: E402
+from app.legacy_engine.query_loader import (  # noqa: E402
+    COMPANY_PLACEHOLDER,
+    SCENARIO_DATES,
+    SCENARIO_YEARS,
+    LegacyQueryEngine,
+)
+
+QRY_FILES = sorted(settings.QUERIES_PATH.rglob("*.qry"))
+
+
+@pytest.fixture(autouse=True)
+def ast_rewriter(monkeypatch):
+    monkeypatch.setattr(settings, "LEGACY_SQL_REWRITER", "ast")
+
+
+@pytest.mark.parametrize("scenario", [SCENARIO_YEARS, SCENARIO_DATES])
+@pytest.mark.parametrize("path", QRY_FILES, ids=lambda p: p.name)
+def test_shipped_queries_compile_without_fallback(path, scenario, caplog):
+    raw_sql = path.read_text(encoding="utf-8", errors="replace")
+
+    with caplog.at_level(logging.WARNING, logger="app.legacy_engine.query_loader"):
+        sql, parameter_sets = LegacyQueryEngine.compile_query(raw_sql, scenario, "01")
+
+    assert "Riscrittura AST non riuscita" not in caplog.text
+    assert parameter_sets >= 1
+    assert COMPANY_PLACEHOLDER not in sql
+    assert "{{" not in sql
+    assert " 01INFO" in " ".join(sql.split())
+    if scenario == SCENARIO_YEARS:
+        assert "AS Esercizio" in sql
+
+
+def test_shipped_queries_found():
+    assert QRY_FILES
@@ -0,0 +1,110 @@
+"""
+Cache risultati su disco condivisa tra worker (DiskResultStore, ResultCache)
+"""
+import os
+import sys
+
+import pyarrow as pa
+import pytest
+
+from app.core.config import settings
+from app.core.result_cache import DiskResultStore, ResultCache
+
+MB = 1024 * 1024
+
+
+def _worker(path, disk_max_bytes=64 * MB):
+    """Istanza indipendente, come un worker uvicorn sulla stessa cartella"""
+    return ResultCache(ttl_seconds=600, max_bytes=64 * MB, disk=DiskResultStore(path, disk_max_bytes))
+
+
+def _table(n=100):
+    return pa.table({"id": list(range(n)), "v": [float(i) for i in range(n)]})
+
+
+def test_result_shared_between_workers(tmp_path):
+    first, second = _worker(tmp_path), _worker(tmp_path)
+    first.put("report:1", _table())
+
+    entry = second.get("report:1")
+    assert entry is not None and entry.table.equals(_table())
+    assert second.stats()["disk_loads"] == 1
+
+
+def test_invalidation_seen_after_check_interval(tmp_path, monkeypatch):
+    first, second = _worker(tmp_path), _worker(tmp_path)
+    first.put("report:1", _table())
+    assert second.get("report:1") is not None
+
+    first.invalidate("report:1")
+    # Entro l'intervallo la copia in memoria viene servita senza leggere il disco
+    monkeypatch.setattr(settings, "RESULT_CACHE_DISK_CHECK_SECONDS", 3600.0)
+    assert second.get("report:1") is not None
+    assert second.get("report:1", revalidate=True) is None
+
+
+def test_get_does_not_stat_within_interval(tmp_path, monkeypatch):
+    cache = _worker(tmp_path)
+    cache.put("report:1", _table())
+    monkeypatch.setattr(settings, "RESULT_CACHE_DISK_CHECK_SECONDS", 3600.0)
+
+    calls = []
+    original = cache.disk.meta_mtime
+    monkeypatch.setattr(cache.disk, "meta_mtime", lambda key: calls.append(key) or original(key))
+    for _ in range(10):
+        assert cache.get("report:1") is not None
+    assert calls == []
+
+
+def test_put_does_not_rescan_directory(tmp_path, monkeypatch):
+    cache = _worker(tmp_path)
+    cache.put("report:0", _table())
+
+    scans = []
+    original = DiskResultStore._scan
+    monkeypatch.setattr(DiskResultStore, "_scan", lambda self: scans.append(1) or original(self))
+    for idx in range(1, 6):
+        cache.put(f"report:{idx}", _table())
+    assert scans == []
+    assert cache.disk.stats()["entries"] == 6
+
+
+def test_quota_evicts_least_recently_used(tmp_path):
+    first, second = _worker(tmp_path), _worker(tmp_path)
+    first.put("report:1", _table())
+    one = next(tmp_path.glob("*.arrow")).stat().st_size
+    first.disk.max_bytes = second.disk.max_bytes = int(one * 2.5)
+
+    second.put("report:2", _table())
+    # Accesso a report:1 da un altro worker: il meno recente diventa report:2
+    assert _worker(tmp_path).get("report:1") is not None
+    first.put("report:3", _table())
+
+    assert first.disk.meta_mtime("report:1") is not None
+    assert first.disk.meta_mtime("report:2") is None
+    assert first.disk.meta_mtime("report:3") is not None
+    assert first.disk.stats()["entries"] == 2
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="conteggio handle solo su Linux")
+def test_disk_load_leaves_no_open_handles(tmp_path):
+    _worker(tmp_path).put("report:1", _table())
+    before = len(os.listdir("/proc/self/fd"))
+
+    readers = [_worker(tmp_path) for _ in range(5)]
+    tables = [reader.get("report:1").table for reader in readers]
+
+    assert len(os.listdir("/proc/self/fd")) == before
+    assert all(table.num_rows == 100 for table in tables)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="file mappato non rimovibile su Windows")
+def test_replaced_version_removed_while_mapped(tmp_path):
+    first, second = _worker(tmp_path), _worker(tmp_path)
+    first.put("report:1", _table())
+    mapped = second.get("report:1").table
+
+    first.put("report:1", _table(10))
+    assert len(list(tmp_path.glob("*.arrow"))) == 1
+    assert mapped.num_rows == 100
+    assert second.get("report:1", revalidate=True).table.num_rows == 10
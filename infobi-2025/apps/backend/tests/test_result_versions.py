@@ -0,0 +1,133 @@
+"""
+Risposte delta: compute_delta e versioni dei risultati su disco (ResultVersionStore)
+"""
+import pyarrow as pa
+import pytest
+
+from app.core.result_versions import ResultVersionStore, compute_delta
+
+
+def _table(ids, values, names=("id", "importo")):
+    return pa.table({names[0]: ids, names[1]: values})
+
+
+def _rows(table, sort_key="id"):
+    return sorted(table.to_pylist(), key=lambda row: row[sort_key])
+
+
+def test_insert_update_delete():
+    previous = _table([1, 2, 3], [1.0, 2.0, 3.0])
+    current = _table([1, 2, 4], [1.0, 9.0, 4.0])
+
+    delta = compute_delta(previous, current, ["id"])
+
+    assert _rows(delta["insert"]) == [{"id": 4, "importo": 4.0}]
+    assert _rows(delta["update"]) == [{"id": 2, "importo": 9.0}]
+    assert _rows(delta["delete"]) == [{"id": 3}]
+
+
+def test_unchanged_result_is_empty_delta():
+    previous = _table([1, 2], [1.0, 2.0])
+    delta = compute_delta(previous, _table([1, 2], [1.0, 2.0]), ["id"])
+    assert all(part.num_rows == 0 for part in delta.values())
+
+    same = compute_delta(previous, previous, ["id"])
+    assert all(part.num_rows == 0 for part in same.values())
+
+
+def test_composite_key():
+    previous = pa.table({"anno": [2024, 2024], "mese": [1, 2], "importo": [1.0, 2.0]})
+    current = pa.table({"anno": [2024, 2025], "mese": [1, 2], "importo": [5.0, 2.0]})
+
+    delta = compute_delta(previous, current, ["anno", "mese"])
+
+    assert delta["update"].to_pylist() == [{"anno": 2024, "mese": 1, "importo": 5.0}]
+    assert delta["insert"].to_pylist() == [{"anno": 2025, "mese": 2, "importo": 2.0}]
+    assert delta["delete"].to_pylist() == [{"anno": 2024, "mese": 2}]
+
+
+def test_null_values_are_resent_as_update():
+    previous = _table([1, 2], [None, 2.0])
+    current = _table([1, 2], [None, 2.0])
+
+    delta = compute_delta(previous, current, ["id"])
+
+    # NULL non è uguale a NULL nel join: la riga viene reinviata (upsert idempotente)
+    assert _rows(delta["update"]) == [{"id": 1, "importo": None}]
+    assert delta["insert"].num_rows == 0
+    assert delta["delete"].num_rows == 0
+
+
+def test_null_key_is_not_matched():
+    previous = _table([None, 2], [1.0, 2.0])
+    current = _table([None, 2], [1.0, 2.0])
+
+    delta = compute_delta(previous, current, ["id"])
+
+    assert delta["insert"].to_pylist() == [{"id": None, "importo": 1.0}]
+    assert delta["delete"].to_pylist() == [{"id": None}]
+
+
+def test_column_change_is_not_comparable():
+    previous = _table([1], [1.0])
+    assert compute_delta(previous, _table([1], [1.0], names=("id", "totale")), ["id"]) is None
+    assert compute_delta(previous, _table([1], [1.0]), ["codice"]) is None
+    assert compute_delta(previous, _table([1], [1.0]), []) is None
+
+
+def test_type_change_is_cast_when_possible():
+    previous = pa.table({"id": pa.array([1, 2], pa.int32()), "importo": [1.0, 2.0]})
+    current = _table([1, 2], [1.0, 3.0])
+
+    delta = compute_delta(previous, current, ["id"])
+
+    assert delta["update"].to_pylist() == [{"id": 2, "importo": 3.0}]
+
+
+def test_incompatible_type_change_is_not_comparable():
+    previous = _table([1], ["x"])
+    assert compute_delta(previous, _table([1], [1.0]), ["id"]) is None
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultVersionStore(tmp_path, per_report=2, max_bytes=1024 * 1024)
+
+
+def test_version_shared_between_workers(store, tmp_path):
+    table = _table([1, 2], [1.0, 2.0])
+    token = store.register(1, table)
+
+    # Secondo worker: stessa cartella, nessuno stato in memoria
+    other = ResultVersionStore(tmp_path, per_report=2, max_bytes=1024 * 1024)
+    assert other.get(1, token).equals(table)
+    assert other.get(2, token) is None
+    assert other.get(1, "../../etc/passwd") is None
+
+
+def test_same_table_same_token(store):
+    table = _table([1], [1.0])
+    assert store.register(1, table) == store.register(1, table)
+    assert store.register(1, _table([1], [1.0])) != store.register(1, table)
+
+
+def test_per_report_limit(store):
+    tokens = [store.register(1, _table([i], [float(i)])) for i in range(3)]
+    assert store.get(1, tokens[0]) is None
+    assert store.get(1, tokens[2]) is not None
+    assert store.stats()["versions"] == 2
+
+
+def test_quota_keeps_latest_version(tmp_path):
+    store = ResultVersionStore(tmp_path, per_report=5, max_bytes=1)
+    first = store.register(1, _table([1], [1.0]))
+    latest = store.register(2, _table([2], [2.0]))
+    assert store.get(1, first) is None
+    assert store.get(2, latest) is not None
+
+
+def test_invalidate(store):
+    token = store.register(1, _table([1], [1.0]))
+    store.invalidate(1)
+    assert store.get(1, token) is None
+    assert store.stats()["versions"] == 0
@@ -0,0 +1,26 @@
+"""
+Snapshot Parquet degli esercizi chiusi (YearSnapshotStore)
+"""
+import pyarrow as pa
+import pytest
+
+from app.legacy_engine.snapshots import YearSnapshotStore
+
+
+def test_write_and_read_with_signature(tmp_path):
+    store = YearSnapshotStore(tmp_path)
+    table = pa.table({"Esercizio": [2022], "Totale": [10.5]})
+    store.write("vendite/fatturato.qry", "01", 2022, "abc", table)
+
+    assert store.read("vendite/fatturato.qry", "01", 2022, "abc").equals(table)
+    # SQL cambiato: snapshot obsoleto
+    assert store.read("vendite/fatturato.qry", "01", 2022, "def") is None
+
+
+@pytest.mark.parametrize("query_name", ["../fuori.qry", "a/../../fuori.qry", "..\\..\\fuori.qry", "/tmp/fuori.qry"])
+def test_query_name_outside_base_path_rejected(tmp_path, query_name):
+    store = YearSnapshotStore(tmp_path / "snapshots")
+    with pytest.raises(ValueError):
+        store.read(query_name, "01", 2022, "abc")
+    with pytest.raises(ValueError):
+        store.write(query_name, "01", 2022, "abc", pa.table({"x": [1]}))